@@ -0,0 +1,298 @@
+"""Reports over every movie, computed on a columnar snapshot
+
+The numeric columns of the movies are copied into NumPy arrays, one
+per column, with NULL as NaN and director_id as the grouping key.
+Histograms, percentiles, correlations and per director or per year
+totals then run as array operations instead of going through the ORM.
+
+The snapshot follows the catalog revision: a read finding it older than
+the last write rebuilds it, at most once every ANALYTICS_MAX_AGE
+seconds (0 rebuilds after every write). It is built on the first report
+of a worker, with the numpy package installed; without it the reports
+answer 501.
+"""
+import threading
+import time
+from flask import abort, current_app
+from sqlalchemy import Integer, case, cast, func
+from config import db
+from models import Directors, Movies
+from stats import FIELDS as TOTALS
+from versions import catalog_revision
+from bulk import find_in
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_MAX_AGE = 60
+
+# columns of the snapshot, release_year as read_years computes it
+COLUMNS = {
+    'director_id': Movies.director_id,
+    'budget': Movies.budget,
+    'revenue': Movies.revenue,
+    'popularity': Movies.popularity,
+    'vote_average': Movies.vote_average,
+    'vote_count': Movies.vote_count,
+    'release_year': case((func.length(Movies.release_date) >= 4,
+                          cast(func.substr(Movies.release_date, 1, 4),
+                               Integer))),
+}
+# columns clients can report on
+FIELDS = [name for name in COLUMNS if name != 'director_id']
+GROUP_FIELDS = [*list(TOTALS)[1:], 'roi']
+COUNTS = {'movie_count', 'budget_total', 'revenue_total', 'vote_count_total'}
+
+
+class Snapshot(object):
+    """Columns of every movie at a catalog revision, never modified"""
+
+    def __init__(self, columns, revision):
+        self.columns = columns
+        self.revision = revision
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def load(cls):
+        revision, _ = catalog_revision()
+        rows = db.session.execute(db.select(list(COLUMNS.values())))
+        # NULLs become NaN, so every column is float64. NumPy reads plain
+        # tuples about ten times faster than rows
+        data = np.array([tuple(row) for row in rows],
+                        dtype=np.float64).reshape(-1, len(COLUMNS))
+        return cls(dict(zip(COLUMNS, data.T.copy())), revision)
+
+    def __len__(self):
+        return len(self.columns['director_id'])
+
+    def values(self, field):
+        """Values of a column without the NULLs"""
+        column = self.columns[field]
+        return column[~np.isnan(column)]
+
+
+_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Snapshot of the current app, rebuilt when stale, see module docs
+
+    Returns:
+        Snapshot: columns of the movies
+    """
+    if np is None:
+        abort(501, "Analytics need the numpy package")
+    app = current_app._get_current_object()
+    snapshot = app.extensions.get('analytics')
+    if snapshot is not None:
+        max_age = app.config.get('ANALYTICS_MAX_AGE', DEFAULT_MAX_AGE)
+        if (time.monotonic() - snapshot.built_at < max_age
+                or catalog_revision()[0] == snapshot.revision):
+            return snapshot
+    with _lock:
+        if app.extensions.get('analytics') is snapshot:
+            app.extensions['analytics'] = Snapshot.load()
+        return app.extensions['analytics']
+
+
+def _check_field(field, fields=FIELDS):
+    if field not in fields:
+        abort(400, f"Unknown field: {field}, use one of: {', '.join(fields)}")
+
+
+def _number(value):
+    """JSON number of a NumPy scalar, None for NaN"""
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def totals(snapshot, keys):
+    """Totals of the movies of every key, as stats computes them in SQL
+
+    Args:
+        snapshot (Snapshot): columns of the movies
+        keys (ndarray): key of every movie, NaN to leave it out
+
+    Returns:
+        tuple: keys in ascending order, and dict of the totals of every
+            key by name of GROUP_FIELDS
+    """
+    kept = ~np.isnan(keys)
+    groups, index = np.unique(keys[kept], return_inverse=True)
+    columns = {
+        name: column[kept]
+        for name, column in snapshot.columns.items()
+    }
+
+    def total(values):
+        # SUM skips the NULLs, COALESCE(SUM, 0) gives 0 without values
+        return np.bincount(index,
+                           weights=np.nan_to_num(values),
+                           minlength=len(groups))
+
+    def known(values):
+        return np.bincount(index,
+                           weights=~np.isnan(values),
+                           minlength=len(groups))
+
+    def sql_total(values):
+        # SUM without COALESCE, NULL without values
+        return np.where(known(values) > 0, total(values), np.nan)
+
+    def ratio(numerator, denominator):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(denominator > 0, numerator / denominator, np.nan)
+
+    vote_average, vote_count = columns['vote_average'], columns['vote_count']
+    # ROI over the movies with both a budget and a revenue
+    both = (columns['budget'] > 0) & (columns['revenue'] > 0)
+    invested = total(np.where(both, columns['budget'], 0))
+    returned = total(np.where(both, columns['revenue'], 0))
+    return groups, {
+        'movie_count': np.bincount(index, minlength=len(groups)),
+        'budget_total': total(columns['budget']),
+        'revenue_total': total(columns['revenue']),
+        'vote_count_total': total(vote_count),
+        'vote_average_mean': ratio(total(vote_average), known(vote_average)),
+        'weighted_rating': ratio(sql_total(vote_average * vote_count),
+                                 total(vote_count)),
+        'roi': ratio(returned - invested, invested),
+    }
+
+
+def _rows(name, groups, values, order):
+    return [{
+        name: int(groups[i]),
+        **{
+            field: int(column[i]) if field in COUNTS else _number(column[i])
+            for field, column in values.items()
+        }
+    } for i in order]
+
+
+def histogram(field, bins=20):
+    """GET the histogram of a column of every movie
+
+    Args:
+        field (string): column, one of FIELDS
+        bins (int, optional): number of bins of equal width. Defaults to 20.
+
+    Returns:
+        dict: bin edges (bins + 1) and movie counts (bins), NULLs left out
+    """
+    _check_field(field)
+    values = get_snapshot().values(field)
+    if len(values) == 0:
+        return {'field': field, 'edges': [], 'counts': []}
+    counts, edges = np.histogram(values, bins=bins)
+    return {
+        'field': field,
+        'edges': edges.tolist(),
+        'counts': counts.tolist(),
+    }
+
+
+def percentiles(field, q=None):
+    """GET percentiles of a column of every movie
+
+    Interpolated linearly between the closest values, NULLs left out.
+
+    Args:
+        field (string): column, one of FIELDS
+        q (list, optional): percentiles between 0 and 100. Defaults to 25, 50, 75, 90 and 99.
+
+    Returns:
+        dict: value of every percentile, null without values
+    """
+    _check_field(field)
+    q = q or [25, 50, 75, 90, 99]
+    if any(not 0 <= p <= 100 for p in q):
+        abort(400, "Percentiles must be between 0 and 100")
+    values = get_snapshot().values(field)
+    result = (np.percentile(values, q).tolist()
+              if len(values) else [None] * len(q))
+    return {
+        'field': field,
+        'count': len(values),
+        'percentiles': [{
+            'q': p,
+            'value': value
+        } for p, value in zip(q, result)],
+    }
+
+
+def correlations(fields=None):
+    """GET the Pearson correlations between columns of every movie
+
+    Computed over the movies with none of the columns NULL.
+
+    Args:
+        fields (list, optional): columns, of FIELDS. Defaults to every field.
+
+    Returns:
+        dict: fields and matrix of correlations, null for a constant column
+    """
+    fields = fields or FIELDS
+    for field in fields:
+        _check_field(field)
+    if len(fields) < 2:
+        abort(400, "Correlations need at least 2 fields")
+    snapshot = get_snapshot()
+    data = np.vstack([snapshot.columns[field] for field in fields])
+    data = data[:, ~np.isnan(data).any(axis=0)]
+    if data.shape[1] < 2:
+        matrix = np.full((len(fields), len(fields)), np.nan)
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            matrix = np.corrcoef(data)
+    return {
+        'fields': fields,
+        'count': data.shape[1],
+        'matrix': [[_number(value) for value in row] for row in matrix],
+    }
+
+
+def read_directors(sort='-roi', limit=20, min_movies=1):
+    """GET the totals and return on investment of the directors
+
+    Args:
+        sort (str, optional): field of GROUP_FIELDS, '-' for desc. Defaults to '-roi'.
+        limit (int, optional): number of directors. Defaults to 20.
+        min_movies (int, optional): least movies of a director. Defaults to 1.
+
+    Returns:
+        list: totals of the first directors, NULLs last, then by id
+    """
+    descending = sort.startswith('-')
+    field = sort.lstrip('-')
+    _check_field(field, GROUP_FIELDS)
+    snapshot = get_snapshot()
+    groups, values = totals(snapshot, snapshot.columns['director_id'])
+
+    kept = np.flatnonzero(values['movie_count'] >= min_movies)
+    column = values[field][kept]
+    # NULLs last either way, ties by ascending director_id
+    order = kept[np.lexsort((groups[kept],
+                             -column if descending else column,
+                             np.isnan(column)))][:limit]
+
+    rows = _rows('director_id', groups, values, order)
+    names = dict(
+        find_in(db.session.query(Directors.id, Directors.name), Directors.id,
+                [row['director_id'] for row in rows]))
+    for row in rows:
+        row['name'] = names.get(row['director_id'])
+    return rows
+
+
+def read_years():
+    """GET the totals and return on investment of every release year
+
+    Returns:
+        list: totals of every year with movies, oldest first
+    """
+    snapshot = get_snapshot()
+    groups, values = totals(snapshot, snapshot.columns['release_year'])
+    return _rows('year', groups, values, range(len(groups)))
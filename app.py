@@ -1,8 +1,27 @@
+import os
 import config
+import compression
+import instrumentation
+import spec_cache
+from rankings import get_rankings
+from schema_check import check_schema
 
 connex_app = config.connex_app
 
-connex_app.add_api("swagger.yml")
+if config.settings['SPEC_CACHE']:
+    spec_cache.add_api(connex_app,
+                       os.path.join(config.basedir, 'swagger.yml'))
+else:
+    connex_app.add_api("swagger.yml")
+
+# after_request hooks run last registered first, so the compression
+# is part of the timings
+instrumentation.init_app(config.app)
+compression.init_app(config.app)
+
+with config.app.app_context():
+    check_schema()
+    get_rankings()
 
 connex_app = connex_app.app
 
@@ -0,0 +1,157 @@
+"""Compare the columnar analytics with the same reports in SQL and ORM
+
+Run from the repository root, on the shipped database or a synthetic
+catalog (see catalog.py):
+
+    python benchmarks/bench_analytics.py [iterations]
+    DATABASE_URL=sqlite:///fixtures/catalog_100k.db python benchmarks/bench_analytics.py
+
+Every report is computed three ways: on the NumPy snapshot of
+analytics.py, with one SQL aggregate, and by loading the movies through
+the ORM and MoviesSchema then computing in Python. The mean times are
+printed with the time to build the snapshot.
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('APP_ENV', 'test')
+
+from sqlalchemy import Integer, case, cast, func  # noqa: E402
+import config  # noqa: E402
+import analytics  # noqa: E402
+from app import connex_app  # noqa: E402
+from models import Movies, MoviesSchema  # noqa: E402
+
+db = config.db
+
+
+def sql_directors_roi():
+    both = (Movies.budget > 0) & (Movies.revenue > 0)
+    invested = func.sum(case((both, Movies.budget), else_=0))
+    returned = func.sum(case((both, Movies.revenue), else_=0))
+    roi = ((returned - invested) * 1.0 / func.nullif(invested, 0)).label('roi')
+    return db.session.execute(
+        db.select([Movies.director_id, func.count(Movies.id), roi]).where(
+            Movies.director_id.isnot(None)).group_by(
+                Movies.director_id).order_by(
+                    roi.is_(None), roi.desc(), Movies.director_id).limit(
+                        20)).fetchall()
+
+
+def sql_years():
+    year = cast(func.substr(Movies.release_date, 1, 4), Integer).label('year')
+    return db.session.execute(
+        db.select([year, func.count(Movies.id),
+                   func.sum(Movies.budget), func.avg(Movies.vote_average)
+                   ]).where(func.length(Movies.release_date) >= 4).group_by(
+                       year).order_by(year)).fetchall()
+
+
+def sql_histogram(bins=20):
+    low, high = db.session.execute(
+        db.select([func.min(Movies.budget), func.max(Movies.budget)])).one()
+    width = (high - low) / bins or 1
+    bucket = func.min(cast((Movies.budget - low) / width, Integer), bins - 1)
+    return db.session.execute(
+        db.select([bucket, func.count()]).where(
+            Movies.budget.isnot(None)).group_by(bucket)).fetchall()
+
+
+def sql_median():
+    count = db.session.query(func.count(Movies.vote_average)).scalar()
+    return db.session.query(Movies.vote_average).filter(
+        Movies.vote_average.isnot(None)).order_by(
+            Movies.vote_average).offset((count - 1) // 2).limit(1).scalar()
+
+
+def orm_movies():
+    movies = Movies.query.all()
+    # the schema leaves the foreign key out
+    return [
+        dict(data, director_id=movie.director_id)
+        for movie, data in zip(
+            movies,
+            MoviesSchema(many=True, exclude=('directors', )).dump(movies))
+    ]
+
+
+def orm_directors_roi():
+    totals = {}
+    for movie in orm_movies():
+        if movie['budget'] and movie['revenue']:
+            invested, returned = totals.get(movie['director_id'], (0, 0))
+            totals[movie['director_id']] = (invested + movie['budget'],
+                                            returned + movie['revenue'])
+    return sorted(((returned - invested) / invested, director_id)
+                  for director_id, (invested, returned) in totals.items()
+                  if invested)[-20:]
+
+
+def orm_years():
+    years = {}
+    for movie in orm_movies():
+        if movie['release_date']:
+            years.setdefault(movie['release_date'][:4], []).append(movie)
+    return {
+        year: (len(movies), sum(m['budget'] or 0 for m in movies))
+        for year, movies in sorted(years.items())
+    }
+
+
+def orm_histogram(bins=20):
+    values = [m['budget'] for m in orm_movies() if m['budget'] is not None]
+    low, high = min(values), max(values)
+    width = (high - low) / bins or 1
+    counts = [0] * bins
+    for value in values:
+        counts[min(int((value - low) / width), bins - 1)] += 1
+    return counts
+
+
+def orm_median():
+    return statistics.median(m['vote_average'] for m in orm_movies()
+                             if m['vote_average'] is not None)
+
+
+REPORTS = [
+    ('directors roi', lambda: analytics.read_directors(), sql_directors_roi,
+     orm_directors_roi),
+    ('years', analytics.read_years, sql_years, orm_years),
+    ('histogram', lambda: analytics.histogram('budget'), sql_histogram,
+     orm_histogram),
+    ('median', lambda: analytics.percentiles('vote_average', [50]),
+     sql_median, orm_median),
+]
+
+
+def timed(function, iterations):
+    function()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main(iterations=10):
+    connex_app.config['ANALYTICS_MAX_AGE'] = 3600
+    with connex_app.test_request_context():
+        start = time.perf_counter()
+        snapshot = analytics.get_snapshot()
+        print(f'snapshot of {len(snapshot)} movies built in '
+              f'{time.perf_counter() - start:.3f} s')
+        print(f"{'report':<16}{'numpy ms':>10}{'sql ms':>10}{'orm ms':>10}")
+        for name, *functions in REPORTS:
+            # the ORM path loads every movie, run it less often
+            times = [
+                timed(function, max(1, iterations // (5 if i == 2 else 1)))
+                for i, function in enumerate(functions)
+            ]
+            print(f'{name:<16}' + ''.join(f'{ms:>10.2f}' for ms in times))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
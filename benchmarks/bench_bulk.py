@@ -0,0 +1,76 @@
+"""Compare rows/s of single-item and bulk creates
+
+Runs against a throwaway copy of final_proj.db:
+
+    python benchmarks/bench_bulk.py [rows]
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config  # noqa: E402
+
+HEADERS = {'Content-Type': 'application/json'}
+DIRECTOR_ID = 4768
+
+
+def movie(uid):
+    return {
+        'title': f'Benchmark {uid}',
+        'original_title': f'Benchmark {uid}',
+        'overview': 'A movie written by the bulk benchmark.',
+        'tagline': 'Fast.',
+        'budget': 1000,
+        'revenue': 2000,
+        'popularity': 5,
+        'release_date': '2020-01-01',
+        'vote_average': 6.5,
+        'vote_count': 10,
+        'uid': uid,
+    }
+
+
+def main(rows=1000):
+    workdir = tempfile.mkdtemp()
+    database = os.path.join(workdir, 'bench.db')
+    shutil.copy(os.path.join(ROOT, 'final_proj.db'), database)
+    config.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + database
+    config.app.config['SQLALCHEMY_ECHO'] = False
+    config.connex_app.add_api('swagger.yml')
+    client = config.app.test_client()
+
+    try:
+        start = time.perf_counter()
+        for uid in range(10**8, 10**8 + rows):
+            res = client.post(f'/api/movie/{DIRECTOR_ID}/movie',
+                              data=json.dumps(movie(uid)),
+                              headers=HEADERS)
+            assert res.status_code == 201
+        single = time.perf_counter() - start
+
+        body = [
+            dict(movie(uid), director_id=DIRECTOR_ID)
+            for uid in range(2 * 10**8, 2 * 10**8 + rows)
+        ]
+        start = time.perf_counter()
+        res = client.post('/api/movie/bulk',
+                          data=json.dumps(body),
+                          headers=HEADERS)
+        bulk = time.perf_counter() - start
+        assert res.status_code == 201
+    finally:
+        shutil.rmtree(workdir)
+
+    print(f'{rows} movies')
+    print(f'single POST: {single:8.2f} s {rows / single:10.0f} rows/s')
+    print(f'bulk POST:   {bulk:8.2f} s {rows / bulk:10.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,68 @@
+"""Compare the connexion JSON encoding with compact JSON and compression
+
+Run from the repository root:
+
+    python benchmarks/bench_encoding.py [iterations]
+
+For the largest responses of the API it prints the bytes on the wire
+with the connexion default (indent=2, sorted keys), compact JSON, gzip
+and brotli (when installed), and the time to encode and compress them.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('APP_ENV', 'test')
+
+from flask import json  # noqa: E402
+from connexion.jsonifier import Jsonifier  # noqa: E402
+import config  # noqa: E402
+import fastjson  # noqa: E402
+from app import connex_app  # noqa: E402
+from compression import available_encodings, compress  # noqa: E402
+
+ENDPOINTS = [
+    '/api/director?limit=100',
+    '/api/director?page_size=100',
+    '/api/movie?limit=500',
+    '/api/movie/search?title=love&limit=100',
+    '/api/director/4768',
+]
+
+
+def timed(function, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = function()
+    return result, (time.perf_counter() - start) / iterations * 1000
+
+
+def main(iterations=20):
+    client = connex_app.test_client()
+    default = Jsonifier(json, indent=2)
+    compact = Jsonifier(fastjson)
+    encodings = available_encodings()
+    print(f"{'endpoint':<40}{'default B':>11}{'compact B':>11}"
+          + ''.join(f'{e + " B":>10}' for e in encodings)
+          + f"{'default ms':>12}{'compact ms':>12}"
+          + ''.join(f'{e + " ms":>9}' for e in encodings))
+    with config.app.app_context():
+        for url in ENDPOINTS:
+            data = json.loads(client.get(url).get_data())
+            before, default_ms = timed(lambda: default.dumps(data), iterations)
+            after, compact_ms = timed(lambda: compact.dumps(data), iterations)
+            body = after.encode()
+            compressed = [
+                timed(lambda: compress(body, encoding), iterations)
+                for encoding in encodings
+            ]
+            print(f'{url:<40}{len(before.encode()):>11}{len(body):>11}' +
+                  ''.join(f'{len(c):>10}' for c, _ in compressed) +
+                  f'{default_ms:>12.2f}{compact_ms:>12.2f}' +
+                  ''.join(f'{ms:>9.2f}' for _, ms in compressed))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
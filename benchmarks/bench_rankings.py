@@ -0,0 +1,66 @@
+"""Compare the top movies endpoints with the matching sorted lists
+
+Run from the repository root, on the shipped database or a synthetic
+catalog (see catalog.py):
+
+    python benchmarks/bench_rankings.py [iterations]
+    DATABASE_URL=sqlite:///fixtures/catalog_100k.db python benchmarks/bench_rankings.py
+
+For a few limits it prints the mean time of /api/movie/top, served from
+the in-memory rankings, and of /api/movie?sort=-popularity, which sorts
+in SQL, along with the time the rankings took to build at startup.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('APP_ENV', 'test')
+
+import config  # noqa: E402
+from app import connex_app  # noqa: E402
+from models import Movies  # noqa: E402
+from rankings import get_rankings  # noqa: E402
+
+CASES = [
+    ('top', '/api/movie/top?by={by}&limit={limit}'),
+    ('sort', '/api/movie?sort=-{by}&limit={limit}'),
+    ('director top', '/api/director/{director_id}/movie/top?by={by}'
+     '&limit={limit}'),
+    ('director sort', '/api/movie?sort=-{by}&filter=director_id={director_id}'
+     '&limit={limit}'),
+]
+
+
+def timed(client, url, iterations):
+    assert client.get(url).status_code == 200
+    start = time.perf_counter()
+    for _ in range(iterations):
+        client.get(url)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main(iterations=50):
+    client = connex_app.test_client()
+    with config.app.app_context():
+        start = time.perf_counter()
+        get_rankings().build()
+        print(f'rankings built in {time.perf_counter() - start:.3f} s')
+        # the director with the most movies
+        director_id = config.db.session.query(Movies.director_id).group_by(
+            Movies.director_id).order_by(
+                config.db.func.count().desc()).limit(1).scalar()
+        print(f"{'case':<16}{'by':<14}{'limit':>6}{'ms':>10}")
+        for by in ('popularity', 'vote_average'):
+            for limit in (10, 100):
+                for name, url in CASES:
+                    ms = timed(
+                        client,
+                        url.format(by=by, limit=limit,
+                                   director_id=director_id), iterations)
+                    print(f'{name:<16}{by:<14}{limit:>6}{ms:>10.2f}')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
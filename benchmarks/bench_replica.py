@@ -0,0 +1,82 @@
+"""Compare the read throughput of the primary and of the read replicas
+
+Run from the repository root:
+
+    python benchmarks/bench_replica.py [requests] [max workers]
+
+Every worker is a process of its own, like a gunicorn worker, sending
+requests to the read endpoints in process. The reads go to the primary,
+to the same file opened read-only, then to an immutable snapshot, with
+1, 2, 4 ... workers; req/s is the total of the workers.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import sys, time
+from app import connex_app
+client = connex_app.test_client()
+# every worker starts at the same time, after its import
+time.sleep(max(0, float(sys.argv[2]) - time.time()))
+urls = ['/api/director?limit=50', '/api/movie/search?title=love&limit=20',
+        '/api/director/search?name=john&limit=20']
+for i in range(int(sys.argv[1])):
+    url = urls[i % 3]
+    # read_one misses the response cache with distinct ids
+    if i % 4 == 3:
+        url = f'/api/director/{4000 + i % 700}'
+    client.get(url)
+print(time.time())
+'''
+
+
+def run(environ, requests, workers, delay=10):
+    start = time.time() + delay
+    processes = [
+        subprocess.Popen([sys.executable, '-c', PROBE,
+                          str(requests), str(start)],
+                         cwd=ROOT, env=environ, stdout=subprocess.PIPE,
+                         text=True) for _ in range(workers)
+    ]
+    ends = [float(process.communicate()[0].split()[-1])
+            for process in processes]
+    return max(ends) - start
+
+
+def main(requests=500, max_workers=4):
+    workdir = tempfile.mkdtemp()
+    try:
+        database = os.path.join(workdir, 'primary.db')
+        shutil.copy(os.path.join(ROOT, 'final_proj.db'), database)
+        environ = dict(os.environ, APP_ENV='test',
+                       DATABASE_URL='sqlite:///' + database)
+        snapshot = os.path.join(workdir, 'snapshot.db')
+        subprocess.run([sys.executable, 'replicas.py', snapshot], cwd=ROOT,
+                       env=environ, check=True, capture_output=True)
+        modes = [
+            ('primary', {}),
+            ('read-only file', {'READ_REPLICA_URL': 'sqlite:///' + database}),
+            ('immutable snapshot', {'READ_REPLICA_URL': 'sqlite:///' + snapshot,
+                                    'READ_REPLICA_IMMUTABLE': '1'}),
+        ]
+        print(f"{'mode':<22}{'workers':>8}{'req/s':>10}")
+        for mode, overrides in modes:
+            env = dict(environ, **overrides)
+            workers = 1
+            while workers <= max_workers:
+                elapsed = run(env, requests, workers)
+                print(f"{mode:<22}{workers:>8}"
+                      f"{requests * workers / elapsed:>10.0f}")
+                workers *= 2
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,61 @@
+"""Compare the LIKE search with the full text index
+
+Run from the repository root:
+
+    python benchmarks/bench_search.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from models import Directors, Movies  # noqa: E402
+from search import full_text_backend, search, terms  # noqa: E402
+
+MOVIE_TERMS = ['man', 'star wars', 'love', 'the dark', 'zombie', 'xyzzy']
+DIRECTOR_TERMS = ['james', 'nolan', 'steven spiel', 'xyzzy']
+
+
+def like_movies(term):
+    return Movies.query.filter(Movies.title.like(f'%{term}%')).all()
+
+
+def fts_movies(term):
+    return search(Movies.query, Movies, terms(term)).all()
+
+
+def like_directors(term):
+    return Directors.query.filter(Directors.name.like(f'%{term}%')).all()
+
+
+def fts_directors(term):
+    return search(Directors.query, Directors, terms(term)).all()
+
+
+def timed(function, term, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        rows = function(term)
+    return (time.perf_counter() - start) / iterations * 1000, len(rows)
+
+
+def main(iterations=50):
+    config.app.config['SQLALCHEMY_ECHO'] = False
+    with config.app.app_context():
+        print(f'full text backend: {full_text_backend()}')
+        print(f"{'term':<16}{'like ms':>10}{'rows':>7}{'fts ms':>10}"
+              f"{'rows':>7}")
+        for like, fts, words in [(like_movies, fts_movies, MOVIE_TERMS),
+                                 (like_directors, fts_directors,
+                                  DIRECTOR_TERMS)]:
+            for term in words:
+                like_ms, like_rows = timed(like, term, iterations)
+                fts_ms, fts_rows = timed(fts, term, iterations)
+                print(f'{term:<16}{like_ms:>10.2f}{like_rows:>7}'
+                      f'{fts_ms:>10.2f}{fts_rows:>7}')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
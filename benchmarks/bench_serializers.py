@@ -0,0 +1,47 @@
+"""Compare marshmallow schemas with the compiled serializers
+
+Run from the repository root:
+
+    python benchmarks/bench_serializers.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from loaders import directors_query, movies_query  # noqa: E402
+from models import DirectorsSchema, MoviesSchema  # noqa: E402
+from serializers import serializer  # noqa: E402
+
+
+def timed(function, rows, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function(rows)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main(iterations=5):
+    config.app.config['SQLALCHEMY_ECHO'] = False
+    with config.app.app_context():
+        print(f"{'payload':<24}{'rows':>7}{'schema ms':>12}"
+              f"{'compiled ms':>14}{'speedup':>9}")
+        for name, schema_class, query in [
+            ('directors with movies', DirectorsSchema, directors_query()),
+            ('movies with director', MoviesSchema, movies_query()),
+        ]:
+            rows = query.all()
+            # a new schema per call, like the handlers used to build
+            schema_ms = timed(
+                lambda rows: schema_class(many=True).dump(rows), rows,
+                iterations)
+            compiled_ms = timed(serializer(schema_class, many=True), rows,
+                                iterations)
+            print(f'{name:<24}{len(rows):>7}{schema_ms:>12.2f}'
+                  f'{compiled_ms:>14.2f}{schema_ms / compiled_ms:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
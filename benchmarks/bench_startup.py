@@ -0,0 +1,72 @@
+"""Measure the cold start of the app, with and without the spec cache
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py [runs]
+
+Every run is a new interpreter importing app.py, like a gunicorn worker
+without preload_app, then sending its first request. The median of the
+runs is printed for the interpreter start, the import of app.py (which
+adds the API and checks the schema) and the first request.
+"""
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, time
+start = time.perf_counter()
+from app import connex_app
+imported = time.perf_counter()
+response = connex_app.test_client().get('/api/director?limit=20')
+assert response.status_code == 200
+print(json.dumps({'import': imported - start,
+                  'first_request': time.perf_counter() - imported}))
+'''
+
+
+def run(environ):
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT,
+                         env=environ, check=True, capture_output=True,
+                         text=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    result['process'] = time.perf_counter() - started
+    return result
+
+
+def main(runs=5):
+    workdir = tempfile.mkdtemp()
+    try:
+        database = os.path.join(workdir, 'startup.db')
+        shutil.copy(os.path.join(ROOT, 'final_proj.db'), database)
+        environ = dict(os.environ, APP_ENV='test',
+                       DATABASE_URL='sqlite:///' + database)
+        print(f"{'mode':<22}{'process s':>11}{'import s':>10}"
+              f"{'first request ms':>18}")
+        for mode, overrides in [('no spec cache', {'SPEC_CACHE': '0'}),
+                                ('spec cache', {'SPEC_CACHE': '1'})]:
+            env = dict(environ, **overrides)
+            # fill the cache, the runs measure warm starts
+            run(env)
+            results = [run(env) for _ in range(runs)]
+            median = {
+                key: statistics.median(r[key] for r in results)
+                for key in ('process', 'import', 'first_request')
+            }
+            print(f"{mode:<22}{median['process']:>11.3f}"
+                  f"{median['import']:>10.3f}"
+                  f"{median['first_request'] * 1000:>18.1f}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,394 @@
+"""Replay request traces against the API and check for regressions
+
+A trace is a JSONL file, one request per line:
+
+    {"name": "read_all", "method": "GET", "path": "/api/movie",
+     "query": {"limit": 50}}
+    {"name": "create", "method": "POST", "path": "/api/movie/4768/movie",
+     "body": {...}}
+
+name groups the requests of the report and defaults to the path.
+Replay a trace, or a seeded synthetic mix, in process on a throwaway
+copy of final_proj.db, or against a live server with --url:
+
+    python benchmarks/harness.py run --trace benchmarks/traces/mixed.jsonl
+    python benchmarks/harness.py run --mix read_all=5,search=2 --requests 500
+    python benchmarks/harness.py run --url http://127.0.0.1:8000 --save-baseline base.json
+    python benchmarks/harness.py run --baseline benchmarks/baseline.json
+    python benchmarks/harness.py run --database fixtures/catalog_100k.db
+
+The report gives p50/p95/p99, req/s and, in process, SQL queries per
+request. With --baseline the run fails (exit status 1) when the p95 of
+a group grows by more than --tolerance or it sends more queries.
+"""
+import http.client
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode, urlsplit
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HEADERS = {'Content-Type': 'application/json'}
+# directors with movies in final_proj.db, the synthetic mix reads them
+DIRECTOR_IDS = [4762, 4763, 4764, 4765, 4766, 4767, 4768, 4769, 4770]
+SEARCH_TERMS = ['love', 'man', 'star', 'the dark', 'night', 'war', 'james']
+DEFAULT_MIX = 'read_all=40,search=20,read_one=30,create=10'
+
+
+def _read_all(rng, director_ids):
+    path = rng.choice(['/api/director', '/api/movie'])
+    query = rng.choice([{
+        'limit': rng.choice([10, 50, 100])
+    }, {
+        'page_size': 100
+    }, {
+        'sort': '-popularity,title',
+        'page_size': 50
+    } if path == '/api/movie' else {
+        'sort': 'department,-name',
+        'page_size': 50
+    }])
+    return {'method': 'GET', 'path': path, 'query': query}
+
+
+def _search(rng, director_ids):
+    if rng.random() < 0.5:
+        return {
+            'method': 'GET',
+            'path': '/api/movie/search',
+            'query': {'title': rng.choice(SEARCH_TERMS), 'limit': 20}
+        }
+    return {
+        'method': 'GET',
+        'path': '/api/director/search',
+        'query': {'name': rng.choice(SEARCH_TERMS), 'limit': 20}
+    }
+
+
+def _read_one(rng, director_ids):
+    return {
+        'method': 'GET',
+        'path': f'/api/director/{rng.choice(director_ids)}'
+    }
+
+
+def _create(rng, director_ids):
+    uid = rng.randrange(10**9, 2 * 10**9)
+    return {
+        'method': 'POST',
+        'path': f'/api/movie/{rng.choice(director_ids)}/movie',
+        'body': {
+            'title': f'Replay {uid}',
+            'original_title': f'Replay {uid}',
+            'overview': 'A movie written by the benchmark harness.',
+            'tagline': 'Replayed.',
+            'budget': rng.randrange(10**5, 10**8),
+            'revenue': rng.randrange(10**5, 10**9),
+            'popularity': rng.randrange(1, 200),
+            'release_date': f'{rng.randrange(1950, 2020)}-01-01',
+            'vote_average': round(rng.uniform(1, 9), 1),
+            'vote_count': rng.randrange(0, 5000),
+            'uid': uid,
+        }
+    }
+
+
+MIX = {
+    'read_all': _read_all,
+    'search': _search,
+    'read_one': _read_one,
+    'create': _create,
+}
+
+
+def parse_mix(mix):
+    """Parse weights like 'read_all=40,search=20'
+
+    Returns:
+        dict: weight of every kind of request
+    """
+    weights = {}
+    for part in filter(None, mix.split(',')):
+        name, _, weight = part.partition('=')
+        if name not in MIX:
+            raise click.BadParameter(
+                f"Unknown request kind: {name}, use one of: "
+                f"{', '.join(MIX)}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+def synthetic_trace(mix, requests, seed=0, director_ids=DIRECTOR_IDS):
+    """Seeded list of requests drawn from a mix"""
+    rng = random.Random(seed)
+    names = list(mix)
+    entries = []
+    for name in rng.choices(names, [mix[n] for n in names], k=requests):
+        entries.append(dict(MIX[name](rng, director_ids), name=name))
+    return entries
+
+
+def busiest_directors(database, count=len(DIRECTOR_IDS)):
+    """Ids of the directors with the most movies in a SQLite file"""
+    connection = sqlite3.connect(database)
+    try:
+        return [
+            director_id for director_id, in connection.execute(
+                'SELECT director_id FROM director_stats '
+                'ORDER BY movie_count DESC, director_id LIMIT ?', (count, ))
+        ]
+    finally:
+        connection.close()
+
+
+def read_trace(path):
+    with open(path) as source:
+        return [json.loads(line) for line in source if line.strip()]
+
+
+def _url(entry):
+    query = entry.get('query')
+    return entry['path'] + ('?' + urlencode(query, doseq=True)
+                            if query else '')
+
+
+class InProcess:
+    """Flask test client on a throwaway copy of a SQLite database"""
+
+    def __init__(self, source=os.path.join(ROOT, 'final_proj.db')):
+        self.workdir = tempfile.mkdtemp()
+        database = os.path.join(self.workdir, 'harness.db')
+        shutil.copy(source, database)
+        os.environ.setdefault('APP_ENV', 'test')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + database
+
+        from sqlalchemy import event
+        import config
+        from app import connex_app
+
+        self.client = connex_app.test_client()
+        self.queries = 0
+        with config.app.app_context():
+            engine = config.db.engine
+
+        def count(conn, cursor, statement, *args):
+            self.queries += 1
+
+        event.listen(engine, 'before_cursor_execute', count)
+
+    def send(self, entry):
+        """Send one request
+
+        Returns:
+            tuple: status code and number of SQL statements it ran
+        """
+        before = self.queries
+        response = self.client.open(_url(entry),
+                                    method=entry.get('method', 'GET'),
+                                    data=json.dumps(entry['body'])
+                                    if 'body' in entry else None,
+                                    headers=HEADERS)
+        response.get_data()
+        return response.status_code, self.queries - before
+
+    def close(self):
+        shutil.rmtree(self.workdir)
+
+
+class Live:
+    """HTTP client of a running server, like gunicorn from the Procfile"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname,
+                                                     parts.port or 80)
+        self.prefix = parts.path.rstrip('/')
+
+    def send(self, entry):
+        body = json.dumps(entry['body']) if 'body' in entry else None
+        self.connection.request(entry.get('method', 'GET'),
+                                self.prefix + _url(entry),
+                                body=body,
+                                headers=HEADERS)
+        response = self.connection.getresponse()
+        response.read()
+        return response.status, None
+
+    def close(self):
+        self.connection.close()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(latencies, queries, elapsed=None):
+    summary = {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries': (round(sum(queries) / len(queries), 2)
+                    if None not in queries else None),
+    }
+    if elapsed:
+        summary['req_per_s'] = round(len(latencies) / elapsed, 1)
+    return summary
+
+
+def fresh_uids(entries):
+    """Entries with a uid of this run in every body holding a uid
+
+    uids are unique, so replaying the creates of a trace with its own
+    uids would get 409s from the second run on.
+
+    Returns:
+        list: entries, copied when their uid changed
+    """
+    bodies = [
+        i for i, entry in enumerate(entries) if 'uid' in entry.get('body', {})
+    ]
+    uids = random.sample(range(10**9, 2 * 10**9), len(bodies))
+    entries = list(entries)
+    for i, uid in zip(bodies, uids):
+        entries[i] = dict(entries[i], body=dict(entries[i]['body'], uid=uid))
+    return entries
+
+
+def replay(target, entries, warmup=20):
+    """Send every entry in order and time it
+
+    Returns:
+        dict: summary of every group and of the whole run under 'total'
+    """
+    entries = fresh_uids(entries)
+    # reads only, a replayed create would conflict with itself
+    reads = [entry for entry in entries if entry.get('method', 'GET') == 'GET']
+    for entry in reads[:warmup]:
+        target.send(entry)
+
+    groups = {}
+    errors = []
+    start = time.perf_counter()
+    for entry in entries:
+        sent = time.perf_counter()
+        status, queries = target.send(entry)
+        latency = time.perf_counter() - sent
+        if status >= 400:
+            errors.append(f"{status} {entry.get('method', 'GET')} "
+                          f"{_url(entry)}")
+        group = groups.setdefault(entry.get('name', entry['path']),
+                                  ([], []))
+        group[0].append(latency)
+        group[1].append(queries)
+    elapsed = time.perf_counter() - start
+
+    report = {name: summarize(*group) for name, group in sorted(groups.items())}
+    report['total'] = summarize(
+        [latency for latencies, _ in groups.values()
+         for latency in latencies],
+        [q for _, queries in groups.values() for q in queries], elapsed)
+    return report, errors
+
+
+def regressions(report, baseline, tolerance):
+    """Groups slower or sending more queries than the baseline
+
+    Returns:
+        list: one message per regression
+    """
+    found = []
+    for name, old in baseline.items():
+        new = report.get(name)
+        if new is None:
+            continue
+        if new['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            found.append(f"{name}: p95 {new['p95_ms']} ms, baseline "
+                         f"{old['p95_ms']} ms")
+        if None not in (new['queries'], old['queries']) and \
+                new['queries'] > old['queries']:
+            found.append(f"{name}: {new['queries']} queries per request, "
+                         f"baseline {old['queries']}")
+    return found
+
+
+def print_report(report):
+    click.echo(f"{'group':<24}{'requests':>9}{'p50 ms':>9}{'p95 ms':>9}"
+               f"{'p99 ms':>9}{'queries':>9}")
+    for name, summary in report.items():
+        queries = summary['queries']
+        click.echo(f"{name:<24}{summary['requests']:>9}"
+                   f"{summary['p50_ms']:>9.2f}{summary['p95_ms']:>9.2f}"
+                   f"{summary['p99_ms']:>9.2f}"
+                   f"{'-' if queries is None else queries:>9}")
+    click.echo(f"{report['total']['req_per_s']} req/s")
+
+
+@click.group()
+def cli():
+    """Benchmark the API with recorded or synthetic requests"""
+
+
+@cli.command('run')
+@click.option('--trace', type=click.Path(exists=True, dir_okay=False),
+              help='JSONL trace to replay instead of a synthetic mix.')
+@click.option('--mix', default=DEFAULT_MIX, show_default=True,
+              help='Weights of the synthetic request kinds.')
+@click.option('--requests', default=1000, show_default=True,
+              help='Number of synthetic requests.')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--url', help='Live server to replay against, like '
+              'http://127.0.0.1:8000. Defaults to in process.')
+@click.option('--database', type=click.Path(exists=True, dir_okay=False),
+              help='SQLite file to copy for in process runs, like a fixture '
+              'of catalog.py generate. Defaults to final_proj.db.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False),
+              help='Report to compare with, fails on regressions.')
+@click.option('--tolerance', default=0.2, show_default=True,
+              help='Allowed relative growth of the p95 latency.')
+@click.option('--save-baseline', type=click.Path(dir_okay=False),
+              help='Write the report to this file.')
+def run_command(trace, mix, requests, seed, url, database, baseline,
+                tolerance, save_baseline):
+    """Replay a trace or a synthetic mix and report latencies"""
+    director_ids = busiest_directors(database) if database else DIRECTOR_IDS
+    entries = (read_trace(trace) if trace else synthetic_trace(
+        parse_mix(mix), requests, seed, director_ids))
+    if url:
+        target = Live(url)
+    else:
+        target = InProcess(database) if database else InProcess()
+    try:
+        report, errors = replay(target, entries)
+    finally:
+        target.close()
+
+    print_report(report)
+    for error in errors[:10]:
+        click.echo(f'error: {error}', err=True)
+    if save_baseline:
+        with open(save_baseline, 'w') as out:
+            json.dump(report, out, indent=2, sort_keys=True)
+
+    if baseline:
+        with open(baseline) as source:
+            found = regressions(report, json.load(source), tolerance)
+        for message in found:
+            click.echo(f'regression: {message}', err=True)
+        if found:
+            sys.exit(1)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,76 @@
+from marshmallow import ValidationError
+
+IN_CHUNK_SIZE = 5000
+
+
+def chunked(values, size=IN_CHUNK_SIZE):
+    """Split values in lists short enough for one IN clause
+
+    Args:
+        values (iterable): values to split
+        size (int, optional): maximum length of a list. Defaults to IN_CHUNK_SIZE.
+
+    Returns:
+        generator: lists of values
+    """
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def find_in(query, column, values):
+    """Run a query once per chunk of values with column IN values
+
+    Args:
+        query (Query): query to filter
+        column (Column): column compared to the values
+        values (iterable): values to look for
+
+    Returns:
+        list: rows of the query
+    """
+    rows = []
+    for chunk in chunked(set(values)):
+        rows.extend(query.filter(column.in_(chunk)))
+    return rows
+
+
+def load_items(schema, items, partial=False):
+    """Validate and deserialize a whole array with one schema.load call
+
+    Args:
+        schema (Schema): schema created with many=True and load_instance=False
+        items (list): objects sent by the client
+        partial (bool, optional): allow missing required fields. Defaults to False.
+
+    Returns:
+        tuple: dict of loaded objects and dict of errors, both by index
+    """
+    try:
+        return dict(enumerate(schema.load(items, partial=partial))), {}
+    except ValidationError as err:
+        errors = err.messages
+        return {
+            i: data
+            for i, data in enumerate(err.valid_data) if i not in errors
+        }, errors
+
+
+def item_result(index, status, **fields):
+    return dict(index=index, status=status, **fields)
+
+
+def multi_status(results, success):
+    """Body and status code of a bulk request
+
+    Args:
+        results (dict): result of every item by index
+        success (int): status code when every item succeeded
+
+    Returns:
+        tuple: list of results in request order and status code, 207 when
+            some items failed
+    """
+    ordered = [results[i] for i in sorted(results)]
+    failed = any(result['status'] >= 400 for result in ordered)
+    return ordered, 207 if failed else success
@@ -0,0 +1,176 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+import fastjson
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_TTL = 300
+
+
+class ResponseCache:
+    """Bounded LRU cache of serialized responses with a time to live
+
+    Every entry is tagged with the director it depends on so writes can
+    evict exactly the entries they make stale. The cache lives in one
+    process, so with several workers an entry may outlive a write made
+    by another worker for at most ttl seconds.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get a cached value
+
+        Args:
+            key (tuple): key of the entry
+
+        Returns:
+            object: cached value or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, tag):
+        """Cache a value, evicting the least recently used entries
+
+        Args:
+            key (tuple): key of the entry
+            value (object): JSON serializable value
+            tag (int): id of the director the value depends on
+        """
+        size = len(fastjson.dumps(value))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, size,
+                                  tag)
+            self._tags.setdefault(tag, set()).add(key)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def evict(self, *keys):
+        """Evict entries
+
+        Args:
+            keys (tuple): keys of the entries
+        """
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+
+    def invalidate(self, tag):
+        """Evict every entry depending on a director
+
+        Args:
+            tag (int): id of the director
+        """
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.size = 0
+
+    def stats(self):
+        """Counters of the cache
+
+        Returns:
+            dict: hits, misses, evictions, entries, size and max_bytes
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'size': self.size,
+            'max_bytes': self.max_bytes,
+        }
+
+    def _remove(self, key):
+        value, expires, size, tag = self._entries.pop(key)
+        self.size -= size
+        keys = self._tags[tag]
+        keys.discard(key)
+        if not keys:
+            del self._tags[tag]
+
+
+def get_cache():
+    """Cache of the current app, sized by CACHE_MAX_BYTES and CACHE_TTL
+
+    Returns:
+        ResponseCache: response cache
+    """
+    app = current_app._get_current_object()
+    cache = app.extensions.get('response_cache')
+    if cache is None:
+        cache = app.extensions['response_cache'] = ResponseCache(
+            app.config.get('CACHE_MAX_BYTES', DEFAULT_MAX_BYTES),
+            app.config.get('CACHE_TTL', DEFAULT_TTL))
+    return cache
+
+
+def director_key(director_id):
+    return ('directors.read_one', director_id)
+
+
+def movie_key(director_id, movie_id):
+    return ('movies.read_one', director_id, movie_id)
+
+
+def invalidate_director(director_id):
+    """Evict the director and every movie of the director from the cache
+
+    Args:
+        director_id (int): id of the director
+    """
+    get_cache().invalidate(director_id)
+
+
+def invalidate_movie(director_id, movie_id=None):
+    """Evict a movie and the director listing it from the cache
+
+    Args:
+        director_id (int): id of the director of the movie
+        movie_id (int, optional): id of the movie, None for a new movie. Defaults to None.
+    """
+    keys = [director_key(director_id)]
+    if movie_id is not None:
+        keys.append(movie_key(director_id, movie_id))
+    get_cache().evict(*keys)
+
+
+def stats():
+    """GET counters of the response cache
+
+    Returns:
+        dict: hits, misses, evictions, entries, size and max_bytes
+    """
+    return get_cache().stats()
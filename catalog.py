@@ -0,0 +1,334 @@
+"""Offline import and export of the catalog
+
+    python catalog.py export movies movies.jsonl
+    python catalog.py import --replace directors directors.csv
+    python catalog.py generate --size 100k sqlite:///fixtures/catalog_100k.db
+
+The format is taken from the file extension (.csv, .jsonl or .parquet)
+unless --format is given. Rows are streamed chunk by chunk, so memory
+does not depend on the size of the catalog.
+"""
+import csv
+import json
+import os
+import time
+from contextlib import contextmanager
+import click
+from sqlalchemy import create_engine, event, func, select
+from config import app, db
+from models import Directors, Movies
+from stats import rebuild
+from search import create_index
+from versions import bump_revision
+from schema_check import stamp_head
+from synthetic import SIZES, generate
+
+TABLES = {
+    'directors': Directors.__table__,
+    'movies': Movies.__table__,
+}
+FORMATS = ('csv', 'jsonl', 'parquet')
+DEFAULT_CHUNK_SIZE = 5000
+# bookkeeping of the API, set by the database on import
+INTERNAL_COLUMNS = ('version', 'updated_at')
+
+
+def get_engine(database=None):
+    """Engine of the catalog database
+
+    Args:
+        database (string, optional): database url. Defaults to the url of config.py.
+
+    Returns:
+        Engine: SQLAlchemy engine
+    """
+    if database:
+        return create_engine(database)
+    with app.app_context():
+        return db.engine
+
+
+def file_format(path, format=None):
+    if format:
+        return format
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    if extension not in FORMATS:
+        raise click.UsageError(
+            f"Cannot guess the format of {path}, use --format")
+    return extension
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise click.UsageError("The parquet format needs pyarrow installed")
+    return pyarrow
+
+
+def catalog_columns(table):
+    return [
+        column for column in table.columns
+        if column.name not in INTERNAL_COLUMNS
+    ]
+
+
+def _converters(table):
+    return {
+        column.name: column.type.python_type
+        for column in catalog_columns(table)
+    }
+
+
+def read_chunks(path, format, table, chunk_size):
+    """Read a file as lists of row dicts
+
+    Args:
+        path (string): file to read
+        format (string): csv, jsonl or parquet
+        table (Table): table the rows belong to
+        chunk_size (int): rows per list
+
+    Returns:
+        generator: lists of at most chunk_size rows
+    """
+    if format == 'parquet':
+        parquet = _pyarrow().parquet.ParquetFile(path)
+        for batch in parquet.iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+        return
+
+    converters = _converters(table)
+    with open(path, newline='' if format == 'csv' else None) as source:
+        if format == 'csv':
+            rows = ({
+                key: converters[key](value) if value != '' else None
+                for key, value in row.items() if key in converters
+            } for row in csv.DictReader(source))
+        else:
+            rows = (json.loads(line) for line in source if line.strip())
+
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+class ChunkWriter:
+    """Write lists of row dicts to a csv, jsonl or parquet file"""
+
+    def __init__(self, path, format, table):
+        self.format = format
+        self.columns = [column.name for column in catalog_columns(table)]
+        if format == 'parquet':
+            self.pyarrow = _pyarrow()
+            self.writer = None
+            self.path = path
+        else:
+            self.file = open(path, 'w', newline='' if format == 'csv' else None)
+            if format == 'csv':
+                self.csv = csv.DictWriter(self.file, self.columns)
+                self.csv.writeheader()
+
+    def write(self, rows):
+        if self.format == 'csv':
+            self.csv.writerows(rows)
+        elif self.format == 'jsonl':
+            self.file.writelines(json.dumps(row) + '\n' for row in rows)
+        else:
+            batch = self.pyarrow.RecordBatch.from_pylist(rows)
+            if self.writer is None:
+                self.writer = self.pyarrow.parquet.ParquetWriter(
+                    self.path, batch.schema)
+            self.writer.write_batch(batch)
+
+    def close(self):
+        if self.format != 'parquet':
+            self.file.close()
+        elif self.writer is not None:
+            self.writer.close()
+
+
+@contextmanager
+def bulk_load_pragmas(engine):
+    """Relax SQLite durability on the connections used by a load
+
+    WAL lets readers keep working during the load and synchronous=NORMAL
+    only syncs at checkpoints instead of at every commit. The pool is
+    emptied before and after, so other connections keep the defaults
+    (journal_mode=WAL stays set on the file).
+    """
+    if engine.dialect.name != 'sqlite':
+        yield
+        return
+
+    def set_pragmas(connection, record):
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute('PRAGMA cache_size=-65536')
+        cursor.close()
+
+    engine.dispose()
+    event.listen(engine, 'connect', set_pragmas)
+    try:
+        yield
+    finally:
+        event.remove(engine, 'connect', set_pragmas)
+        engine.dispose()
+
+
+def import_rows(engine, table, chunks):
+    """Insert chunks of rows, each chunk in its own transaction
+
+    Args:
+        engine (Engine): database to load
+        table (Table): table to insert into
+        chunks (iterable): lists of row dicts
+
+    Returns:
+        int: number of rows inserted
+    """
+    columns = {column.name for column in catalog_columns(table)}
+    count = 0
+    with bulk_load_pragmas(engine):
+        for chunk in chunks:
+            rows = [{key: row.get(key)
+                     for key in columns} for row in chunk]
+            with engine.begin() as connection:
+                connection.execute(table.insert(), rows)
+            count += len(rows)
+    return count
+
+
+def export_rows(engine, table, chunk_size):
+    """Read a whole table with a server side cursor
+
+    Args:
+        engine (Engine): database to read
+        table (Table): table to export
+        chunk_size (int): rows fetched at a time
+
+    Returns:
+        generator: lists of at most chunk_size row dicts
+    """
+    with engine.connect() as connection:
+        result = connection.execution_options(
+            stream_results=True,
+            max_row_buffer=chunk_size).execute(
+                select(*catalog_columns(table)).order_by(table.c.id))
+        for partition in result.mappings().partitions(chunk_size):
+            yield [dict(row) for row in partition]
+
+
+@click.group()
+def cli():
+    """Import and export directors and movies"""
+
+
+@cli.command('import')
+@click.argument('table', type=click.Choice(list(TABLES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(FORMATS))
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True)
+@click.option('--replace',
+              is_flag=True,
+              help='Delete the rows of the table first (and the movies '
+              'of deleted directors).')
+@click.option('--database', help='Database url, defaults to config.py.')
+def import_command(table, path, format, chunk_size, replace, database):
+    """Load TABLE from the file at PATH"""
+    engine = get_engine(database)
+    start = time.perf_counter()
+    if replace:
+        with engine.begin() as connection:
+            if table == 'directors':
+                connection.execute(TABLES['movies'].delete())
+            connection.execute(TABLES[table].delete())
+    count = import_rows(
+        engine, TABLES[table],
+        read_chunks(path, file_format(path, format), TABLES[table],
+                    chunk_size))
+    # the director stats and the catalog revision are kept by the API
+    # handlers only, the search index by its triggers once it exists
+    with engine.begin() as connection:
+        rebuild(connection)
+        create_index(connection)
+        bump_revision(connection)
+    click.echo(f"imported {count} {table} in "
+               f"{time.perf_counter() - start:.2f}s")
+
+
+@cli.command('export')
+@click.argument('table', type=click.Choice(list(TABLES)))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', type=click.Choice(FORMATS))
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True)
+@click.option('--database', help='Database url, defaults to config.py.')
+def export_command(table, path, format, chunk_size, database):
+    """Write TABLE to the file at PATH"""
+    engine = get_engine(database)
+    start = time.perf_counter()
+    writer = ChunkWriter(path, file_format(path, format), TABLES[table])
+    count = 0
+    try:
+        for chunk in export_rows(engine, TABLES[table], chunk_size):
+            writer.write(chunk)
+            count += len(chunk)
+    finally:
+        writer.close()
+    click.echo(f"exported {count} {table} in "
+               f"{time.perf_counter() - start:.2f}s")
+
+
+@cli.command('generate')
+@click.argument('database')
+@click.option('--size', type=click.Choice(list(SIZES)), default='10k',
+              show_default=True, help='Number of movies.')
+@click.option('--movies', type=int, help='Exact number of movies, '
+              'overrides --size.')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True)
+def generate_command(database, size, movies, seed, chunk_size):
+    """Fill the empty DATABASE url with a synthetic catalog
+
+    The same seed and size always give the same catalog. Tests and
+    benchmarks can then run on it with DATABASE_URL.
+    """
+    engine = create_engine(database)
+    db.metadata.create_all(engine)
+    with engine.connect() as connection:
+        if connection.execute(select(
+                func.count()).select_from(TABLES['directors'])).scalar():
+            raise click.UsageError(f"{database} already holds directors")
+
+    start = time.perf_counter()
+    counts = {'directors': 0, 'movies': 0}
+    with bulk_load_pragmas(engine):
+        for directors, rows in generate(movies or SIZES[size], seed,
+                                        chunk_size):
+            with engine.begin() as connection:
+                connection.execute(TABLES['directors'].insert(), directors)
+                if rows:
+                    connection.execute(TABLES['movies'].insert(), rows)
+            counts['directors'] += len(directors)
+            counts['movies'] += len(rows)
+
+    with engine.begin() as connection:
+        rebuild(connection)
+        create_index(connection)
+        bump_revision(connection)
+        stamp_head(connection)
+    click.echo(f"generated {counts['directors']} directors and "
+               f"{counts['movies']} movies in "
+               f"{time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,86 @@
+"""Negotiated gzip and brotli compression of the responses
+
+A response is compressed when the client accepts it, its type is JSON
+or text and its body is at least COMPRESS_MIN_SIZE bytes; smaller
+bodies gain less than the header costs. Brotli is offered only with the
+brotli package installed. Streamed responses are sent as they are.
+
+The strong ETag of a compressed response is made weak, as nginx does:
+the bytes differ from the identity response but the content is the
+same, and If-None-Match compares weakly.
+"""
+import gzip
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_MIN_SIZE = 1024
+# level 4 halves the time of the default 6 on a list of 100 directors
+# for a 5% bigger body
+GZIP_LEVEL = 4
+BROTLI_QUALITY = 4
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/problem+json',
+                          'application/x-ndjson')
+
+
+def available_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress(data, encoding):
+    """Compress a body
+
+    Args:
+        data (bytes): body
+        encoding (string): br or gzip
+
+    Returns:
+        bytes: compressed body
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _compressible(response):
+    return (200 <= response.status_code < 300
+            and response.status_code != 204
+            and not response.direct_passthrough
+            and not response.is_streamed
+            and 'Content-Encoding' not in response.headers
+            and (response.mimetype in COMPRESSIBLE_MIMETYPES
+                 or response.mimetype.startswith('text/')))
+
+
+def _after_request(response):
+    if not current_app.config.get('COMPRESSION') or \
+            not _compressible(response):
+        return response
+    data = response.get_data()
+    if len(data) < current_app.config.get('COMPRESS_MIN_SIZE',
+                                          DEFAULT_MIN_SIZE):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    """Compress the responses of a Flask app, see COMPRESSION
+
+    Args:
+        app (Flask): the app
+    """
+    app.after_request(_after_request)
@@ -1,19 +1,68 @@
 import os
+import sqlite3
 import connexion
-from flask_sqlalchemy import SQLAlchemy
+from connexion.apis.flask_api import FlaskApi
+from connexion.jsonifier import Jsonifier
 from flask_marshmallow import Marshmallow
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from settings import engine_options, load_settings
+from replicas import RoutingSQLAlchemy
+import fastjson
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+settings = load_settings()
+
 connex_app = connexion.App(__name__, specification_dir=basedir)
 
 app = connex_app.app
 
-app.config['SQLALCHEMY_ECHO'] = True
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(
-    basedir, 'final_proj.db')
+app.config['APP_ENV'] = settings['APP_ENV']
+app.config['SQLALCHEMY_ECHO'] = settings['SQL_ECHO']
+app.config['SQLALCHEMY_DATABASE_URI'] = settings['DATABASE_URL']
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(settings)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLITE_MMAP_SIZE'] = settings['SQLITE_MMAP_SIZE']
+app.config['READ_REPLICA_URL'] = settings['READ_REPLICA_URL']
+app.config['READ_REPLICA_IMMUTABLE'] = settings['READ_REPLICA_IMMUTABLE']
+app.config['READ_REPLICA_POOL_SIZE'] = settings['DB_POOL_SIZE']
+app.config['CACHE_MAX_BYTES'] = 16 * 1024 * 1024
+app.config['CACHE_TTL'] = 300
+app.config['INSTRUMENTATION'] = settings['INSTRUMENTATION']
+app.config['N_PLUS_ONE_THRESHOLD'] = settings['N_PLUS_ONE_THRESHOLD']
+app.config['COMPRESSION'] = settings['COMPRESSION']
+app.config['COMPRESS_MIN_SIZE'] = settings['COMPRESS_MIN_SIZE']
+app.config['ANALYTICS_MAX_AGE'] = settings['ANALYTICS_MAX_AGE']
+app.config['RANKINGS_REFRESH'] = settings['RANKINGS_REFRESH']
+app.config['JSON_SORT_KEYS'] = False
+app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+
+# connexion encodes the handler results with indent=2 and sorted keys
+FlaskApi.jsonifier = Jsonifier(fastjson)
+
+
+@event.listens_for(Engine, 'connect')
+def sqlite_pragmas(connection, record):
+    """Let several workers share the SQLite file
+
+    WAL lets readers run while another process writes instead of
+    waiting on the file lock, busy_timeout makes writers wait for each
+    other instead of failing and mmap reads the pages without copying
+    them through the page cache. Read-only replica connections keep the
+    journal mode of the file, see replicas.
+    """
+    if not isinstance(connection, sqlite3.Connection):
+        return
+    cursor = connection.cursor()
+    if not record.info.get('read_only'):
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout=5000')
+    cursor.execute(f"PRAGMA mmap_size={int(app.config['SQLITE_MMAP_SIZE'])}")
+    cursor.close()
+
 
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
 
 ma = Marshmallow(app)
@@ -1,95 +1,196 @@
 from flask import make_response, abort
+from marshmallow import ValidationError
 from config import db
-from models import Directors, DirectorsSchema, Movies
-
-
-def filter_list(argument, limit):
-    return Directors.query.order_by(argument).all(
-    ) if limit < 1 else Directors.query.order_by(argument).limit(limit)
+from models import Directors, DirectorsSchema, DirectorsMoviesSchema, Movies
+from loaders import directors_query
+from pagination import check_limit, order_clauses
+from pagination import page_headers, paginate
+from query_engine import filter_clauses, legacy_sort, sort_keys
+from fieldsets import load_columns, nested_load_columns, parse_fieldset
+from fieldsets import schema_options
+from streaming import stream_rows, wants_stream
+from search import search, terms
+from cache import director_key, get_cache, invalidate_director
+from serializers import dump_director, dump_director_row, serializer
+from stats import refresh_directors
+from rankings import update_rankings
+from versions import conditional, list_validators, make_etag, touch
+from versions import validators
+from replicas import read_replica, reads_replica, strong_consistency
+from bulk import chunked, find_in, item_result, load_items, multi_status
+from upserts import insert_new, load_values, update_columns
+from upserts import upsert as upsert_row
+
+
+# fields clients can sort and filter on, all of them are indexed
+FIELDS = {
+    'id': Directors.id,
+    'name': Directors.name,
+    'gender': Directors.gender,
+    'uid': Directors.uid,
+    'department': Directors.department,
+}
+
+
+def fieldset_query(fields=None, include=None, keys=()):
+    """Query and schema options for the fields and include parameters
+
+    Only the requested columns are selected, plus id and the sort keys.
 
+    Args:
+        fields (str, optional): comma separated fields, like 'id,name,movies.title'. Defaults to None.
+        include (str, optional): movies or none. Defaults to None.
+        keys (list, optional): sort keys of the query. Defaults to ().
 
-def read_all(limit=0, order_by='id', order='asc'):
-    """get all list of director data from databases with paramater 
-        - limit for limit list length
+    Returns:
+        tuple: query of directors and keyword arguments for DirectorsSchema
+    """
+    fieldset = parse_fieldset(fields, include, DirectorsSchema._declared_fields,
+                              'movies', DirectorsMoviesSchema._declared_fields)
+    query = directors_query(load_columns(fieldset, keys),
+                            nested_load_columns(fieldset, 'director_id'),
+                            fieldset.nested)
+    return query, schema_options(fieldset, 'movies')
+
+
+@read_replica
+@list_validators('directors')
+def read_all(limit=None,
+             order_by='id',
+             order='asc',
+             sort=None,
+             filter=None,
+             fields=None,
+             include=None,
+             cursor=None,
+             page_size=None,
+             stream=False):
+    """get list of director data from databases with paramater 
+        - limit for the number of directors of the page
         - order_by for ordering by (id,name,gender,uid, or deparment)
         - order for ordering descending or ascending
+        - sort for ordering by several fields, like 'department,-name'
+        - filter for keeping matching directors, like 'gender=2'
+        - fields and include for sending only some fields
+        - cursor and page_size for keyset pagination
+        - stream for newline delimited JSON of every director
+
+    The response is always a list holding one page of limit or page_size
+    directors (100 by default, at most 1000), the X-Next-Cursor header holds
+    the cursor of the next page unless it is the last one. With stream=true or
+    an Accept: application/x-ndjson header all matching directors are sent one
+    per line as they are read. The ETag follows the catalog revision, a current
+    If-None-Match gets a 304 without running the query.
 
     Args:
-        limit (int, optional): [limit list length]. Defaults to 0.
+        limit (int, optional): [directors per page, like page_size]. Defaults to 100.
         order_by (str, optional): [ordering by (id,name,gender,uid, or deparment)]. Defaults to 'id'.
         order (str, optional): [ordering desc or asc]. Defaults to 'asc'.
+        sort (str, optional): [comma separated fields, '-' for desc]. Defaults to order_by and order.
+        filter (list, optional): [conditions like 'department=Directing']. Defaults to None.
+        fields (str, optional): [fields to send, like 'id,name,movies.title']. Defaults to None.
+        include (str, optional): [movies or none]. Defaults to None.
+        cursor (str, optional): [X-Next-Cursor of the previous page]. Defaults to None.
+        page_size (int, optional): [directors per page]. Defaults to None.
+        stream (bool, optional): [stream all directors as NDJSON]. Defaults to False.
 
     Returns:
-        list: list of dict of director datas
+        list: page of dict of director datas
     """
 
-    if order_by == 'name':
-        directors = filter_list(db.desc(Directors.name),
-                                limit) if order == 'desc' else filter_list(
-                                    Directors.name, limit)
-    elif order_by == 'gender':
-        directors = filter_list(db.desc(Directors.gender),
-                                limit) if order == 'desc' else filter_list(
-                                    Directors.gender, limit)
-    elif order_by == 'uid':
-        directors = filter_list(db.desc(Directors.uid),
-                                limit) if order == 'desc' else filter_list(
-                                    Directors.uid, limit)
-    elif order_by == 'department':
-        directors = filter_list(db.desc(Directors.department),
-                                limit) if order == 'desc' else filter_list(
-                                    Directors.department, limit)
-    else:
-        directors = filter_list(db.desc(Directors.id),
-                                limit) if order == 'desc' else filter_list(
-                                    Directors.id, limit)
+    keys = sort_keys(sort or legacy_sort(order_by, order), FIELDS,
+                     Directors.id)
+    query, options = fieldset_query(fields, include, keys)
+    query = query.filter(*filter_clauses(filter, FIELDS))
+
+    if wants_stream(stream):
+        directors = query.order_by(*order_clauses(keys))
+        if limit is not None:
+            directors = directors.limit(check_limit(limit))
+        return stream_rows(directors, serializer(DirectorsSchema, **options))
+
+    dump = serializer(DirectorsSchema, many=True, **options)
 
-    director_schema = DirectorsSchema(many=True)
-    data = director_schema.dump(directors)
-    return data
+    directors, next_cursor = paginate(query, keys, cursor,
+                                      page_size or limit)
+    return dump(directors), 200, page_headers(next_cursor)
 
 
+@read_replica
 def read_one(director_id):
     """Get specific director data from the databases
 
+    The ETag and Last-Modified come from the version of the director, so
+    a client with a current copy gets a 304 after one primary key lookup.
+
     Args:
         director_id (integer): id of the director
 
     Returns:
         Dict: Dict of director data including movies list
     """
-    director = (Directors.query.filter(
-        Directors.id == director_id)).outerjoin(Movies).one_or_none()
+    cache = get_cache()
+    # entries are read from the primary, but may predate a write of
+    # another worker
+    cached = None if strong_consistency() else cache.get(
+        director_key(director_id))
+    if cached is not None:
+        data, headers = cached
+        return conditional(headers, lambda: data)
+
+    version = db.session.query(Directors.version, Directors.updated_at).filter(
+        Directors.id == director_id).one_or_none()
+    if version is None:
+        abort(404, f"Director not found for Id: {director_id}")
 
-    if director is not None:
-        director_schema = DirectorsSchema()
-        data = director_schema.dump(director)
+    headers = validators(make_etag('director', director_id, *version),
+                         version.updated_at)
+
+    def build():
+        director = directors_query().filter(
+            Directors.id == director_id).one_or_none()
+        if director is None:
+            abort(404, f"Director not found for Id: {director_id}")
+        data = dump_director(director)
+        # a lagging replica may predate a write whose eviction has passed
+        if not reads_replica():
+            cache.set(director_key(director_id), (data, headers),
+                      director_id)
         return data
-    else:
-        abort(404, f"Director not found for Id: {director_id}")
 
+    return conditional(headers, build)
+
+
+@read_replica
+def search_name(name, limit=None, fields=None, include=None, stream=False):
+    """Get search query by name, best match first
 
-def search_name(name, limit=0):
-    """Get search query by name
+    Matches whole words of the name, the last word also as a prefix.
 
     Args:
         name (string): name to search
-        limit (int, optional): number of limit search list. Defaults to 0.
+        limit (int, optional): number of directors, at most 1000. Defaults to 100.
+        fields (str, optional): fields to send, like 'id,name'. Defaults to None.
+        include (str, optional): movies or none. Defaults to None.
+        stream (bool, optional): stream every match as NDJSON. Defaults to False.
 
     Returns:
         list: list of directors
     """
 
-    search = "%{}%".format(name)
+    query, options = fieldset_query(fields, include)
+    directors = search(query, Directors, terms(name))
 
-    directors = (Directors.query.filter(
-        Directors.name.like(f'%{name}%')).outerjoin(Movies).all(
-        )) if limit < 1 else (Directors.query.filter(
-            Directors.name.like(f'%{name}%')).outerjoin(Movies).limit(limit))
+    if wants_stream(stream):
+        if limit is not None:
+            directors = directors.limit(check_limit(limit))
+        return stream_rows(directors, serializer(DirectorsSchema, **options))
+
+    directors = directors.limit(check_limit(limit)).all()
 
     if directors is not None:
-        director_schame = DirectorsSchema(many=True)
-        data = director_schame.dump(directors)
+        dump = serializer(DirectorsSchema, many=True, **options)
+        data = dump(directors)
         return data
     else:
         abort(404, f"Director not found")
@@ -105,23 +206,19 @@ def create(director):
         dict: dict of new director
     """
 
-    uid = director.get('uid')
-
-    exsisting_director = (Directors.query.filter(
-        Directors.uid).filter(Directors.uid == uid).one_or_none())
-
-    if exsisting_director is None:
-        schema = DirectorsSchema()
-        new_director = schema.load(director, session=db.session)
+    try:
+        values = load_values(DirectorsSchema, director)
+    except ValidationError as err:
+        abort(400, f"Invalid director: {err.messages}")
+    new_director = insert_new(Directors, values)
 
-        db.session.add(new_director)
+    if new_director is not None:
+        touch()
         db.session.commit()
 
-        data = schema.dump(new_director)
-
-        return data, 201
+        return dump_director_row(new_director), 201
     else:
-        abort(409, f"Directors uid {uid} exists already")
+        abort(409, f"Directors uid {values.get('uid')} exists already")
 
 
 def update(director_id, director):
@@ -135,25 +232,115 @@ def update(director_id, director):
         dict,status code: object of updated director, and status code
     """
 
-    update_director = Directors.query.filter(
-        Directors.id == director_id).one_or_none()
+    try:
+        values = load_values(DirectorsSchema, director)
+    except ValidationError as err:
+        abort(400, f"Invalid director: {err.messages}")
+    update_director = update_columns(Directors, values,
+                                     Directors.id == director_id)
 
     if update_director is not None:
-        schema = DirectorsSchema()
-        updated = schema.load(director, session=db.session)
+        touch()
+        db.session.commit()
+        invalidate_director(director_id)
 
-        updated.id = update_director.id
+        return dump_director_row(update_director), 200
+    else:
+        abort(404, f"Person not found for Id: {director_id}")
 
-        db.session.merge(updated)
-        db.session.commit()
 
-        data = schema.dump(update_director)
+def patch(director_id, director):
+    """PATCH the given fields of a director
+
+    Args:
+        director_id (integer): id of the director to update
+        director (dict): fields to change
+
+    Returns:
+        dict,status code: director as stored, and status code
+    """
 
-        return data, 200
+    try:
+        values = load_values(DirectorsSchema, director, partial=True)
+    except ValidationError as err:
+        abort(400, f"Invalid director: {err.messages}")
+    if not values:
+        abort(400, "No director field to update")
+
+    patched = update_columns(Directors, values, Directors.id == director_id)
+
+    if patched is not None:
+        touch()
+        db.session.commit()
+        invalidate_director(director_id)
+
+        return dump_director_row(patched), 200
     else:
         abort(404, f"Person not found for Id: {director_id}")
 
 
+def upsert(uid, director):
+    """PUT the director with a uid, creating it when there is none
+
+    Args:
+        uid (integer): uid of the director
+        director (dict): object of the director
+
+    Returns:
+        dict,status code: director as stored, and 201 when created or
+            200 when updated
+    """
+
+    try:
+        values = load_values(DirectorsSchema, dict(director, uid=uid))
+    except ValidationError as err:
+        abort(400, f"Invalid director: {err.messages}")
+
+    stored, created = upsert_row(Directors, values)
+    touch()
+    db.session.commit()
+    if not created:
+        invalidate_director(stored.id)
+
+    return dump_director_row(stored), 201 if created else 200
+
+
+def delete_directors(ids):
+    """Delete directors and their movies with set based statements
+
+    The movies are deleted by director_id instead of being loaded for
+    the ORM cascade, so the time does not grow with the filmography.
+
+    Args:
+        ids (iterable): ids of the directors to delete
+
+    Returns:
+        set: ids of the directors found and deleted
+    """
+    found = {
+        director_id
+        for director_id, in find_in(db.session.query(Directors.id),
+                                    Directors.id, ids)
+    }
+    movie_ids = []
+    for chunk in chunked(found):
+        # the rankings drop the movies by id
+        movie_ids.extend(
+            movie_id for movie_id, in db.session.query(Movies.id).filter(
+                Movies.director_id.in_(chunk)))
+        Movies.query.filter(Movies.director_id.in_(chunk)).delete(
+            synchronize_session=False)
+        Directors.query.filter(Directors.id.in_(chunk)).delete(
+            synchronize_session=False)
+    refresh_directors(found)
+    touch()
+    db.session.commit()
+    for director_id in found:
+        invalidate_director(director_id)
+    update_rankings(movie_ids)
+    return found
+
+
 def delete(director_id):
     """DELETE director from database
 
@@ -164,13 +351,138 @@ def delete(director_id):
         string: string of status
     """
 
-    director = Directors.query.filter(
-        Directors.id == director_id).one_or_none()
-
-    if director is not None:
-        db.session.delete(director)
-        db.session.commit()
-        return make_response(f"Director {director} deleted", 200)
+    if delete_directors([director_id]):
+        return make_response(f"Director <Directors {director_id}> deleted",
+                             200)
 
     else:
         abort(404, f"Director not found for Id: {director_id}")
+
+
+def bulk_create(directors):
+    """POST many new directors in one transaction
+
+    The whole array is validated at once, uid conflicts with the database
+    or inside the array are found with a single IN query and the new
+    directors are inserted with one executemany.
+
+    Args:
+        directors (list): list of directors to add
+
+    Returns:
+        list,status code: status of every director (201 with its id, 400 or
+            409 with an error), and 201 or 207 when some failed
+    """
+
+    schema = DirectorsSchema(many=True,
+                             load_instance=False,
+                             exclude=('id', 'movies'))
+    rows, errors = load_items(schema, directors)
+    results = {i: item_result(i, 400, error=errors[i]) for i in errors}
+
+    existing = {
+        uid
+        for uid, in find_in(db.session.query(Directors.uid), Directors.uid,
+                            [row['uid'] for row in rows.values()])
+    }
+    new = {}
+    for i, row in rows.items():
+        if row['uid'] in existing:
+            results[i] = item_result(
+                i, 409, error=f"Directors uid {row['uid']} exists already")
+        else:
+            existing.add(row['uid'])
+            new[i] = row
+
+    db.session.bulk_insert_mappings(Directors, list(new.values()))
+    touch()
+    db.session.commit()
+
+    ids = dict(
+        find_in(db.session.query(Directors.uid, Directors.id), Directors.uid,
+                [row['uid'] for row in new.values()]))
+    for i, row in new.items():
+        results[i] = item_result(i, 201, id=ids[row['uid']])
+
+    return multi_status(results, 201)
+
+
+def bulk_update(directors):
+    """PATCH many directors in one transaction
+
+    Every director must have its id, only the other fields it holds are
+    changed.
+
+    Args:
+        directors (list): list of partial directors with their id
+
+    Returns:
+        list,status code: status of every director (200, 400, 404 or 409),
+            and 200 or 207 when some failed
+    """
+
+    schema = DirectorsSchema(many=True,
+                             load_instance=False,
+                             exclude=('movies', ))
+    rows, errors = load_items(schema, directors, partial=True)
+    results = {i: item_result(i, 400, error=errors[i]) for i in errors}
+
+    for i, row in list(rows.items()):
+        if row.get('id') is None:
+            results[i] = item_result(i, 400, error={'id': ['Missing id.']})
+            del rows[i]
+
+    found = {
+        director_id
+        for director_id, in find_in(db.session.query(Directors.id),
+                                    Directors.id,
+                                    [row['id'] for row in rows.values()])
+    }
+    owners = dict(
+        find_in(db.session.query(Directors.uid, Directors.id), Directors.uid,
+                [row['uid'] for row in rows.values() if 'uid' in row]))
+
+    updates = []
+    for i, row in rows.items():
+        if row['id'] not in found:
+            results[i] = item_result(
+                i, 404, error=f"Director not found for Id: {row['id']}")
+        elif 'uid' in row and owners.setdefault(row['uid'],
+                                                row['id']) != row['id']:
+            results[i] = item_result(
+                i, 409, error=f"Directors uid {row['uid']} exists already")
+        else:
+            results[i] = item_result(i, 200, id=row['id'])
+            updates.append(row)
+
+    db.session.bulk_update_mappings(Directors, updates)
+    touch(row['id'] for row in updates)
+    db.session.commit()
+    for row in updates:
+        invalidate_director(row['id'])
+
+    return multi_status(results, 200)
+
+
+def bulk_delete(ids):
+    """DELETE many directors and their movies in one transaction
+
+    Args:
+        ids (list): ids of the directors to delete
+
+    Returns:
+        list,status code: status of every id (200 or 404), and 200 or 207
+            when some were not found
+    """
+
+    found = delete_directors(ids)
+
+    results = {}
+    for i, director_id in enumerate(ids):
+        if director_id in found:
+            results[i] = item_result(i, 200, id=director_id)
+        else:
+            results[i] = item_result(
+                i, 404, error=f"Director not found for Id: {director_id}")
+
+    return multi_status(results, 200)
@@ -0,0 +1,50 @@
+"""Compact JSON encoding of the API responses
+
+orjson, when installed, encodes several times faster than the json
+module. Without it the json module is used with compact separators.
+Either way keys keep the order of the serializers and nothing is
+indented, unlike the connexion default (indent=2, sorted keys).
+"""
+import datetime
+import decimal
+import json
+import uuid
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(o):
+    """Encode the types the json module does not know, like connexion"""
+    if isinstance(o, datetime.datetime):
+        if o.tzinfo:
+            return o.isoformat('T')
+        return o.isoformat('T') + 'Z'
+    if isinstance(o, datetime.date):
+        return o.isoformat()
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if isinstance(o, decimal.Decimal):
+        # SUM and AVG of PostgreSQL
+        return float(o)
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON '
+                    f'serializable')
+
+
+if orjson is not None:
+
+    def dumps(obj, **kwargs):
+        """Encode obj as a compact JSON string, keyword arguments are ignored"""
+        return orjson.dumps(obj, default=default,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+
+    loads = orjson.loads
+else:
+
+    def dumps(obj, **kwargs):
+        """Encode obj as a compact JSON string, keyword arguments are ignored"""
+        return json.dumps(obj, default=default, separators=(',', ':'))
+
+    loads = json.loads
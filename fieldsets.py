@@ -0,0 +1,115 @@
+from collections import namedtuple
+from flask import abort
+
+Fieldset = namedtuple('Fieldset', ['fields', 'nested', 'nested_fields'])
+Fieldset.__doc__ = """Fields a client asked for
+
+fields is the set of top level fields, or None for all of them, nested
+is True when the nested objects are included and nested_fields is the
+set of their fields, or None for all of them.
+"""
+
+ALL = Fieldset(None, True, None)
+
+
+def parse_fieldset(fields, include, allowed, nested, nested_allowed):
+    """Parse the fields and include parameters of a list endpoint
+
+    fields is a comma separated list like 'id,name,movies.title', nested
+    fields are prefixed by the name of the nested field. The nested
+    objects are sent when include names them, or when include is not
+    given and fields is not given or mentions them. include=none never
+    sends them.
+
+    Args:
+        fields (string): fields parameter or None
+        include (string): include parameter, nested or 'none', or None
+        allowed (iterable): top level fields of the schema
+        nested (string): name of the nested field, like 'movies'
+        nested_allowed (iterable): fields of the nested schema
+
+    Returns:
+        Fieldset: requested fields
+    """
+    if include not in (None, nested, 'none'):
+        abort(400, f"Invalid include: {include}, use {nested} or none")
+
+    top, below = None, None
+    mentioned = True
+    if fields is not None:
+        top, below = set(), set()
+        names = [name.strip() for name in fields.split(',') if name.strip()]
+        for name in names:
+            parent, _, child = name.rpartition('.')
+            if parent == nested:
+                if child not in nested_allowed:
+                    abort(400, f"Unknown field: {name}")
+                below.add(child)
+            elif parent or name not in allowed:
+                abort(400, f"Unknown field: {name}")
+            elif name != nested:
+                top.add(name)
+        mentioned = bool(below) or nested in names
+        below = below or None
+
+    if include is not None:
+        mentioned = include == nested
+    return Fieldset(top, mentioned, below if mentioned else None)
+
+
+def schema_options(fieldset, nested):
+    """only and exclude arguments of the schema dumping a fieldset
+
+    Args:
+        fieldset (Fieldset): requested fields
+        nested (string): name of the nested field, like 'movies'
+
+    Returns:
+        dict: keyword arguments for the schema
+    """
+    # nested fields can only be chosen through fields
+    if fieldset.fields is None:
+        return {} if fieldset.nested else {'exclude': (nested, )}
+
+    only = set(fieldset.fields)
+    if fieldset.nested:
+        if fieldset.nested_fields is None:
+            only.add(nested)
+        else:
+            only.update(f'{nested}.{name}' for name in fieldset.nested_fields)
+    return {'only': tuple(sorted(only))}
+
+
+def load_columns(fieldset, keys=(), foreign_key=None):
+    """Names of the columns to SELECT for the top level objects
+
+    Args:
+        fieldset (Fieldset): requested fields
+        keys (list, optional): sort keys, their columns are always loaded. Defaults to ().
+        foreign_key (string, optional): column joining the nested object. Defaults to None.
+
+    Returns:
+        set: column names, or None to load every column
+    """
+    if fieldset.fields is None:
+        return None
+    columns = fieldset.fields | {'id'} | {column.key for column, _ in keys}
+    if fieldset.nested and foreign_key:
+        columns.add(foreign_key)
+    return columns
+
+
+def nested_load_columns(fieldset, foreign_key=None):
+    """Names of the columns to SELECT for the nested objects
+
+    Args:
+        fieldset (Fieldset): requested fields
+        foreign_key (string, optional): column joining the parent object. Defaults to None.
+
+    Returns:
+        set: column names, or None to load every column
+    """
+    if fieldset.nested_fields is None:
+        return None
+    return fieldset.nested_fields | {'id'} | ({foreign_key}
+                                              if foreign_key else set())
@@ -0,0 +1,29 @@
+"""Gunicorn settings, read from the profile selected by APP_ENV
+
+WEB_CONCURRENCY and GUNICORN_THREADS override the worker and thread
+counts of the profile. With GUNICORN_PRELOAD the master imports the app
+once and forks the workers from it, so they start at once and share
+the memory of the loaded modules.
+"""
+from settings import load_settings
+
+settings = load_settings()
+
+workers = settings['WEB_CONCURRENCY']
+threads = settings['GUNICORN_THREADS']
+worker_class = 'gthread' if threads > 1 else 'sync'
+# recycle workers now and then so a slow leak cannot grow forever
+max_requests = 1000
+max_requests_jitter = 100
+preload_app = settings['GUNICORN_PRELOAD']
+
+
+def post_fork(server, worker):
+    # connections opened by the master at import, like the schema check,
+    # must not be shared with the workers
+    if preload_app:
+        import config
+        import replicas
+        with config.app.app_context():
+            config.db.engine.dispose()
+        replicas.dispose_engines(config.app)
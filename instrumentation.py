@@ -0,0 +1,311 @@
+"""Opt-in per-request instrumentation
+
+With INSTRUMENTATION on, every request records its SQL statements and
+time, the time spent dumping objects and its total latency. The totals
+per endpoint are served in the Prometheus text format at /metrics and
+every response gets a Server-Timing header:
+
+    Server-Timing: sql;dur=3.10;desc="4 queries", serialize;dur=1.02, total;dur=6.48
+
+A statement sent more than N_PLUS_ONE_THRESHOLD times by one request is
+logged as a likely N+1 and counted. ?profile=1 answers with the cProfile
+report of the request instead of its response.
+
+The metrics live in one process, like the response cache, so every
+worker serves its own.
+"""
+import cProfile
+import functools
+import io
+import logging
+import pstats
+import threading
+import time
+from collections import Counter
+from flask import Response, abort, current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_N_PLUS_ONE_THRESHOLD = 10
+# upper bounds of the latency histogram, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_LINES = 40
+METRICS_MIMETYPE = 'text/plain; version=0.0.4'
+
+
+class RequestStats:
+    """What one request spent, filled while it runs"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.statements = Counter()
+        self.profiler = None
+
+    @property
+    def queries(self):
+        return sum(self.statements.values())
+
+
+class Metrics:
+    """Totals per endpoint and method, rendered for Prometheus"""
+
+    def __init__(self):
+        self._requests = Counter()
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, method, status, stats, latency, repeated):
+        """Add a finished request to the totals
+
+        Args:
+            endpoint (string): url rule of the request
+            method (string): HTTP method
+            status (int): status code of the response
+            stats (RequestStats): what the request spent
+            latency (float): total time of the request, in seconds
+            repeated (dict): statements over the N+1 threshold
+        """
+        key = (endpoint, method)
+        with self._lock:
+            self._requests[key + (status, )] += 1
+            totals = self._totals.get(key)
+            if totals is None:
+                totals = self._totals[key] = {
+                    'buckets': [0] * len(BUCKETS),
+                    'count': 0,
+                    'latency': 0.0,
+                    'queries': 0,
+                    'sql': 0.0,
+                    'serialize': 0.0,
+                    'n_plus_one': 0,
+                }
+            for i, bound in enumerate(BUCKETS):
+                if latency <= bound:
+                    totals['buckets'][i] += 1
+            totals['count'] += 1
+            totals['latency'] += latency
+            totals['queries'] += stats.queries
+            totals['sql'] += stats.sql_time
+            totals['serialize'] += stats.serialize_time
+            totals['n_plus_one'] += bool(repeated)
+
+    def render(self):
+        """Totals in the Prometheus text exposition format
+
+        Returns:
+            string: metrics
+        """
+        with self._lock:
+            requests = sorted(self._requests.items())
+            totals = sorted((key, dict(value, buckets=list(value['buckets'])))
+                            for key, value in self._totals.items())
+
+        lines = [
+            '# HELP api_requests_total Requests answered.',
+            '# TYPE api_requests_total counter',
+        ]
+        for (endpoint, method, status), count in requests:
+            lines.append(f'api_requests_total{{endpoint="{endpoint}",'
+                         f'method="{method}",status="{status}"}} {count}')
+
+        lines += [
+            '# HELP api_request_duration_seconds Latency of the requests.',
+            '# TYPE api_request_duration_seconds histogram',
+        ]
+        for (endpoint, method), value in totals:
+            labels = f'endpoint="{endpoint}",method="{method}"'
+            for bound, count in zip(BUCKETS, value['buckets']):
+                lines.append(f'api_request_duration_seconds_bucket{{{labels},'
+                             f'le="{bound}"}} {count}')
+            lines.append(f'api_request_duration_seconds_bucket{{{labels},'
+                         f'le="+Inf"}} {value["count"]}')
+            lines.append(f'api_request_duration_seconds_sum{{{labels}}} '
+                         f'{value["latency"]:.6f}')
+            lines.append(f'api_request_duration_seconds_count{{{labels}}} '
+                         f'{value["count"]}')
+
+        for name, key, kind, description in [
+            ('api_sql_queries_total', 'queries', 'counter',
+             'SQL statements sent.'),
+            ('api_sql_duration_seconds_total', 'sql', 'counter',
+             'Time spent in SQL statements.'),
+            ('api_serialize_duration_seconds_total', 'serialize', 'counter',
+             'Time spent dumping objects.'),
+            ('api_n_plus_one_total', 'n_plus_one', 'counter',
+             'Requests repeating a statement over the N+1 threshold.'),
+        ]:
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+            for (endpoint, method), value in totals:
+                number = value[key]
+                lines.append(
+                    f'{name}{{endpoint="{endpoint}",method="{method}"}} ' +
+                    (f'{number:.6f}' if isinstance(number, float) else
+                     f'{number}'))
+        return '\n'.join(lines) + '\n'
+
+
+def get_metrics():
+    """Metrics of the current app
+
+    Returns:
+        Metrics: metrics
+    """
+    app = current_app._get_current_object()
+    metrics = app.extensions.get('metrics')
+    if metrics is None:
+        metrics = app.extensions['metrics'] = Metrics()
+    return metrics
+
+
+def current_stats():
+    """Stats of the request being instrumented
+
+    Returns:
+        RequestStats: stats, None when instrumentation is off or outside a request
+    """
+    if not has_app_context():
+        return None
+    return g.get('request_stats')
+
+
+def timed(function):
+    """Count the time spent in a dump function as serialization
+
+    Statements the function sends, like a lazy query it iterates, are
+    counted as SQL time only.
+
+    Args:
+        function (function): dump function, see serializers
+
+    Returns:
+        function: function doing the same
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        stats = current_stats()
+        if stats is None:
+            return function(*args, **kwargs)
+        start, sql_time = time.perf_counter(), stats.sql_time
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats.serialize_time += (time.perf_counter() - start -
+                                     (stats.sql_time - sql_time))
+
+    return wrapper
+
+
+def repeated_statements(statements, threshold):
+    """Statements sent more than threshold times
+
+    Args:
+        statements (Counter): number of times every statement was sent
+        threshold (int): times a statement may be sent
+
+    Returns:
+        dict: number of times of every repeated statement
+    """
+    return {
+        statement: count
+        for statement, count in statements.items() if count > threshold
+    }
+
+
+def server_timing(stats, latency):
+    """Server-Timing header value of a request, durations in milliseconds"""
+    return (f'sql;dur={stats.sql_time * 1000:.2f};'
+            f'desc="{stats.queries} queries", '
+            f'serialize;dur={stats.serialize_time * 1000:.2f}, '
+            f'total;dur={latency * 1000:.2f}')
+
+
+def profile_report(profiler):
+    """cProfile report of a request, sorted by cumulative time"""
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(
+        PROFILE_LINES)
+    return out.getvalue()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if current_stats() is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    stats = current_stats()
+    starts = conn.info.get('query_start')
+    if stats is None or not starts:
+        return
+    stats.sql_time += time.perf_counter() - starts.pop()
+    stats.statements[statement] += 1
+
+
+def _before_request():
+    if not current_app.config.get('INSTRUMENTATION') or \
+            request.endpoint == 'metrics':
+        return
+    stats = g.request_stats = RequestStats()
+    if request.args.get('profile') == '1':
+        stats.profiler = cProfile.Profile()
+        stats.profiler.enable()
+
+
+def _after_request(response):
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return response
+    latency = time.perf_counter() - stats.start
+    if stats.profiler is not None:
+        stats.profiler.disable()
+        return Response(profile_report(stats.profiler), mimetype='text/plain')
+
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    repeated = repeated_statements(
+        stats.statements,
+        current_app.config.get('N_PLUS_ONE_THRESHOLD',
+                               DEFAULT_N_PLUS_ONE_THRESHOLD))
+    for statement, count in repeated.items():
+        logger.warning('possible N+1 on %s %s, statement sent %d times: %s',
+                       request.method, endpoint, count, statement)
+    get_metrics().observe(endpoint, request.method, response.status_code,
+                          stats, latency, repeated)
+    response.headers['Server-Timing'] = server_timing(stats, latency)
+    return response
+
+
+def _teardown_request(exception=None):
+    # an unhandled error skips after_request
+    stats = g.pop('request_stats', None)
+    if stats is not None and stats.profiler is not None:
+        stats.profiler.disable()
+
+
+def metrics():
+    """GET the metrics of this worker, 404 with instrumentation off"""
+    if not current_app.config.get('INSTRUMENTATION'):
+        abort(404)
+    return Response(get_metrics().render(), mimetype=METRICS_MIMETYPE)
+
+
+def init_app(app):
+    """Register the request hooks and /metrics on a Flask app
+
+    The hooks do nothing until INSTRUMENTATION is set in the config.
+
+    Args:
+        app (Flask): the app
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,56 @@
+from sqlalchemy.orm import joinedload, load_only, selectinload
+from models import Directors, Movies
+
+
+def _only(model, columns):
+    return load_only(*[getattr(model, name) for name in columns])
+
+
+def directors_query(columns=None, movie_columns=None, include_movies=True):
+    """Query of directors ready to be dumped with DirectorsSchema
+
+    The nested movies list is loaded with one extra IN-batched SELECT
+    for the whole result instead of one SELECT per director.
+
+    Args:
+        columns (set, optional): director columns to load. Defaults to all.
+        movie_columns (set, optional): movie columns to load. Defaults to all.
+        include_movies (bool, optional): load the movies. Defaults to True.
+
+    Returns:
+        Query: query of Directors with movies eagerly loaded
+    """
+    query = Directors.query
+    if columns is not None:
+        query = query.options(_only(Directors, columns))
+    if include_movies:
+        movies = selectinload(Directors.movies)
+        if movie_columns is not None:
+            movies = movies.options(_only(Movies, movie_columns))
+        query = query.options(movies)
+    return query
+
+
+def movies_query(columns=None, director_columns=None, include_directors=True):
+    """Query of movies ready to be dumped with MoviesSchema
+
+    The parent director is a many-to-one, so it is joined into the same
+    SELECT as the movies.
+
+    Args:
+        columns (set, optional): movie columns to load. Defaults to all.
+        director_columns (set, optional): director columns to load. Defaults to all.
+        include_directors (bool, optional): load the director. Defaults to True.
+
+    Returns:
+        Query: query of Movies with directors eagerly loaded
+    """
+    query = Movies.query
+    if columns is not None:
+        query = query.options(_only(Movies, columns))
+    if include_directors:
+        directors = joinedload(Movies.directors)
+        if director_columns is not None:
+            directors = directors.options(_only(Directors, director_columns))
+        query = query.options(directors)
+    return query
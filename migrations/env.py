@@ -0,0 +1,44 @@
+import os
+import sys
+from logging.config import fileConfig
+from alembic import context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import models  # noqa: E402,F401
+from schema_check import include_object  # noqa: E402
+
+if context.config.config_file_name is not None:
+    fileConfig(context.config.config_file_name)
+
+target_metadata = config.db.metadata
+url = config.app.config['SQLALCHEMY_DATABASE_URI']
+
+
+def run_migrations_offline():
+    context.configure(url=url,
+                      target_metadata=target_metadata,
+                      include_object=include_object,
+                      render_as_batch=url.startswith('sqlite'),
+                      literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    with config.app.app_context():
+        with config.db.engine.connect() as connection:
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata,
+                include_object=include_object,
+                render_as_batch=connection.dialect.name == 'sqlite')
+            with context.begin_transaction():
+                context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
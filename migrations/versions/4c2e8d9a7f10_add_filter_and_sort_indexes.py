@@ -0,0 +1,40 @@
+"""add filter and sort indexes
+
+Every sort key of the API is indexed together with id, the tie breaker
+of keyset pagination, and movies.director_id backs Directors.movies.
+
+Revision ID: 4c2e8d9a7f10
+Revises: 1b69f7822cc6
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4c2e8d9a7f10'
+down_revision = '1b69f7822cc6'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_directors_name', 'directors', ['name']),
+    ('ix_directors_gender_id', 'directors', ['gender', 'id']),
+    ('ix_directors_department_id', 'directors', ['department', 'id']),
+    ('ix_movies_director_id', 'movies', ['director_id']),
+    ('ix_movies_uid', 'movies', ['uid']),
+    ('ix_movies_title_id', 'movies', ['title', 'id']),
+    ('ix_movies_release_date_id', 'movies', ['release_date', 'id']),
+    ('ix_movies_popularity_id', 'movies', ['popularity', 'id']),
+    ('ix_movies_vote_average_id', 'movies', ['vote_average', 'id']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,66 @@
+"""add director stats
+
+Summary of the movies of every director, read by the leaderboard and
+kept up to date by the movie handlers. Filled from the movies here.
+
+Revision ID: 7d3f1a6b2e58
+Revises: 4c2e8d9a7f10
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3f1a6b2e58'
+down_revision = '4c2e8d9a7f10'
+branch_labels = None
+depends_on = None
+
+SORT_COLUMNS = [
+    'movie_count',
+    'budget_total',
+    'revenue_total',
+    'vote_count_total',
+    'vote_average_mean',
+    'weighted_rating',
+]
+
+
+def upgrade():
+    op.create_table(
+        'director_stats',
+        sa.Column('director_id', sa.Integer(), nullable=False),
+        sa.Column('movie_count', sa.Integer(), nullable=False),
+        sa.Column('budget_total', sa.BigInteger(), nullable=False),
+        sa.Column('revenue_total', sa.BigInteger(), nullable=False),
+        sa.Column('vote_count_total', sa.BigInteger(), nullable=False),
+        sa.Column('vote_average_mean', sa.REAL(), nullable=True),
+        sa.Column('weighted_rating', sa.REAL(), nullable=True),
+        sa.ForeignKeyConstraint(['director_id'], ['directors.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('director_id'))
+    for column in SORT_COLUMNS:
+        op.create_index(f'ix_director_stats_{column}', 'director_stats',
+                        [column, 'director_id'])
+
+    op.execute("""
+        INSERT INTO director_stats (director_id, movie_count, budget_total,
+            revenue_total, vote_count_total, vote_average_mean,
+            weighted_rating)
+        SELECT director_id, count(id), coalesce(sum(budget), 0),
+            coalesce(sum(revenue), 0), coalesce(sum(vote_count), 0),
+            avg(vote_average),
+            sum(vote_average * vote_count) / nullif(sum(vote_count), 0)
+        FROM movies
+        WHERE director_id IS NOT NULL
+        GROUP BY director_id
+    """)
+
+
+def downgrade():
+    for column in reversed(SORT_COLUMNS):
+        op.drop_index(f'ix_director_stats_{column}',
+                      table_name='director_stats')
+    op.drop_table('director_stats')
@@ -0,0 +1,49 @@
+"""add versions
+
+version and updated_at on directors and movies back the ETag and
+Last-Modified of the single resources, the catalog_revision row backs
+those of the lists.
+
+Revision ID: 9a4b2c7e1d33
+Revises: 7d3f1a6b2e58
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4b2c7e1d33'
+down_revision = '7d3f1a6b2e58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ['directors', 'movies']:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(
+                sa.Column('version',
+                          sa.Integer(),
+                          nullable=False,
+                          server_default='1'))
+            batch_op.add_column(
+                sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute(f"UPDATE {table} SET updated_at = CURRENT_TIMESTAMP")
+
+    op.create_table('catalog_revision',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('revision', sa.Integer(), nullable=False),
+                    sa.Column('updated_at', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('id'))
+    op.execute("INSERT INTO catalog_revision (id, revision, updated_at) "
+               "VALUES (1, 1, CURRENT_TIMESTAMP)")
+
+
+def downgrade():
+    op.drop_table('catalog_revision')
+    for table in ['movies', 'directors']:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
+            batch_op.drop_column('version')
@@ -0,0 +1,35 @@
+"""unique movie uid
+
+INSERT ... ON CONFLICT (uid) needs a unique index on the conflict
+target. Movie uids were not checked before, so a uid held by several
+movies is kept by the first one (lowest id) and cleared on the others,
+which keeps every movie and its totals.
+
+Revision ID: b5e1f0c4a2d9
+Revises: 9a4b2c7e1d33
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e1f0c4a2d9'
+down_revision = '9a4b2c7e1d33'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        UPDATE movies SET uid = NULL
+        WHERE uid IS NOT NULL AND id NOT IN (
+            SELECT min(id) FROM movies WHERE uid IS NOT NULL GROUP BY uid)
+    """)
+    op.drop_index('ix_movies_uid', table_name='movies')
+    op.create_index('ix_movies_uid', 'movies', ['uid'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_movies_uid', table_name='movies')
+    op.create_index('ix_movies_uid', 'movies', ['uid'])
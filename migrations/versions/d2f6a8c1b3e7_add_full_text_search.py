@@ -0,0 +1,29 @@
+"""add full text search
+
+FTS5 tables and their sync triggers on SQLite, GIN indexes on Postgres,
+see search.create_index. They used to be created by the first search of
+a worker. SQLite without FTS5 and the other databases keep searching
+with LIKE.
+
+Revision ID: d2f6a8c1b3e7
+Revises: b5e1f0c4a2d9
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+from search import create_index, drop_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f6a8c1b3e7'
+down_revision = 'b5e1f0c4a2d9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    create_index(op.get_bind())
+
+
+def downgrade():
+    drop_index(op.get_bind())
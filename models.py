@@ -1,14 +1,23 @@
+from datetime import datetime
 from config import db, ma
 from marshmallow import fields
 
 
 class Directors(db.Model):
     __tablename__ = 'directors'
-    name = db.Column(db.String, index=True)
+    __table_args__ = (
+        db.Index('ix_directors_gender_id', 'gender', 'id'),
+        db.Index('ix_directors_department_id', 'department', 'id'),
+    )
+    name = db.Column(db.String, index=True, nullable=False)
     id = db.Column(db.Integer, primary_key=True)
-    gender = db.Column(db.Integer)
-    uid = db.Column(db.Integer)
+    gender = db.Column(db.Integer, nullable=False)
+    uid = db.Column(db.Integer, unique=True, nullable=False)
     department = db.Column(db.String)
+    # bumped with the movies of the director too, see versions.py
+    version = db.Column(db.Integer, nullable=False, default=1,
+                        server_default='1')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
     # don't know abot this one
     movies = db.relationship('Movies',
                              backref='directors',
@@ -19,6 +28,12 @@ class Directors(db.Model):
 
 class Movies(db.Model):
     __tablename__ = 'movies'
+    __table_args__ = (
+        db.Index('ix_movies_title_id', 'title', 'id'),
+        db.Index('ix_movies_release_date_id', 'release_date', 'id'),
+        db.Index('ix_movies_popularity_id', 'popularity', 'id'),
+        db.Index('ix_movies_vote_average_id', 'vote_average', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     original_title = db.Column(db.String)
     budget = db.Column(db.Integer)
@@ -30,8 +45,50 @@ class Movies(db.Model):
     vote_count = db.Column(db.Integer)
     overview = db.Column(db.String)
     tagline = db.Column(db.String)
-    uid = db.Column(db.Integer)
-    director_id = db.Column(db.Integer, db.ForeignKey('directors.id'))
+    uid = db.Column(db.Integer, index=True, unique=True)
+    director_id = db.Column(db.Integer,
+                            db.ForeignKey('directors.id'),
+                            index=True)
+    version = db.Column(db.Integer, nullable=False, default=1,
+                        server_default='1')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class DirectorStats(db.Model):
+    # totals of the movies of every director with at least one movie,
+    # kept up to date by the movie handlers, see stats.py
+    __tablename__ = 'director_stats'
+    __table_args__ = (
+        db.Index('ix_director_stats_movie_count', 'movie_count',
+                 'director_id'),
+        db.Index('ix_director_stats_budget_total', 'budget_total',
+                 'director_id'),
+        db.Index('ix_director_stats_revenue_total', 'revenue_total',
+                 'director_id'),
+        db.Index('ix_director_stats_vote_count_total', 'vote_count_total',
+                 'director_id'),
+        db.Index('ix_director_stats_vote_average_mean', 'vote_average_mean',
+                 'director_id'),
+        db.Index('ix_director_stats_weighted_rating', 'weighted_rating',
+                 'director_id'),
+    )
+    director_id = db.Column(db.Integer,
+                            db.ForeignKey('directors.id', ondelete='CASCADE'),
+                            primary_key=True)
+    movie_count = db.Column(db.Integer, nullable=False)
+    budget_total = db.Column(db.BigInteger, nullable=False)
+    revenue_total = db.Column(db.BigInteger, nullable=False)
+    vote_count_total = db.Column(db.BigInteger, nullable=False)
+    vote_average_mean = db.Column(db.REAL)
+    weighted_rating = db.Column(db.REAL)
+
+
+class CatalogRevision(db.Model):
+    # single row counting every write to the catalog, see versions.py
+    __tablename__ = 'catalog_revision'
+    id = db.Column(db.Integer, primary_key=True)
+    revision = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
 
 
 class DirectorsSchema(ma.SQLAlchemyAutoSchema):
@@ -42,6 +99,7 @@ class DirectorsSchema(ma.SQLAlchemyAutoSchema):
         model = Directors
         include_relationships = True
         load_instance = True
+        exclude = ('version', 'updated_at')
 
     movies = fields.Nested('DirectorsMoviesSchema', default=[], many=True)
 
@@ -73,6 +131,7 @@ class MoviesSchema(ma.SQLAlchemyAutoSchema):
         model = Movies
         include_relationships = True
         load_instance = True
+        exclude = ('version', 'updated_at')
 
     directors = fields.Nested("MoviesDirectorsSchema", default=None)
 
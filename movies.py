@@ -1,49 +1,125 @@
 from flask import make_response, abort
+from marshmallow import ValidationError
 from config import db
-from models import Movies, MoviesSchema, Directors
-
-
-def filter_list(argument, limit):
-    return Movies.query.order_by(argument).all(
-    ) if limit < 1 else Movies.query.order_by(argument).limit(limit)
+from models import Movies, MoviesSchema, MoviesDirectorsSchema, Directors
+from loaders import movies_query
+from pagination import check_limit, order_clauses
+from pagination import page_headers, paginate
+from query_engine import filter_clauses, legacy_sort, sort_keys
+from fieldsets import load_columns, nested_load_columns, parse_fieldset
+from fieldsets import schema_options
+from streaming import stream_rows, wants_stream
+from search import search, terms
+from cache import get_cache, invalidate_movie, movie_key
+from serializers import dump_movie, dump_movie_row, serializer
+from stats import refresh_directors
+from versions import conditional, list_validators, make_etag, touch
+from versions import validators
+from replicas import read_replica, reads_replica, strong_consistency
+from rankings import get_rankings, update_rankings
+from bulk import chunked, find_in, item_result, load_items, multi_status
+from upserts import insert_new, load_values, update_columns
+from upserts import upsert as upsert_row
+
+
+# fields clients can sort and filter on, all of them are indexed
+FIELDS = {
+    'id': Movies.id,
+    'title': Movies.title,
+    'release_date': Movies.release_date,
+    'popularity': Movies.popularity,
+    'vote_average': Movies.vote_average,
+    'uid': Movies.uid,
+    'director_id': Movies.director_id,
+}
+
+
+def fieldset_query(fields=None, include=None, keys=()):
+    """Query and schema options for the fields and include parameters
+
+    Only the requested columns are selected, plus id and the sort keys.
 
+    Args:
+        fields (str, optional): comma separated fields, like 'id,title,directors.name'. Defaults to None.
+        include (str, optional): directors or none. Defaults to None.
+        keys (list, optional): sort keys of the query. Defaults to ().
 
-def read_all(limit=0, order_by='title', order='asc'):
-    """GET all movies list with paramaters limit, order by, and order
+    Returns:
+        tuple: query of movies and keyword arguments for MoviesSchema
+    """
+    fieldset = parse_fieldset(fields, include, MoviesSchema._declared_fields,
+                              'directors',
+                              MoviesDirectorsSchema._declared_fields)
+    query = movies_query(load_columns(fieldset, keys, 'director_id'),
+                         nested_load_columns(fieldset), fieldset.nested)
+    return query, schema_options(fieldset, 'directors')
+
+
+@read_replica
+@list_validators('movies')
+def read_all(limit=None,
+             order_by='title',
+             order='asc',
+             sort=None,
+             filter=None,
+             fields=None,
+             include=None,
+             cursor=None,
+             page_size=None,
+             stream=False):
+    """GET movies list with paramaters limit, order by, order and cursor
+
+    sort orders by several fields, like '-popularity,title', and filter
+    keeps the movies matching every condition, like 'vote_average>7'.
+    fields and include restrict the fields sent, like 'id,title' and
+    include=none to leave out the director.
+
+    The response is always a list holding one page of limit or page_size movies
+    (100 by default, at most 1000), the X-Next-Cursor header holds the cursor
+    of the next page unless it is the last one. With stream=true or an Accept:
+    application/x-ndjson header all matching movies are sent one per line as
+    they are read. The ETag follows the catalog revision, a current
+    If-None-Match gets a 304 without running the query.
 
     Args:
-        limit (int, optional): limit list of movie. Defaults to 0.
+        limit (int, optional): movies per page, like page_size. Defaults to 100.
         order_by (str, optional): order movie by id, popularity, vote_average, and release_data . Defaults to 'title'.
         order (str, optional): order movie asc or desc. Defaults to 'asc'.
+        sort (str, optional): comma separated fields, '-' for desc. Defaults to order_by and order.
+        filter (list, optional): conditions like 'release_date>=2000'. Defaults to None.
+        fields (str, optional): fields to send, like 'id,title,directors.name'. Defaults to None.
+        include (str, optional): directors or none. Defaults to None.
+        cursor (str, optional): X-Next-Cursor of the previous page. Defaults to None.
+        page_size (int, optional): movies per page. Defaults to None.
+        stream (bool, optional): stream all movies as NDJSON. Defaults to False.
 
     Returns:
-        list: list of movies
+        list: page of movies
     """
 
-    if order_by == 'release_date':
-        movies = filter_list(db.desc(Movies.release_date),
-                             limit) if order == 'desc' else filter_list(
-                                 Movies.release_date, limit)
-    elif order_by == 'popularity':
-        movies = filter_list(db.desc(Movies.popularity),
-                             limit) if order == 'desc' else filter_list(
-                                 Movies.popularity, limit)
-    elif order_by == 'vote_average':
-        movies = filter_list(db.desc(Movies.vote_average),
-                             limit) if order == 'desc' else filter_list(
-                                 Movies.vote_average, limit)
-    else:
-        movies = filter_list(db.desc(Movies.title),
-                             limit) if order == 'desc' else filter_list(
-                                 Movies.title, limit)
-    movie_schema = MoviesSchema(many=True)
-    data = movie_schema.dump(movies)
-    return data
+    keys = sort_keys(sort or legacy_sort(order_by, order), FIELDS, Movies.id)
+    query, options = fieldset_query(fields, include, keys)
+    query = query.filter(*filter_clauses(filter, FIELDS))
+
+    if wants_stream(stream):
+        movies = query.order_by(*order_clauses(keys))
+        if limit is not None:
+            movies = movies.limit(check_limit(limit))
+        return stream_rows(movies, serializer(MoviesSchema, **options))
 
+    dump = serializer(MoviesSchema, many=True, **options)
 
+    movies, next_cursor = paginate(query, keys, cursor, page_size or limit)
+    return dump(movies), 200, page_headers(next_cursor)
+
+
+@read_replica
 def read_one(director_id, movie_id):
     """GET one specific movie by id and director id
 
+    The ETag comes from the versions of the movie and its director, a
+    client with a current copy gets a 304 before the movie is loaded.
+
     Args:
         director_id (int): id of director associated with
         movie_id (int): id of the movie
@@ -52,40 +128,136 @@ def read_one(director_id, movie_id):
         dict: dict of the movie
     """
 
-    movie = (Movies.query.join(Directors,
-                               Directors.id == Movies.director_id).filter(
-                                   Directors.id == director_id).filter(
-                                       Movies.id == movie_id).one_or_none())
-    if movie is not None:
-        movie_schema = MoviesSchema()
-        data = movie_schema.dump(movie)
-        return data
-    else:
+    cache = get_cache()
+    # entries are read from the primary, but may predate a write of
+    # another worker
+    cached = None if strong_consistency() else cache.get(
+        movie_key(director_id, movie_id))
+    if cached is not None:
+        data, headers = cached
+        return conditional(headers, lambda: data)
+
+    version = (db.session.query(
+        Movies.version, Movies.updated_at, Directors.version,
+        Directors.updated_at).join(
+            Directors, Directors.id == Movies.director_id).filter(
+                Movies.director_id == director_id).filter(
+                    Movies.id == movie_id).one_or_none())
+    if version is None:
         abort(404, f"Movie not found for Id: {movie_id}")
 
+    # the movie is dumped with its director, both versions make the ETag
+    headers = validators(
+        make_etag('movie', movie_id, *version),
+        max(filter(None, [version[1], version[3]]), default=None))
+
+    def build():
+        movie = (movies_query().filter(
+            Movies.director_id == director_id).filter(
+                Movies.id == movie_id).one_or_none())
+        if movie is None:
+            abort(404, f"Movie not found for Id: {movie_id}")
+        data = dump_movie(movie)
+        # a lagging replica may predate a write whose eviction has passed
+        if not reads_replica():
+            cache.set(movie_key(director_id, movie_id), (data, headers),
+                      director_id)
+        return data
+
+    return conditional(headers, build)
+
 
-def search_title(title, limit=0):
-    """Get search query by title
+@read_replica
+def search_title(title, limit=None, fields=None, include=None, stream=False):
+    """Get search query by title, best match first
+
+    Matches whole words of the title, original title, tagline and
+    overview, the last word also as a prefix. Title matches rank highest.
 
     Args:
         title (string): title want to search
-        limit (int, optional): number of limit of list. Defaults to 0.
+        limit (int, optional): number of movies, at most 1000. Defaults to 100.
+        fields (str, optional): fields to send, like 'id,title'. Defaults to None.
+        include (str, optional): directors or none. Defaults to None.
+        stream (bool, optional): stream every match as NDJSON. Defaults to False.
 
     Returns:
         list: list of searched movie
     """
-    movies = (Movies.query.filter(
-        Movies.title.like(f"%{title}%")).all()) if limit < 1 else (
-            Movies.query.filter(Movies.title.like(f"%{title}%")).limit(limit))
+    query, options = fieldset_query(fields, include)
+    movies = search(query, Movies, terms(title))
+
+    if wants_stream(stream):
+        if limit is not None:
+            movies = movies.limit(check_limit(limit))
+        return stream_rows(movies, serializer(MoviesSchema, **options))
+
+    movies = movies.limit(check_limit(limit)).all()
 
     if movies is not None:
-        schema = MoviesSchema(many=True)
-        data = schema.dump(movies)
+        dump = serializer(MoviesSchema, many=True, **options)
+        data = dump(movies)
         return data
     else:
         abort(404, f"Movie not found")
 
 
+def find_director(director_id):
+    """404 unless the director exists, reading its id only"""
+    if db.session.query(Directors.id).filter(
+            Directors.id == director_id).one_or_none() is None:
+        abort(404, f"Director not found for Id: {director_id}")
+
+
+def top_movies(by, limit, director_id=None, fields=None, include=None):
+    """First movies of a ranking, read by id in ranking order"""
+    ids = get_rankings().top(by, check_limit(limit), director_id)
+    query, options = fieldset_query(fields, include)
+    movies = {movie.id: movie for movie in find_in(query, Movies.id, ids)}
+    dump = serializer(MoviesSchema, many=True, **options)
+    return dump([movies[movie_id] for movie_id in ids if movie_id in movies])
+
+
+def read_top(by='popularity', limit=10, fields=None, include=None):
+    """GET the top movies of the catalog by popularity or rating
+
+    Same movies in the same order as sort=-popularity or
+    sort=-vote_average, served from the in-memory rankings, so the cost
+    follows the limit and not the size of the catalog.
+
+    Args:
+        by (str, optional): popularity or vote_average. Defaults to 'popularity'.
+        limit (int, optional): number of movies. Defaults to 10.
+        fields (str, optional): fields to send, like 'id,title'. Defaults to None.
+        include (str, optional): directors or none. Defaults to None.
+
+    Returns:
+        list: list of movies, best first
+    """
+    return top_movies(by, limit, fields=fields, include=include)
+
+
+def read_director_top(director_id,
+                      by='popularity',
+                      limit=10,
+                      fields=None,
+                      include=None):
+    """GET the top movies of a director by popularity or rating
+
+    Args:
+        director_id (int): id of the director
+        by (str, optional): popularity or vote_average. Defaults to 'popularity'.
+        limit (int, optional): number of movies. Defaults to 10.
+        fields (str, optional): fields to send, like 'id,title'. Defaults to None.
+        include (str, optional): directors or none. Defaults to None.
+
+    Returns:
+        list: list of movies of the director, best first
+    """
+    find_director(director_id)
+    return top_movies(by, limit, director_id, fields, include)
+
+
 def create(director_id, movie):
     """POST or create a new movie
 
@@ -97,20 +269,24 @@ def create(director_id, movie):
         dict: dict of new movie
     """
 
-    director = Directors.query.filter(
-        Directors.id == director_id).one_or_none()
+    find_director(director_id)
 
-    if director is None:
-        abort(404, f"Director not found for Id: {director_id}")
+    try:
+        values = load_values(MoviesSchema, movie)
+    except ValidationError as err:
+        abort(400, f"Invalid movie: {err.messages}")
+    new_movie = insert_new(Movies, dict(values, director_id=director_id))
 
-    schema = MoviesSchema()
-    new_movie = schema.load(movie, session=db.session)
+    if new_movie is None:
+        abort(409, f"Movies uid {values.get('uid')} exists already")
 
-    director.movies.append(new_movie)
+    refresh_directors([director_id])
+    touch([director_id])
     db.session.commit()
+    invalidate_movie(director_id)
+    update_rankings([new_movie.id])
 
-    data = schema.dump(new_movie)
-    return data, 201
+    return dump_movie_row(new_movie), 201
 
 
 def update(director_id, movie_id, movie):
@@ -125,25 +301,98 @@ def update(director_id, movie_id, movie):
         dict: dict of new edited movie
     """
 
-    update_movie = (Movies.query.filter(
-        Movies.director_id == director_id).filter(
-            Movies.id == movie_id).one_or_none())
+    try:
+        values = load_values(MoviesSchema, movie)
+    except ValidationError as err:
+        abort(400, f"Invalid movie: {err.messages}")
+    update_movie = update_columns(Movies, values,
+                                  Movies.director_id == director_id,
+                                  Movies.id == movie_id)
 
     if update_movie is not None:
-        schema = MoviesSchema()
-        update = schema.load(movie, session=db.session)
-        update.director_id = update_movie.director_id
-        update.id = update_movie.id
-        db.session.merge(update)
+        refresh_directors([director_id])
+        touch([director_id])
+        db.session.commit()
+        invalidate_movie(director_id, movie_id)
+        update_rankings([movie_id])
+
+        return dump_movie_row(update_movie), 200
+
+    else:
+        abort(404, f"Movie not found for Id: {movie_id}")
+
+
+def patch(director_id, movie_id, movie):
+    """PATCH the given fields of a movie
+
+    Args:
+        director_id (int): id of director associated with
+        movie_id (int): id of the movie
+        movie (dict): fields to change
+
+    Returns:
+        dict,status code: movie as stored, and status code
+    """
+
+    try:
+        values = load_values(MoviesSchema, movie, partial=True)
+    except ValidationError as err:
+        abort(400, f"Invalid movie: {err.messages}")
+    if not values:
+        abort(400, "No movie field to update")
+
+    patched = update_columns(Movies, values,
+                             Movies.director_id == director_id,
+                             Movies.id == movie_id)
+
+    if patched is not None:
+        refresh_directors([director_id])
+        touch([director_id])
         db.session.commit()
-        data = schema.dump(update_movie)
+        invalidate_movie(director_id, movie_id)
+        update_rankings([movie_id])
 
-        return data, 200
+        return dump_movie_row(patched), 200
 
     else:
         abort(404, f"Movie not found for Id: {movie_id}")
 
 
+def upsert(director_id, uid, movie):
+    """PUT the movie with a uid, creating it when there is none
+
+    Args:
+        director_id (int): id of director associated with
+        uid (int): uid of the movie
+        movie (dict): object of the movie
+
+    Returns:
+        dict,status code: movie as stored, and 201 when created or 200
+            when updated
+    """
+
+    try:
+        values = load_values(MoviesSchema, dict(movie, uid=uid))
+    except ValidationError as err:
+        abort(400, f"Invalid movie: {err.messages}")
+
+    find_director(director_id)
+    # a uid taken by a movie of another director is a conflict, not a move
+    stored, created = upsert_row(Movies,
+                                 dict(values, director_id=director_id),
+                                 where=Movies.director_id == director_id)
+    if stored is None:
+        abort(409, f"Movies uid {uid} belongs to another director")
+
+    refresh_directors([director_id])
+    touch([director_id])
+    db.session.commit()
+    invalidate_movie(director_id, None if created else stored.id)
+    update_rankings([stored.id])
+
+    return dump_movie_row(stored), 201 if created else 200
+
+
 def delete(director_id, movie_id):
     """DELETE a movie
 
@@ -160,7 +409,179 @@ def delete(director_id, movie_id):
 
     if movie is not None:
         db.session.delete(movie)
+        refresh_directors([director_id])
+        touch([director_id])
         db.session.commit()
+        invalidate_movie(director_id, movie_id)
+        update_rankings([movie_id])
         return make_response(f"Movie {movie_id} deleted", 200)
     else:
         abort(404, f"Movie not found for Id: {movie_id}")
+
+
+def bulk_create(movies):
+    """POST many new movies in one transaction
+
+    Every movie needs the director_id of an existing director and a uid
+    not used by another movie. Directors and uid conflicts are checked
+    with one IN query each and the new movies are inserted with one
+    executemany.
+
+    Args:
+        movies (list): list of movies to add
+
+    Returns:
+        list,status code: status of every movie (201 with its id, 400, 404
+            or 409 with an error), and 201 or 207 when some failed
+    """
+
+    director_ids = [movie.get('director_id') for movie in movies]
+    schema = MoviesSchema(many=True,
+                          load_instance=False,
+                          exclude=('id', 'directors'))
+    rows, errors = load_items(schema, [{
+        key: value
+        for key, value in movie.items() if key != 'director_id'
+    } for movie in movies])
+    results = {i: item_result(i, 400, error=errors[i]) for i in errors}
+
+    for i, row in list(rows.items()):
+        missing = [
+            field for field, value in (('director_id', director_ids[i]),
+                                       ('uid', row.get('uid')))
+            if value is None
+        ]
+        if missing:
+            results[i] = item_result(
+                i, 400, error={field: ['Missing data for required field.']
+                               for field in missing})
+            del rows[i]
+
+    found = {
+        director_id
+        for director_id, in find_in(db.session.query(Directors.id),
+                                    Directors.id,
+                                    [director_ids[i] for i in rows])
+    }
+    existing = {
+        uid
+        for uid, in find_in(db.session.query(Movies.uid), Movies.uid,
+                            [row['uid'] for row in rows.values()])
+    }
+    new = {}
+    for i, row in rows.items():
+        if director_ids[i] not in found:
+            results[i] = item_result(
+                i, 404, error=f"Director not found for Id: {director_ids[i]}")
+        elif row['uid'] in existing:
+            results[i] = item_result(
+                i, 409, error=f"Movies uid {row['uid']} exists already")
+        else:
+            existing.add(row['uid'])
+            new[i] = dict(row, director_id=director_ids[i])
+
+    db.session.bulk_insert_mappings(Movies, list(new.values()))
+    refresh_directors(row['director_id'] for row in new.values())
+    touch(row['director_id'] for row in new.values())
+    db.session.commit()
+
+    ids = dict(
+        find_in(db.session.query(Movies.uid, Movies.id), Movies.uid,
+                [row['uid'] for row in new.values()]))
+    for i, row in new.items():
+        invalidate_movie(row['director_id'])
+        results[i] = item_result(i, 201, id=ids[row['uid']])
+    update_rankings(ids.values())
+
+    return multi_status(results, 201)
+
+
+def bulk_update(movies):
+    """PATCH many movies in one transaction
+
+    Every movie must have its id, only the other fields it holds are
+    changed. A movie stays with its director.
+
+    Args:
+        movies (list): list of partial movies with their id
+
+    Returns:
+        list,status code: status of every movie (200, 400, 404 or 409),
+            and 200 or 207 when some failed
+    """
+
+    schema = MoviesSchema(many=True,
+                          load_instance=False,
+                          exclude=('directors', ))
+    rows, errors = load_items(schema, movies, partial=True)
+    results = {i: item_result(i, 400, error=errors[i]) for i in errors}
+
+    for i, row in list(rows.items()):
+        if row.get('id') is None:
+            results[i] = item_result(i, 400, error={'id': ['Missing id.']})
+            del rows[i]
+
+    directors = dict(
+        find_in(db.session.query(Movies.id, Movies.director_id), Movies.id,
+                [row['id'] for row in rows.values()]))
+    owners = dict(
+        find_in(db.session.query(Movies.uid, Movies.id), Movies.uid,
+                [row['uid'] for row in rows.values() if 'uid' in row]))
+
+    updates = []
+    for i, row in rows.items():
+        if row['id'] not in directors:
+            results[i] = item_result(
+                i, 404, error=f"Movie not found for Id: {row['id']}")
+        elif 'uid' in row and owners.setdefault(row['uid'],
+                                                row['id']) != row['id']:
+            results[i] = item_result(
+                i, 409, error=f"Movies uid {row['uid']} exists already")
+        else:
+            results[i] = item_result(i, 200, id=row['id'])
+            updates.append(row)
+
+    db.session.bulk_update_mappings(Movies, updates)
+    refresh_directors(directors[row['id']] for row in updates)
+    touch([directors[row['id']] for row in updates],
+          [row['id'] for row in updates])
+    db.session.commit()
+    for row in updates:
+        invalidate_movie(directors[row['id']], row['id'])
+    update_rankings(row['id'] for row in updates)
+
+    return multi_status(results, 200)
+
+
+def bulk_delete(ids):
+    """DELETE many movies in one transaction
+
+    Args:
+        ids (list): ids of the movies to delete
+
+    Returns:
+        list,status code: status of every id (200 or 404), and 200 or 207
+            when some were not found
+    """
+
+    directors = dict(
+        find_in(db.session.query(Movies.id, Movies.director_id), Movies.id,
+                ids))
+    for chunk in chunked(directors):
+        Movies.query.filter(Movies.id.in_(chunk)).delete(
+            synchronize_session=False)
+    refresh_directors(directors.values())
+    touch(directors.values())
+    db.session.commit()
+    update_rankings(directors)
+
+    results = {}
+    for i, movie_id in enumerate(ids):
+        if movie_id in directors:
+            invalidate_movie(directors[movie_id], movie_id)
+            results[i] = item_result(i, 200, id=movie_id)
+        else:
+            results[i] = item_result(
+                i, 404, error=f"Movie not found for Id: {movie_id}")
+
+    return multi_status(results, 200)
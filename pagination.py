@@ -0,0 +1,155 @@
+import base64
+import binascii
+import json
+from flask import abort
+from sqlalchemy import and_, false, or_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+# response header holding the cursor of the next page of a list
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def check_limit(limit, default=DEFAULT_PAGE_SIZE):
+    """Check a client supplied limit, a larger one is refused, not cut
+
+    Args:
+        limit (int): requested number of rows, None for the default
+        default (int, optional): rows without a limit. Defaults to DEFAULT_PAGE_SIZE.
+
+    Returns:
+        int: limit between 1 and MAX_PAGE_SIZE
+    """
+    if limit is None:
+        return default
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        abort(400, f"Limit must be between 1 and {MAX_PAGE_SIZE}: {limit}")
+    return limit
+
+
+def page_headers(next_cursor):
+    """Headers of a page of a list
+
+    Args:
+        next_cursor (string): cursor of the next page, None on the last one
+
+    Returns:
+        dict: response headers
+    """
+    return {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+
+
+def order_clauses(keys):
+    """ORDER BY clauses for sort keys
+
+    NULLs always come first in ascending order and last in descending
+    order so that SQLite and Postgres return the same sequence.
+
+    Args:
+        keys (list): list of (column, descending) tuples
+
+    Returns:
+        list: list of order by clauses
+    """
+    return [
+        column.desc().nullslast() if descending else column.asc().nullsfirst()
+        for column, descending in keys
+    ]
+
+
+def encode_cursor(values):
+    """Encode the sort key values of a row into an opaque cursor
+
+    Args:
+        values (list): sort key values of the last row of a page
+
+    Returns:
+        string: url safe cursor
+    """
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Decode a cursor made by encode_cursor
+
+    Args:
+        cursor (string): cursor sent by the client
+        size (int): number of sort keys the cursor must hold
+
+    Returns:
+        list: sort key values
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        values = None
+
+    if not isinstance(values, list) or len(values) != size:
+        abort(400, f"Invalid cursor: {cursor}")
+    return values
+
+
+def _after(column, descending, value):
+    if value is None:
+        return false() if descending else column.isnot(None)
+    if descending:
+        return or_(column < value, column.is_(None))
+    return column > value
+
+
+def seek_condition(keys, values):
+    """WHERE clause selecting the rows sorted after the cursor row
+
+    Args:
+        keys (list): list of (column, descending) tuples
+        values (list): sort key values of the cursor row
+
+    Returns:
+        ClauseElement: condition for the next page
+    """
+    branches = []
+    for i, (column, descending) in enumerate(keys):
+        equal = [keys[j][0] == values[j] for j in range(i)]
+        branches.append(and_(*equal, _after(column, descending, values[i])))
+    condition = or_(*branches)
+
+    # a plain range on the leading key lets the database seek on its index
+    column, descending = keys[0]
+    if values[0] is not None:
+        bound = (or_(column <= values[0], column.is_(None))
+                 if descending else column >= values[0])
+        condition = and_(bound, condition)
+    return condition
+
+
+def paginate(query, keys, cursor=None, page_size=None):
+    """Read one page of a query with keyset pagination
+
+    Args:
+        query (Query): query to paginate, without order by or limit
+        keys (list): list of (column, descending) tuples ending with a
+            unique column
+        cursor (string, optional): cursor of the previous page. Defaults to None.
+        page_size (int, optional): rows per page. Defaults to DEFAULT_PAGE_SIZE.
+
+    Returns:
+        tuple: list of rows and the cursor of the next page or None
+    """
+    page_size = check_limit(page_size)
+
+    if cursor:
+        query = query.filter(seek_condition(keys,
+                                            decode_cursor(cursor, len(keys))))
+
+    rows = query.order_by(*order_clauses(keys)).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(
+            [getattr(rows[-1], column.key) for column, _ in keys])
+    return rows, next_cursor
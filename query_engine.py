@@ -0,0 +1,89 @@
+import operator
+import re
+from flask import abort
+
+OPERATORS = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '<': operator.lt,
+    '=': operator.eq,
+}
+FILTER_PATTERN = re.compile(r'^\s*(\w+)\s*(>=|<=|!=|>|<|=)(.*)$')
+
+
+def _column(fields, name, usage):
+    column = fields.get(name)
+    if column is None:
+        abort(
+            400, f"Cannot {usage} by {name}, use one of: "
+            f"{', '.join(sorted(fields))}")
+    return column
+
+
+def sort_keys(sort, fields, id_column):
+    """Parse a sort parameter like '-popularity,title'
+
+    Every key is ascending unless prefixed by '-'. The primary key is
+    appended as tie breaker so the order is total, which keyset
+    pagination needs.
+
+    Args:
+        sort (string): comma separated field names
+        fields (dict): sortable field names and their columns
+        id_column (Column): primary key column of the model
+
+    Returns:
+        list: list of (column, descending) tuples
+    """
+    keys = []
+    for name in filter(None, (name.strip() for name in sort.split(','))):
+        descending = name.startswith('-')
+        column = _column(fields, name.lstrip('-+'), 'sort')
+        if not any(key is column for key, _ in keys):
+            keys.append((column, descending))
+
+    if not keys:
+        abort(400, "sort needs at least one field")
+    if not any(key is id_column for key, _ in keys):
+        keys.append((id_column, keys[-1][1]))
+    return keys
+
+
+def filter_clauses(filters, fields):
+    """Parse filters like 'vote_average>7' or 'department=Directing'
+
+    Values are converted to the type of the column, so they compare
+    against the column index instead of forcing a cast per row.
+
+    Args:
+        filters (list): list of 'field operator value' strings
+        fields (dict): filterable field names and their columns
+
+    Returns:
+        list: list of where clauses
+    """
+    clauses = []
+    for spec in filters or []:
+        match = FILTER_PATTERN.match(spec)
+        if match is None:
+            abort(400, f"Invalid filter: {spec}, expected field, one of "
+                  f"{' '.join(OPERATORS)} and a value")
+        name, op, raw = match.groups()
+        column = _column(fields, name, 'filter')
+        try:
+            value = column.type.python_type(raw.strip())
+        except ValueError:
+            abort(400, f"Invalid value for {name}: {raw}")
+        clauses.append(OPERATORS[op](column, value))
+    return clauses
+
+
+def legacy_sort(order_by, order):
+    """Sort parameter equivalent to the older order_by and order parameters
+
+    Returns:
+        string: sort parameter
+    """
+    return ('-' if order == 'desc' else '') + order_by
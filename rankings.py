@@ -0,0 +1,247 @@
+"""Top movies by popularity or rating, kept in memory
+
+For every ranked field the movies are kept in sorted lists, one for
+the whole catalog and one per director, in the order of
+sort=-field: highest first, NULLs last, then highest id. The top K is
+the head of a list, whatever the size of the catalog.
+
+The lists of a catalog revision form a Ranking, which is never modified
+once published: reads take the current one without a lock or a query.
+The handlers writing or deleting movies, directors with their movies
+included, pass the movie ids after their commit and a new Ranking with
+those movies reloaded replaces the current one. Writes the lists did
+not see, like a write of another worker, are caught up by a thread of
+every worker which compares the catalog revision every RANKINGS_REFRESH
+seconds and swaps in a rebuilt Ranking when it moved.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from flask import current_app
+from config import db
+from models import Movies
+from versions import catalog_revision
+from bulk import find_in
+
+log = logging.getLogger(__name__)
+
+DEFAULT_REFRESH = 5
+
+# fields movies are ranked on, all of them are indexed with id
+FIELDS = {
+    'popularity': Movies.popularity,
+    'vote_average': Movies.vote_average,
+}
+
+
+def sort_key(value, movie_id):
+    """Key sorting like ORDER BY value DESC NULLS LAST, id DESC"""
+    return (value is None, -(value or 0), -movie_id)
+
+
+def _rows(movie_ids=None):
+    query = db.session.query(Movies.id, Movies.director_id, *FIELDS.values())
+    if movie_ids is None:
+        return query.all()
+    return find_in(query, Movies.id, movie_ids)
+
+
+class Ranking(object):
+    """Movies sorted on every field of FIELDS at a catalog revision,
+    never modified once published"""
+
+    def __init__(self, revision, movies, keys, directors):
+        self.revision = revision
+        self._movies = movies
+        self._all = keys
+        self._directors = directors
+
+    @classmethod
+    def load(cls):
+        """Ranking of every movie, at the current catalog revision"""
+        revision, _ = catalog_revision()
+        movies = {
+            movie_id: (director_id, values)
+            for movie_id, director_id, *values in _rows()
+        }
+        keys, directors = {}, {}
+        for i, field in enumerate(FIELDS):
+            keys[field] = sorted(
+                sort_key(values[i], movie_id)
+                for movie_id, (_, values) in movies.items())
+            by_director = directors[field] = {}
+            for movie_id, (director_id, values) in movies.items():
+                if director_id is not None:
+                    by_director.setdefault(director_id, []).append(
+                        sort_key(values[i], movie_id))
+            for director_keys in by_director.values():
+                director_keys.sort()
+        return cls(revision, movies, keys, directors)
+
+    def replace(self, movie_ids, rows, revision):
+        """New Ranking with some movies reloaded
+
+        Copies the lists the movies are in and shares the others.
+
+        Args:
+            movie_ids (set): ids of the written movies
+            rows (list): rows of the movies still there
+            revision (int): revision of the new Ranking
+
+        Returns:
+            Ranking: ranking with the movies replaced
+        """
+        movies = dict(self._movies)
+        keys = {field: list(self._all[field]) for field in FIELDS}
+        directors = {field: dict(self._directors[field]) for field in FIELDS}
+        copied = set()
+
+        def director_keys(field, director_id):
+            if (field, director_id) not in copied:
+                copied.add((field, director_id))
+                directors[field][director_id] = list(
+                    directors[field].get(director_id, []))
+            return directors[field][director_id]
+
+        for movie_id in movie_ids & movies.keys():
+            director_id, values = movies.pop(movie_id)
+            for field, value in zip(FIELDS, values):
+                key = sort_key(value, movie_id)
+                del keys[field][bisect.bisect_left(keys[field], key)]
+                if director_id is not None:
+                    removed = director_keys(field, director_id)
+                    del removed[bisect.bisect_left(removed, key)]
+                    if not removed:
+                        del directors[field][director_id]
+                        copied.discard((field, director_id))
+        for movie_id, director_id, *values in rows:
+            movies[movie_id] = (director_id, values)
+            for field, value in zip(FIELDS, values):
+                key = sort_key(value, movie_id)
+                bisect.insort(keys[field], key)
+                if director_id is not None:
+                    bisect.insort(director_keys(field, director_id), key)
+        return Ranking(revision, movies, keys, directors)
+
+    def top(self, field, limit, director_id=None):
+        if director_id is None:
+            keys = self._all[field]
+        else:
+            keys = self._directors[field].get(director_id, [])
+        return [-key[2] for key in keys[:limit]]
+
+
+class Rankings(object):
+    """Current Ranking of an app and the thread keeping it up to date"""
+
+    def __init__(self, app):
+        self.app = app
+        self.current = None
+        # serializes the writers, the readers never take it
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def build(self):
+        """Load every movie, at the current catalog revision"""
+        with self._lock:
+            self.current = Ranking.load()
+
+    def refresh(self):
+        """Rebuild the Ranking when the catalog revision moved
+
+        Returns:
+            bool: whether it was rebuilt
+        """
+        with self._lock:
+            revision, _ = catalog_revision()
+            if self.current is not None and revision == self.current.revision:
+                return False
+            self.current = Ranking.load()
+            return True
+
+    def update(self, movie_ids):
+        """Reload some movies after the commit of the write
+
+        The new Ranking takes the revision of the write only when it is
+        the single one since the current revision, else it keeps the
+        current one and the refresh thread rebuilds it.
+
+        Args:
+            movie_ids (iterable): ids of the created, updated or deleted movies
+        """
+        movie_ids = set(movie_ids)
+        with self._lock:
+            current = self.current
+            revision, _ = catalog_revision()
+            if revision != current.revision + 1:
+                revision = current.revision
+            self.current = current.replace(movie_ids, _rows(movie_ids),
+                                           revision)
+
+    def top(self, field, limit, director_id=None):
+        """Ids of the first movies sorted on a field
+
+        Reads the current Ranking as it is, without checking the catalog
+        revision.
+
+        Args:
+            field (string): field of FIELDS
+            limit (int): number of movies
+            director_id (int, optional): keep the movies of a director. Defaults to all.
+
+        Returns:
+            list: ids of the movies, first one first
+        """
+        if self._pid != os.getpid():
+            self.start()
+        return self.current.top(field, limit, director_id)
+
+    def start(self):
+        """Start the refresh thread of this process
+
+        Started by the first read of every worker, as the threads of a
+        gunicorn master do not survive the fork of its workers. A
+        RANKINGS_REFRESH of 0 leaves the rankings to the local writes.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            interval = self.app.config.get('RANKINGS_REFRESH',
+                                           DEFAULT_REFRESH)
+            if interval > 0:
+                threading.Thread(target=self._run,
+                                 args=(interval, ),
+                                 name='rankings-refresh',
+                                 daemon=True).start()
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            with self.app.app_context():
+                try:
+                    self.refresh()
+                except Exception:
+                    log.exception('Could not refresh the rankings')
+
+
+def get_rankings():
+    """Rankings of the current app, built on first use, at startup
+
+    Returns:
+        Rankings: rankings
+    """
+    app = current_app._get_current_object()
+    rankings = app.extensions.get('rankings')
+    if rankings is None:
+        rankings = Rankings(app)
+        rankings.build()
+        app.extensions['rankings'] = rankings
+    return rankings
+
+
+def update_rankings(movie_ids):
+    """Update the rankings after a write of movies, see Rankings.update"""
+    get_rankings().update(movie_ids)
@@ -0,0 +1,190 @@
+"""Send the reads of the API to a read replica
+
+With READ_REPLICA_URL set, the SELECTs of the handlers decorated with
+read_replica run on a second engine while every write, and every read
+of the other handlers, stays on DATABASE_URL. The replica is a server
+database kept in sync by the server, or a SQLite file opened read-only:
+the database file itself, read by the connections of every worker
+through a shared mmap, or a snapshot written by
+
+    python replicas.py snapshot.db
+
+which READ_REPLICA_IMMUTABLE=1 opens without any locking, as nothing
+writes it.
+
+A replica may lag the writes, so a client reading its own write sends
+X-Read-Consistency: strong to read that request from the primary.
+"""
+import functools
+import os
+import sys
+import threading
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+CONSISTENCY_HEADER = 'X-Read-Consistency'
+
+_engine_lock = threading.Lock()
+
+
+def sqlite_read_only_url(url, root, immutable=False):
+    """URL opening a SQLite file read-only
+
+    Args:
+        url (URL): sqlite url of the file
+        root (string): folder of relative paths, as Flask-SQLAlchemy does
+        immutable (bool, optional): the file never changes. Defaults to False.
+
+    Returns:
+        URL: url of a read-only connection
+    """
+    path = os.path.join(root, url.database)
+    query = {'mode': 'ro', 'uri': 'true'}
+    if immutable:
+        query['immutable'] = '1'
+    return url.set(database=f'file:{path}', query=query)
+
+
+def get_replica_engine(app=None):
+    """Engine of READ_REPLICA_URL, created once per process
+
+    Args:
+        app (Flask, optional): app of the settings. Defaults to current_app.
+
+    Returns:
+        Engine: replica engine, None without a replica
+    """
+    app = app or current_app._get_current_object()
+    key = (app.config.get('READ_REPLICA_URL'),
+           app.config.get('READ_REPLICA_IMMUTABLE', False))
+    if not key[0]:
+        return None
+    engines = app.extensions.setdefault('replica_engines', {})
+    engine = engines.get(key)
+    if engine is not None:
+        return engine
+    with _engine_lock:
+        if key not in engines:
+            engines[key] = _create_engine(app, *key)
+        return engines[key]
+
+
+def _create_engine(app, url, immutable):
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        # a pool of connections, a read-only file has no writer to wait
+        # for and its pages stay mapped between requests
+        engine = create_engine(
+            sqlite_read_only_url(url, app.root_path, immutable),
+            poolclass=QueuePool,
+            pool_size=app.config.get('READ_REPLICA_POOL_SIZE', 5),
+            max_overflow=0,
+            connect_args={'check_same_thread': False},
+            echo=app.config.get('SQLALCHEMY_ECHO', False))
+
+        @event.listens_for(engine, 'do_connect')
+        def read_only(dialect, record, cargs, cparams):
+            # config.sqlite_pragmas leaves the journal mode alone
+            record.info['read_only'] = True
+    else:
+        engine = create_engine(url,
+                               echo=app.config.get('SQLALCHEMY_ECHO', False),
+                               **app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+    return engine
+
+
+def dispose_engines(app):
+    """Close the pooled replica connections, in a forked worker"""
+    for engine in app.extensions.get('replica_engines', {}).values():
+        engine.dispose()
+
+
+def strong_consistency():
+    """Check if the request asked to read from the primary
+
+    Returns:
+        bool: True for X-Read-Consistency: strong
+    """
+    return (has_request_context() and request.headers.get(
+        CONSISTENCY_HEADER, '').strip().lower() == 'strong')
+
+
+def read_replica(function):
+    """Decorate a read handler to run its SELECTs on the replica
+
+    Nothing changes without a replica or when the request asks for
+    strong consistency. Left set on g for the rest of the request, so
+    streamed rows are read from the replica too.
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not strong_consistency():
+            g.read_replica = True
+        return function(*args, **kwargs)
+
+    return wrapper
+
+
+def reads_replica():
+    """Check if the SELECTs of the request go to the replica
+
+    Returns:
+        bool: True in a read_replica handler with a replica set up
+    """
+    return (has_request_context() and bool(g.get('read_replica'))
+            and get_replica_engine() is not None)
+
+
+class RoutingSession(SignallingSession):
+    """Session binding the SELECTs of read_replica handlers to the replica"""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if (has_request_context() and g.get('read_replica')
+                and not self._flushing
+                and getattr(clause, 'is_select', False)):
+            engine = get_replica_engine(self.app)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy whose session is a RoutingSession"""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def snapshot(path):
+    """Write a consistent copy of the SQLite database to path
+
+    The copy is written next to path then renamed over it, so a
+    replica opening path sees either snapshot. Open connections keep
+    reading the previous one until they are recycled.
+
+    Args:
+        path (string): file of the snapshot
+    """
+    # replicas is imported by config
+    from config import db
+
+    partial = f'{path}.{os.getpid()}'
+    if os.path.exists(partial):
+        os.remove(partial)
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql('VACUUM INTO ?', (partial, ))
+    os.replace(partial, path)
+
+
+if __name__ == '__main__':
+    import config
+    if len(sys.argv) != 2:
+        sys.exit('usage: python replicas.py SNAPSHOT_PATH')
+    path = os.path.abspath(sys.argv[1])
+    with config.app.app_context():
+        snapshot(path)
+    print(f'READ_REPLICA_URL=sqlite:///{path} READ_REPLICA_IMMUTABLE=1')
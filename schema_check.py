@@ -0,0 +1,94 @@
+import logging
+import os
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from config import basedir, db
+
+logger = logging.getLogger(__name__)
+
+# tables managed outside of the models, see search.py
+UNMANAGED_TABLES = ('movies_fts', 'directors_fts')
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Leave the full text search tables out of autogenerate
+
+    Returns:
+        bool: False for tables created by search.create_index
+    """
+    if type_ == 'table' and name.startswith(UNMANAGED_TABLES):
+        return False
+    return True
+
+
+def _script_directory():
+    alembic_config = Config(os.path.join(basedir, 'alembic.ini'))
+    alembic_config.set_main_option('script_location',
+                                   os.path.join(basedir, 'migrations'))
+    return ScriptDirectory.from_config(alembic_config)
+
+
+def head_revision():
+    """Latest revision of the migrations folder
+
+    Returns:
+        string: revision id
+    """
+    return _script_directory().get_current_head()
+
+
+def stamp_head(connection):
+    """Mark a database made with metadata.create_all as fully migrated
+
+    Args:
+        connection (Connection): connection to the database
+    """
+    MigrationContext.configure(connection).stamp(_script_directory(), 'head')
+
+
+def _describe(diff):
+    if isinstance(diff, list):
+        # column modifications come as a list of changes of one column
+        return '; '.join(_describe(change) for change in diff)
+    action = diff[0]
+    if action.startswith('modify_'):
+        # (action, schema, table, column, info, existing, new)
+        return f"{action} {diff[2]}.{diff[3]}: {diff[-2]} -> {diff[-1]}"
+    return f"{action} {getattr(diff[1], 'name', diff[1])}"
+
+
+def schema_drift():
+    """Differences between the live database and the models
+
+    Returns:
+        list: human readable differences, empty when in sync
+    """
+    with db.engine.connect() as connection:
+        context = MigrationContext.configure(
+            connection, opts={'include_object': include_object})
+        problems = [
+            _describe(diff)
+            for diff in compare_metadata(context, db.metadata)
+        ]
+        current = context.get_current_revision()
+
+    head = head_revision()
+    if current != head:
+        problems.insert(
+            0, f"database is at revision {current}, migrations head is "
+            f"{head}, run: alembic upgrade head")
+    return problems
+
+
+def check_schema():
+    """Log a warning for every difference between database and models
+
+    Returns:
+        list: differences found
+    """
+    problems = schema_drift()
+    for problem in problems:
+        logger.warning('schema drift: %s', problem)
+    return problems
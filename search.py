@@ -0,0 +1,202 @@
+import re
+from sqlalchemy import Column, Float, Integer, MetaData, Table, inspect, text
+from sqlalchemy import false, literal_column, or_
+from config import db
+from models import Movies
+
+MOVIE_COLUMNS = ('title', 'original_title', 'overview', 'tagline')
+DIRECTOR_COLUMNS = ('name', )
+
+# title matches outrank original_title, tagline and overview matches
+MOVIE_WEIGHTS = ('A', 'B', 'D', 'C')
+MOVIE_BM25 = 'bm25(10.0, 5.0, 1.0, 2.0)'
+
+_fts_metadata = MetaData()
+movies_fts = Table('movies_fts', _fts_metadata, Column('rowid', Integer),
+                   Column('rank', Float), Column('movies_fts', Integer))
+directors_fts = Table('directors_fts', _fts_metadata, Column('rowid', Integer),
+                      Column('rank', Float), Column('directors_fts', Integer))
+
+_backend = None
+
+
+def _sqlite_ddl(table, source, columns):
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    delete = (f"INSERT INTO {table}({table}, rowid, {names}) "
+              f"VALUES ('delete', old.id, {old});")
+    insert = f"INSERT INTO {table}(rowid, {names}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5({names}, "
+        f"content='{source}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {source} "
+        f"BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {source} "
+        f"BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE ON {source} "
+        f"BEGIN {delete} {insert} END",
+        f"INSERT INTO {table}({table}) VALUES ('rebuild')",
+    ]
+
+
+def _postgres_vector(columns, weights=None):
+    parts = []
+    for i, column in enumerate(columns):
+        vector = f"to_tsvector('english', coalesce({column}, ''))"
+        if weights:
+            vector = f"setweight({vector}, '{weights[i]}')"
+        parts.append(vector)
+    return ' || '.join(parts)
+
+
+def create_index(connection):
+    """Create the full text index of movies and directors if missing
+
+    On SQLite these are external content FTS5 tables kept in sync by
+    triggers on insert, update and delete, filled from the rows there.
+    On Postgres they are GIN expression indexes on the tsvector of the
+    same columns, which the database keeps in sync by itself. Run by
+    the add_full_text_search migration and by catalog.py on the
+    databases it fills, never by a request.
+
+    Args:
+        connection (Connection): connection of the migration or load
+
+    Returns:
+        bool: False when the database has no full text search
+    """
+    dialect = connection.dialect.name
+    existing = inspect(connection).get_table_names()
+
+    if dialect == 'sqlite':
+        if not connection.exec_driver_sql(
+                "SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar():
+            return False
+        statements = []
+        if 'movies_fts' not in existing:
+            statements += _sqlite_ddl('movies_fts', 'movies', MOVIE_COLUMNS)
+            statements.append("INSERT INTO movies_fts(movies_fts, rank) "
+                              f"VALUES ('rank', '{MOVIE_BM25}')")
+        if 'directors_fts' not in existing:
+            statements += _sqlite_ddl('directors_fts', 'directors',
+                                      DIRECTOR_COLUMNS)
+    elif dialect == 'postgresql':
+        statements = [
+            "CREATE INDEX IF NOT EXISTS movies_search_idx ON movies "
+            f"USING gin (({_postgres_vector(MOVIE_COLUMNS, MOVIE_WEIGHTS)}))",
+            "CREATE INDEX IF NOT EXISTS directors_search_idx ON directors "
+            f"USING gin (({_postgres_vector(DIRECTOR_COLUMNS)}))",
+        ]
+    else:
+        return False
+
+    for statement in statements:
+        connection.execute(text(statement))
+    return True
+
+
+def drop_index(connection):
+    """Drop what create_index created
+
+    Args:
+        connection (Connection): connection of the migration
+    """
+    if connection.dialect.name == 'sqlite':
+        for table in ('movies_fts', 'directors_fts'):
+            for trigger in ('ai', 'ad', 'au'):
+                connection.execute(text(f'DROP TRIGGER IF EXISTS '
+                                        f'{table}_{trigger}'))
+            connection.execute(text(f'DROP TABLE IF EXISTS {table}'))
+    elif connection.dialect.name == 'postgresql':
+        connection.execute(text('DROP INDEX IF EXISTS movies_search_idx'))
+        connection.execute(text('DROP INDEX IF EXISTS directors_search_idx'))
+
+
+def full_text_backend():
+    """Full text search of the database, looked up once per process
+
+    Reads the schema only: without the index of create_index the
+    searches fall back to LIKE.
+
+    Returns:
+        string: 'sqlite', 'postgresql' or None
+    """
+    global _backend
+
+    if _backend is None:
+        engine = db.engine
+        dialect = engine.dialect.name
+        if dialect == 'sqlite':
+            existing = inspect(engine).get_table_names()
+            found = {'movies_fts', 'directors_fts'} <= set(existing)
+            _backend = dialect if found else ''
+        else:
+            _backend = dialect if dialect == 'postgresql' else ''
+    return _backend or None
+
+
+def terms(query):
+    """Split a search string into words
+
+    Args:
+        query (string): text typed by the client
+
+    Returns:
+        list: list of words
+    """
+    return re.findall(r'\w+', query.lower())
+
+
+def _fts5_query(words):
+    # every word must match, the last one also as a prefix
+    quoted = [f'"{word}"' for word in words]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _tsquery(words):
+    return ' & '.join(words[:-1] + [words[-1] + ':*'])
+
+
+def _like(query, columns, words):
+    for word in words:
+        query = query.filter(or_(*[c.like(f'%{word}%') for c in columns]))
+    return query
+
+
+def search(query, model, words):
+    """Restrict and rank a query with the full text index
+
+    Args:
+        query (Query): query of Movies or Directors
+        model (Model): Movies or Directors
+        words (list): words returned by terms, all of them must match
+
+    Returns:
+        Query: query of the matching rows, best match first
+    """
+    if model is Movies:
+        fts, columns, weights = movies_fts, MOVIE_COLUMNS, MOVIE_WEIGHTS
+    else:
+        fts, columns, weights = directors_fts, DIRECTOR_COLUMNS, None
+
+    if not words:
+        return query.filter(false())
+
+    backend = full_text_backend()
+
+    if backend == 'sqlite':
+        return query.join(fts, fts.c.rowid == model.id).filter(
+            fts.c[fts.name].op('MATCH')(_fts5_query(words))).order_by(
+                fts.c.rank, model.id)
+
+    if backend == 'postgresql':
+        vector = literal_column(_postgres_vector(columns, weights))
+        tsquery = db.func.to_tsquery('english', _tsquery(words))
+        return query.filter(vector.op('@@')(tsquery)).order_by(
+            db.func.ts_rank(vector, tsquery).desc(), model.id)
+
+    return _like(query, [getattr(model, c) for c in columns],
+                 words).order_by(model.id)
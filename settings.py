@@ -0,0 +1,140 @@
+import os
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+# settings of every profile, APP_ENV picks one and the environment
+# variables of the same name override single values
+PROFILES = {
+    'dev': {
+        'DATABASE_URL': 'sqlite:///' + os.path.join(basedir, 'final_proj.db'),
+        'SQL_ECHO': True,
+        'DB_POOL_SIZE': 5,
+        'DB_MAX_OVERFLOW': 5,
+        'DB_POOL_RECYCLE': 1800,
+        'DB_POOL_PRE_PING': True,
+        'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+        'WEB_CONCURRENCY': 1,
+        'GUNICORN_THREADS': 1,
+        'INSTRUMENTATION': False,
+        'N_PLUS_ONE_THRESHOLD': 10,
+        'COMPRESSION': True,
+        'COMPRESS_MIN_SIZE': 1024,
+        'SPEC_CACHE': True,
+        'GUNICORN_PRELOAD': False,
+        'READ_REPLICA_URL': '',
+        'READ_REPLICA_IMMUTABLE': False,
+        'ANALYTICS_MAX_AGE': 60,
+        'RANKINGS_REFRESH': 5,
+    },
+    'test': {
+        'DATABASE_URL': 'sqlite:///' + os.path.join(basedir, 'final_proj.db'),
+        'SQL_ECHO': False,
+        'DB_POOL_SIZE': 5,
+        'DB_MAX_OVERFLOW': 0,
+        'DB_POOL_RECYCLE': 1800,
+        'DB_POOL_PRE_PING': False,
+        'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+        'WEB_CONCURRENCY': 1,
+        'GUNICORN_THREADS': 1,
+        'INSTRUMENTATION': False,
+        'N_PLUS_ONE_THRESHOLD': 10,
+        'COMPRESSION': True,
+        'COMPRESS_MIN_SIZE': 1024,
+        'SPEC_CACHE': True,
+        'GUNICORN_PRELOAD': False,
+        'READ_REPLICA_URL': '',
+        'READ_REPLICA_IMMUTABLE': False,
+        'ANALYTICS_MAX_AGE': 0,
+        'RANKINGS_REFRESH': 0,
+    },
+    'prod': {
+        'DATABASE_URL': 'sqlite:///' + os.path.join(basedir, 'final_proj.db'),
+        'SQL_ECHO': False,
+        'DB_POOL_SIZE': 10,
+        'DB_MAX_OVERFLOW': 10,
+        'DB_POOL_RECYCLE': 1800,
+        'DB_POOL_PRE_PING': True,
+        'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+        'WEB_CONCURRENCY': 2,
+        'GUNICORN_THREADS': 4,
+        'INSTRUMENTATION': False,
+        'N_PLUS_ONE_THRESHOLD': 10,
+        'COMPRESSION': True,
+        'COMPRESS_MIN_SIZE': 1024,
+        'SPEC_CACHE': True,
+        'GUNICORN_PRELOAD': True,
+        'READ_REPLICA_URL': '',
+        'READ_REPLICA_IMMUTABLE': False,
+        'ANALYTICS_MAX_AGE': 60,
+        'RANKINGS_REFRESH': 5,
+    },
+}
+DEFAULT_PROFILE = 'prod'
+
+
+def _parse(raw, default):
+    if isinstance(default, bool):
+        return raw.strip().lower() in ('1', 'true', 'yes', 'on')
+    if isinstance(default, int):
+        return int(raw)
+    return raw
+
+
+def database_url(url):
+    """Normalize a database url, Heroku still hands out postgres://
+
+    Args:
+        url (string): database url
+
+    Returns:
+        string: url SQLAlchemy accepts
+    """
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def load_settings(profile=None, environ=os.environ):
+    """Settings of a profile with the environment overrides applied
+
+    Args:
+        profile (string, optional): dev, test or prod. Defaults to APP_ENV or prod.
+        environ (dict, optional): environment variables. Defaults to os.environ.
+
+    Returns:
+        dict: settings, with the profile name under APP_ENV
+    """
+    profile = profile or environ.get('APP_ENV', DEFAULT_PROFILE)
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown APP_ENV: {profile}, use one of: "
+                         f"{', '.join(PROFILES)}")
+
+    settings = dict(PROFILES[profile], APP_ENV=profile)
+    for name, default in PROFILES[profile].items():
+        if environ.get(name):
+            settings[name] = _parse(environ[name], default)
+    settings['DATABASE_URL'] = database_url(settings['DATABASE_URL'])
+    settings['READ_REPLICA_URL'] = database_url(settings['READ_REPLICA_URL'])
+    return settings
+
+
+def engine_options(settings):
+    """SQLALCHEMY_ENGINE_OPTIONS for the settings of a profile
+
+    SQLite files use a new connection per checkout, so the pool options
+    only apply to server databases.
+
+    Args:
+        settings (dict): settings from load_settings
+
+    Returns:
+        dict: keyword arguments for create_engine
+    """
+    if settings['DATABASE_URL'].startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': settings['DB_POOL_SIZE'],
+        'max_overflow': settings['DB_MAX_OVERFLOW'],
+        'pool_recycle': settings['DB_POOL_RECYCLE'],
+        'pool_pre_ping': settings['DB_POOL_PRE_PING'],
+    }
@@ -0,0 +1,118 @@
+"""Cache of the loaded and validated swagger.yml
+
+Parsing the YAML and validating it with openapi-spec-validator is most
+of the time add_api takes. The first start writes the validated spec as
+JSON under CACHE_DIR, keyed by the hash of the file and the connexion
+version; later starts load the JSON and skip the validation, which the
+same file already passed.
+
+    python spec_cache.py    # validate swagger.yml and fill the cache
+"""
+import copy
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+import connexion
+import yaml
+from connexion.spec import OpenAPISpecification, Specification
+from connexion.spec import Swagger2Specification
+
+CACHE_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)),
+                         '.cache')
+Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def cache_path(path, cache_dir=CACHE_DIR):
+    """File caching the spec at path, named after its content
+
+    Args:
+        path (string): spec file
+        cache_dir (string, optional): cache folder. Defaults to CACHE_DIR.
+
+    Returns:
+        string: path of the JSON file
+    """
+    with open(path, 'rb') as source:
+        digest = hashlib.sha256(source.read())
+    digest.update(connexion.__version__.encode())
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f'{name}-{digest.hexdigest()[:16]}.json')
+
+
+def load_spec(path, cache_dir=CACHE_DIR):
+    """Spec at path as a dict, validated on a cache miss only
+
+    Args:
+        path (string): spec file
+        cache_dir (string, optional): cache folder. Defaults to CACHE_DIR.
+
+    Returns:
+        tuple: spec dict and True when it came from the cache
+    """
+    cached = cache_path(path, cache_dir)
+    try:
+        with open(cached) as source:
+            return json.load(source), True
+    except (OSError, ValueError):
+        pass
+
+    with open(path) as source:
+        # the JSON round trip turns the integer keys (status codes) to
+        # strings, as connexion does
+        spec = json.loads(json.dumps(yaml.load(source, Loader=Loader)))
+    # raises InvalidSpecification, on a copy as the validator adds keys
+    # to the parameters
+    Specification.from_dict(copy.deepcopy(spec))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        partial = f'{cached}.{os.getpid()}'
+        with open(partial, 'w') as out:
+            json.dump(spec, out)
+        os.replace(partial, cached)
+    except OSError:
+        # a read-only checkout still starts, it only parses every time
+        pass
+    return spec, False
+
+
+@contextmanager
+def validated(specification_class):
+    """Let connexion trust specs inside the block
+
+    connexion validates any spec given to add_api and has no option to
+    skip it, so the validation is switched off for the block only.
+    """
+    validate = specification_class.__dict__['_validate_spec']
+    specification_class._validate_spec = classmethod(lambda cls, spec: None)
+    try:
+        yield
+    finally:
+        specification_class._validate_spec = validate
+
+
+def add_api(connex_app, path, cache_dir=CACHE_DIR, **kwargs):
+    """connex_app.add_api(path), through the cache
+
+    The spec is validated by load_spec, when it first meets the file,
+    so connexion does not validate it again.
+
+    Args:
+        connex_app (App): connexion app
+        path (string): spec file
+        cache_dir (string, optional): cache folder. Defaults to CACHE_DIR.
+
+    Returns:
+        Api: the connexion api
+    """
+    spec, _ = load_spec(path, cache_dir)
+    version = Specification._get_spec_version(spec)
+    with validated(Swagger2Specification if version < (
+            3, 0, 0) else OpenAPISpecification):
+        return connex_app.add_api(spec, **kwargs)
+
+
+if __name__ == '__main__':
+    spec, hit = load_spec(os.path.join(os.path.dirname(CACHE_DIR),
+                                       'swagger.yml'))
+    print('cached' if hit else f'validated and cached in {CACHE_DIR}')
@@ -0,0 +1,157 @@
+from flask import abort
+from sqlalchemy import Integer, cast, func
+from config import db
+from models import Directors, DirectorStats, Movies
+from pagination import page_headers, paginate
+from query_engine import filter_clauses, sort_keys
+from bulk import chunked
+
+# fields clients can sort and filter the leaderboard on, all of them
+# are indexed together with director_id
+FIELDS = {
+    'director_id': DirectorStats.director_id,
+    'movie_count': DirectorStats.movie_count,
+    'budget_total': DirectorStats.budget_total,
+    'revenue_total': DirectorStats.revenue_total,
+    'vote_count_total': DirectorStats.vote_count_total,
+    'vote_average_mean': DirectorStats.vote_average_mean,
+    'weighted_rating': DirectorStats.weighted_rating,
+}
+
+
+def _totals():
+    """Aggregate columns of the movies of a director, in FIELDS order"""
+    return [
+        func.count(Movies.id),
+        func.coalesce(func.sum(Movies.budget), 0),
+        func.coalesce(func.sum(Movies.revenue), 0),
+        func.coalesce(func.sum(Movies.vote_count), 0),
+        func.avg(Movies.vote_average),
+        func.sum(Movies.vote_average * Movies.vote_count) /
+        func.nullif(func.sum(Movies.vote_count), 0),
+    ]
+
+
+def totals_query(director_ids=None):
+    """SELECT of the totals of every director with movies, one row each
+
+    Args:
+        director_ids (list, optional): directors to total. Defaults to all.
+
+    Returns:
+        Select: director_id followed by the totals
+    """
+    query = db.select([Movies.director_id, *_totals()])
+    if director_ids is not None:
+        query = query.where(Movies.director_id.in_(director_ids))
+    return query.where(Movies.director_id.isnot(None)).group_by(
+        Movies.director_id)
+
+
+def refresh_directors(director_ids):
+    """Recompute the summary rows of some directors
+
+    Called by every handler writing movies, before its commit, so the
+    summary changes in the same transaction as the movies. Only the
+    movies of the given directors are read, through the director_id
+    index. A director left without movies loses its row.
+
+    Args:
+        director_ids (iterable): ids of the directors whose movies changed
+    """
+    db.session.flush()
+    table = DirectorStats.__table__
+    columns = list(FIELDS)
+    for chunk in chunked(set(director_ids)):
+        db.session.execute(
+            table.delete().where(table.c.director_id.in_(chunk)))
+        db.session.execute(table.insert().from_select(
+            columns, totals_query(chunk)))
+
+
+def rebuild(connection):
+    """Recompute the whole summary table
+
+    Used after loads that bypass the handlers, like catalog import.
+
+    Args:
+        connection (Connection): connection inside a transaction
+    """
+    table = DirectorStats.__table__
+    connection.execute(table.delete())
+    connection.execute(table.insert().from_select(list(FIELDS),
+                                                  totals_query()))
+
+
+def _stats(row):
+    return {name: getattr(row, name) for name in ['name', *FIELDS]}
+
+
+def read_director(director_id):
+    """GET the totals of the movies of one director
+
+    Computed live with a GROUP BY over the movies of the director.
+
+    Args:
+        director_id (int): id of the director
+
+    Returns:
+        dict: name and totals of the director
+    """
+    director = Directors.query.filter(
+        Directors.id == director_id).one_or_none()
+    if director is None:
+        abort(404, f"Director not found for Id: {director_id}")
+
+    totals = db.session.execute(
+        db.select(_totals()).where(
+            Movies.director_id == director_id)).one()
+    return {
+        'director_id': director.id,
+        'name': director.name,
+        **dict(zip(list(FIELDS)[1:], totals)),
+    }
+
+
+def read_directors(sort='-weighted_rating',
+                   filter=None,
+                   cursor=None,
+                   page_size=None):
+    """GET the leaderboard of directors, read from the summary table
+
+    Every sort field is indexed with director_id, so a page costs an
+    index range scan whatever the size of the catalog. The X-Next-Cursor
+    header holds the cursor of the next page unless it is the last one.
+
+    Args:
+        sort (str, optional): comma separated fields, '-' for desc. Defaults to '-weighted_rating'.
+        filter (list, optional): conditions like 'movie_count>=5'. Defaults to None.
+        cursor (str, optional): X-Next-Cursor of the previous page. Defaults to None.
+        page_size (int, optional): directors per page. Defaults to None.
+
+    Returns:
+        list: page of director totals
+    """
+    keys = sort_keys(sort, FIELDS, DirectorStats.director_id)
+    query = db.session.query(*FIELDS.values(), Directors.name).join(
+        Directors, Directors.id == DirectorStats.director_id).filter(
+            *filter_clauses(filter, FIELDS))
+
+    rows, next_cursor = paginate(query, keys, cursor, page_size)
+    return [_stats(row) for row in rows], 200, page_headers(next_cursor)
+
+
+def read_years():
+    """GET the number of movies released every year, with their totals
+
+    Returns:
+        list: one dict per year with movies, oldest first
+    """
+    year = cast(func.substr(Movies.release_date, 1, 4), Integer).label('year')
+    # grouping by the label keeps Postgres from comparing two copies of
+    # the substr expression with different bound parameters
+    query = db.select([year, *_totals()]).where(
+        func.length(Movies.release_date) >= 4).group_by(year).order_by(year)
+
+    names = ['year', *list(FIELDS)[1:]]
+    return [dict(zip(names, row)) for row in db.session.execute(query)]
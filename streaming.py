@@ -0,0 +1,41 @@
+from flask import Response, request, stream_with_context
+import fastjson
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_BATCH_SIZE = 500
+
+
+def wants_stream(stream=False):
+    """Check if the client asked for a streamed response
+
+    Args:
+        stream (bool, optional): value of the stream query parameter. Defaults to False.
+
+    Returns:
+        bool: True for stream=true or an Accept header preferring NDJSON
+    """
+    if stream:
+        return True
+    return request.accept_mimetypes.best_match(
+        ['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def stream_rows(query, dump):
+    """Send the rows of a query as newline delimited JSON
+
+    Rows are fetched STREAM_BATCH_SIZE at a time and each one is dumped
+    and written out on its own, so memory does not grow with the result.
+
+    Args:
+        query (Query): query to stream, already ordered and limited
+        dump (function): function dumping a single row, see serializers
+
+    Returns:
+        Response: chunked NDJSON response
+    """
+
+    def generate():
+        for row in query.yield_per(STREAM_BATCH_SIZE):
+            yield fastjson.dumps(dump(row)) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
@@ -0,0 +1,116 @@
+"""Seeded synthetic catalog, shaped like final_proj.db but of any size
+
+The distributions follow the bundled data: most directors have one
+movie and a few have dozens (Pareto, alpha 1.4), popularity and vote
+counts are long tailed (lognormal), a fifth of the movies have no
+budget and overviews run to about 50 words.
+"""
+import random
+
+# number of movies of every fixture size
+SIZES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000,
+}
+MAX_MOVIES_PER_DIRECTOR = 200
+
+FIRST_NAMES = [
+    'James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael',
+    'Linda', 'David', 'Akira', 'Sofia', 'Luc', 'Agnes', 'Wong', 'Pedro',
+    'Kathryn', 'Satyajit', 'Ingmar', 'Chantal', 'Bong', 'Andrei', 'Jane',
+    'Spike', 'Claire', 'Hayao', 'Greta', 'Federico', 'Ava', 'Yasujiro',
+    'Lucrecia'
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Kurosawa', 'Varda', 'Almodovar', 'Bigelow', 'Ray',
+    'Bergman', 'Akerman', 'Tarkovsky', 'Campion', 'Lee', 'Denis', 'Miyazaki',
+    'Gerwig', 'Fellini', 'DuVernay', 'Ozu', 'Martel', 'Nolan', 'Scott',
+    'Kar-wai', 'Besson', 'Joon-ho', 'Anderson', 'Coppola', 'Herzog', 'Lynch',
+    'Sciamma', 'Haneke'
+]
+WORDS = [
+    'the', 'of', 'night', 'love', 'man', 'star', 'dark', 'war', 'city',
+    'last', 'return', 'house', 'blood', 'dream', 'king', 'island', 'secret',
+    'summer', 'shadow', 'road', 'river', 'fire', 'ghost', 'heart', 'game',
+    'story', 'world', 'lost', 'wild', 'time', 'black', 'red', 'girl', 'boy',
+    'day', 'life', 'death', 'and', 'a', 'in', 'to', 'from', 'with', 'after',
+    'before', 'beyond', 'under', 'zombie', 'machine', 'family', 'mother',
+    'father', 'brother', 'sister', 'journey', 'murder', 'kiss', 'storm'
+]
+
+
+def _words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(max(1, count)))
+
+
+def director_row(rng, director_id):
+    return {
+        'id': director_id,
+        'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+        'gender': rng.choices([0, 1, 2], [0.27, 0.06, 0.67])[0],
+        'uid': director_id,
+        'department': 'Directing',
+    }
+
+
+def movie_row(rng, movie_id, director_id):
+    title = _words(rng, int(rng.lognormvariate(0.9, 0.5))).title()
+    popularity = int(rng.lognormvariate(2.4, 1.2))
+    vote_count = int(popularity * rng.lognormvariate(3.0, 0.8))
+    budget = (0 if rng.random() < 0.21 else int(
+        rng.lognormvariate(16.8, 1.1)))
+    year = max(1916, 2017 - int(rng.expovariate(1 / 14)))
+    return {
+        'id': movie_id,
+        'original_title': title,
+        'budget': budget,
+        'popularity': min(popularity, 900),
+        'release_date': f'{year}-{rng.randint(1, 12):02d}-'
+        f'{rng.randint(1, 28):02d}',
+        'revenue': (0 if budget == 0 or rng.random() < 0.1 else int(
+            budget * rng.lognormvariate(0.8, 1.0))),
+        'title': title,
+        'vote_average': (0.0 if vote_count == 0 else round(
+            min(10.0, max(0.5, rng.gauss(6.2, 1.0))), 1)),
+        'vote_count': vote_count,
+        'overview': _words(rng, int(rng.lognormvariate(3.8, 0.4))).capitalize(),
+        'tagline': (None if rng.random() < 0.17 else _words(
+            rng, int(rng.lognormvariate(1.8, 0.4))).capitalize()),
+        'uid': movie_id,
+        'director_id': director_id,
+    }
+
+
+def generate(movies, seed=0, batch_size=5000):
+    """Directors and movies rows, a batch at a time
+
+    The same seed always gives the same rows, whatever the batch size.
+    Ids and uids start at 1.
+
+    Args:
+        movies (int): number of movies
+        seed (int, optional): random seed. Defaults to 0.
+        batch_size (int, optional): about how many movies per batch. Defaults to 5000.
+
+    Returns:
+        generator: tuples of a list of director rows and a list of the
+            rows of their movies
+    """
+    rng = random.Random(seed)
+    directors, batch = [], []
+    director_id = movie_id = 0
+    while movie_id < movies:
+        director_id += 1
+        directors.append(director_row(rng, director_id))
+        count = min(int(rng.paretovariate(1.4)), MAX_MOVIES_PER_DIRECTOR,
+                    movies - movie_id)
+        for _ in range(count):
+            movie_id += 1
+            batch.append(movie_row(rng, movie_id, director_id))
+        if len(batch) >= batch_size:
+            yield directors, batch
+            directors, batch = [], []
+    if directors:
+        yield directors, batch
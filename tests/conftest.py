@@ -0,0 +1,18 @@
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault('APP_ENV', 'test')
+
+# the tests write, so they run on a copy of the shipped database
+_workdir = tempfile.mkdtemp()
+if not os.environ.get('DATABASE_URL'):
+    database = os.path.join(_workdir, 'final_proj.db')
+    shutil.copy(
+        os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                     'final_proj.db'), database)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + database
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_workdir, ignore_errors=True)
@@ -0,0 +1,112 @@
+import json
+import random
+import statistics
+import pytest
+import config
+from app import connex_app
+from models import Movies
+
+np = pytest.importorskip('numpy')
+
+client = connex_app.test_client()
+
+mock_request_headers = {'Content-Type': 'application/json'}
+
+
+def test_years_match_stats():
+    """
+    test the yearly totals of the snapshot are the ones of the SQL stats
+    """
+    years = client.get('/api/analytics/years').get_json()
+    expected = client.get('/api/stats/years').get_json()
+    assert [row['year'] for row in years] == [row['year'] for row in expected]
+    for row, sql in zip(years, expected):
+        for field in ('movie_count', 'budget_total', 'revenue_total',
+                      'vote_count_total'):
+            assert row[field] == sql[field]
+        for field in ('vote_average_mean', 'weighted_rating'):
+            assert row[field] == pytest.approx(sql[field])
+
+
+def test_directors_match_stats():
+    """
+    test the director totals of the snapshot are the ones of the SQL stats,
+    in the order asked
+    """
+    rows = client.get('/api/analytics/directors?sort=-movie_count&limit=5'
+                      ).get_json()
+    counts = [row['movie_count'] for row in rows]
+    assert counts == sorted(counts, reverse=True)
+    for row in rows:
+        sql = client.get(f"/api/director/{row['director_id']}/stats"
+                         ).get_json()
+        assert row['name'] == sql['name']
+        assert row['budget_total'] == sql['budget_total']
+        assert row['weighted_rating'] == pytest.approx(sql['weighted_rating'])
+
+    rois = [
+        row['roi'] for row in client.get(
+            '/api/analytics/directors?min_movies=3&limit=50').get_json()
+    ]
+    assert rois == sorted(rois, reverse=True)
+
+
+def test_distribution_of_a_column():
+    """
+    test histograms and percentiles count every movie with a value
+    """
+    with config.app.app_context():
+        values = [
+            value for value, in config.db.session.query(Movies.vote_average)
+            if value is not None
+        ]
+
+    res = client.get('/api/analytics/histogram?field=vote_average&bins=10')
+    histogram = res.get_json()
+    assert len(histogram['edges']) == 11
+    assert sum(histogram['counts']) == len(values)
+    assert histogram['edges'][-1] == max(values)
+
+    res = client.get('/api/analytics/percentiles?field=vote_average&q=50')
+    assert res.get_json()['percentiles'][0]['value'] == pytest.approx(
+        statistics.median(values))
+    assert client.get('/api/analytics/percentiles?field=vote_average&q=101'
+                      ).status_code == 400
+    assert client.get('/api/analytics/histogram?field=title').status_code == 400
+
+    matrix = client.get('/api/analytics/correlations?fields=budget,revenue'
+                        ).get_json()['matrix']
+    assert matrix[0][1] == matrix[1][0]
+    assert 0 < matrix[0][1] < 1
+
+
+def test_snapshot_follows_writes():
+    """
+    test a write is in the next report
+    """
+    budget = 10**12
+    res = client.post('/api/movie/4768/movie',
+                      data=json.dumps({
+                          'title': 'Analytics Outlier',
+                          'budget': budget,
+                          'uid': random.randint(1000000, 9000000),
+                      }),
+                      headers=mock_request_headers)
+    assert res.status_code == 201
+    movie_id = res.get_json()['id']
+
+    res = client.get('/api/analytics/histogram?field=budget&bins=2')
+    assert res.get_json()['edges'][-1] == budget
+
+    client.delete(f'/api/director/4768/movie/{movie_id}')
+    res = client.get('/api/analytics/histogram?field=budget&bins=2')
+    assert res.get_json()['edges'][-1] < budget
+
+
+def test_without_numpy(monkeypatch):
+    """
+    test the reports answer 501 without numpy
+    """
+    import analytics
+    monkeypatch.setattr(analytics, 'np', None)
+    assert client.get('/api/analytics/years').status_code == 501
@@ -1,17 +1,41 @@
+import gzip
 import json
 import random
+from contextlib import contextmanager
+from sqlalchemy import event
 import config
+from app import connex_app
+from cache import ResponseCache, get_cache
 from models import Directors, DirectorsSchema, Movies, MoviesSchema
-
-connex_app = config.connex_app
-connex_app.add_api('swagger.yml')
-connex_app = connex_app.app
+from rankings import get_rankings
+from schema_check import schema_drift
+from serializers import serializer
+from versions import bump_revision
 
 client = connex_app.test_client()
 
 mock_request_headers = {'Content-Type': 'application/json'}
 
 
+@contextmanager
+def count_queries():
+    """
+    count SELECT statements sent to the database inside the block
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    engine = config.db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
 def test_director_read_all():
     """
     test GET director
@@ -69,9 +93,9 @@ def test_director_read_one_404():
     assert data['title'] == "Not Found"
 
 
-def test_post_director_500():
+def test_post_director_400():
     """
-    test post with wrong value
+    test post with wrong value is refused
     """
     url = '/api/director'
     mock_data_fail = {"department": ""}
@@ -79,7 +103,7 @@ def test_post_director_500():
     res = client.post(url,
                       data=json.dumps(mock_data_fail),
                       headers=mock_request_headers)
-    assert res.status_code == 500
+    assert res.status_code == 400
 
 
 mock_data_director = {
@@ -270,3 +294,1021 @@ def test_delete_movie():
     url = f"/api/director/{director_id}/movie/{data['id']}"
     res = client.delete(url)
     assert res.status_code == 200
+
+
+###################################################################################################################
+
+
+def test_director_read_all_query_count():
+    """
+    test director list runs the same number of queries whatever the size
+    """
+    with count_queries() as small:
+        client.get('/api/director?limit=5')
+    with count_queries() as large:
+        client.get('/api/director?limit=400')
+
+    # the catalog revision of the ETag, the directors and their movies
+    assert len(small) == len(large) == 3
+
+
+def test_director_search_query_count():
+    """
+    test director search does not load movies per director
+    """
+    client.get('/api/director/search?name=a&limit=1')
+    with count_queries() as queries:
+        response = client.get('/api/director/search?name=a&limit=300')
+
+    assert response.status_code == 200
+    assert len(queries) == 2
+
+
+def test_movie_read_all_query_count():
+    """
+    test movie list loads directors in the same query
+    """
+    with count_queries() as small:
+        client.get('/api/movie?limit=5')
+    with count_queries() as large:
+        client.get('/api/movie?limit=500')
+
+    # the catalog revision of the ETag and the movies
+    assert len(small) == len(large) == 2
+
+
+def test_director_read_all_pages():
+    """
+    test walking director pages with the cursor
+    """
+    url = '/api/director?order_by=name&order=desc&page_size=400'
+    expected = [
+        d['id'] for d in json.loads(
+            client.get('/api/director?order_by=name&order=desc&limit=1000'
+                       ).get_data())
+    ]
+
+    seen = []
+    page = client.get(url)
+    while len(seen) < len(expected):
+        seen.extend(d['id'] for d in page.get_json())
+        page = client.get(f"{url}&cursor={page.headers['X-Next-Cursor']}")
+
+    assert seen[:len(expected)] == expected
+
+
+def test_movie_read_all_last_page():
+    """
+    test the last movie page has no next cursor
+    """
+    page_size = 1000
+    url = f'/api/movie?page_size={page_size}'
+    page = client.get(url)
+    pages = 1
+    while 'X-Next-Cursor' in page.headers:
+        page = client.get(f"{url}&cursor={page.headers['X-Next-Cursor']}")
+        pages += 1
+
+    count = Movies.query.count()
+    full, rest = divmod(count, page_size)
+    assert pages == full + (rest > 0)
+    assert len(page.get_json()) == (rest or page_size)
+
+
+def test_read_all_limits():
+    """
+    test a list is always a page, a search without a limit is the first
+    page of matches and a limit beyond the largest page is a 400
+    """
+    res = client.get('/api/movie?limit=3')
+    assert len(res.get_json()) == 3
+    second = client.get('/api/movie?limit=3&cursor=' +
+                        res.headers['X-Next-Cursor'])
+    assert len(second.get_json()) == 3
+    assert len(client.get('/api/director').get_json()) == 100
+
+    assert client.get('/api/movie?limit=1001').status_code == 400
+    assert client.get('/api/director?limit=0').status_code == 400
+    assert client.get('/api/movie/search?title=the&limit=1001'
+                      ).status_code == 400
+    assert len(client.get('/api/movie/search?title=the').get_json()) == 100
+    assert len(client.get('/api/movie/search?title=the&limit=1000'
+                          ).get_json()) == 1000
+    assert len(client.get('/api/movie/search?title=the&stream=true'
+                          ).get_data().splitlines()) > 1000
+
+
+def test_movie_read_all_bad_cursor():
+    """
+    test invalid cursor
+    """
+    response = client.get('/api/movie?cursor=notacursor')
+
+    assert response.status_code == 400
+
+
+def test_director_read_all_stream():
+    """
+    test streaming every director as NDJSON
+    """
+    response = client.get('/api/director?stream=true')
+    lines = response.get_data().decode().splitlines()
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert len(lines) == Directors.query.count()
+    assert 'movies' in json.loads(lines[0])
+
+
+def test_movie_search_stream_accept():
+    """
+    test streaming movie search negotiated with the Accept header
+    """
+    response = client.get('/api/movie/search?title=man&limit=7',
+                          headers={'Accept': 'application/x-ndjson'})
+    lines = response.get_data().decode().splitlines()
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert len(lines) == 7
+
+
+def test_movie_search_ranked():
+    """
+    test movie search puts title matches first
+    """
+    response = client.get('/api/movie/search?title=iron man')
+    data = json.loads(response.get_data())
+
+    assert response.status_code == 200
+    assert data[0]['title'].startswith('Iron Man')
+    assert any('iron' not in m['title'].lower() for m in data)
+
+
+def test_movie_search_index_sync():
+    """
+    test created, updated and deleted movies are found by search
+    """
+    director_id = 4768
+    movie = dict(mock_data_movie, title='Zyxwvut Search', uid=998877)
+    res = client.post(f'/api/movie/{director_id}/movie',
+                      data=json.dumps(movie),
+                      headers=mock_request_headers)
+    movie_id = json.loads(res.get_data())['id']
+    found = json.loads(client.get('/api/movie/search?title=zyxwv').get_data())
+    assert [m['id'] for m in found] == [movie_id]
+
+    movie['title'] = 'Qwertyu Search'
+    client.put(f'/api/director/{director_id}/movie/{movie_id}',
+               data=json.dumps(movie),
+               headers=mock_request_headers)
+    assert json.loads(
+        client.get('/api/movie/search?title=zyxwvut').get_data()) == []
+    assert len(
+        json.loads(
+            client.get('/api/movie/search?title=qwertyu').get_data())) == 1
+
+    client.delete(f'/api/director/{director_id}/movie/{movie_id}')
+    assert json.loads(
+        client.get('/api/movie/search?title=qwertyu').get_data()) == []
+
+
+def test_director_search_ranked():
+    """
+    test director search matches words of the name
+    """
+    response = client.get('/api/director/search?name=james cam')
+    data = json.loads(response.get_data())
+
+    assert response.status_code == 200
+    assert data[0]['name'] == 'James Cameron'
+
+
+def test_director_read_one_cache():
+    """
+    test second read of a director is served from the cache
+    """
+    director_id = 4762
+    client.get(f'/api/director/{director_id}')
+    before = json.loads(client.get('/api/cache').get_data())
+
+    with count_queries() as queries:
+        response = client.get(f'/api/director/{director_id}')
+    after = json.loads(client.get('/api/cache').get_data())
+
+    assert response.status_code == 200
+    assert queries == []
+    assert after['hits'] == before['hits'] + 1
+
+
+def test_movie_update_invalidates_director():
+    """
+    test updating a movie evicts the cached movie and its director
+    """
+    director_id = 4768
+    res = client.post(f'/api/movie/{director_id}/movie',
+                      data=json.dumps(dict(mock_data_movie, uid=445566)),
+                      headers=mock_request_headers)
+    movie_id = json.loads(res.get_data())['id']
+    movie_url = f'/api/director/{director_id}/movie/{movie_id}'
+    client.get(movie_url)
+    client.get(f'/api/director/{director_id}')
+
+    client.put(movie_url,
+               data=json.dumps(dict(mock_data_movie, uid=445566,
+                                    popularity=77)),
+               headers=mock_request_headers)
+    movie = json.loads(client.get(movie_url).get_data())
+    director = json.loads(client.get(f'/api/director/{director_id}').get_data())
+    client.delete(movie_url)
+
+    assert movie['popularity'] == 77
+    assert [m['popularity'] for m in director['movies']
+            if m['id'] == movie_id] == [77]
+    assert client.get(movie_url).status_code == 404
+
+
+def test_cache_size_cap():
+    """
+    test the cache evicts least recently used entries over its byte cap
+    """
+    cache = ResponseCache(max_bytes=100)
+    cache.set(('a', ), 'x' * 40, 1)
+    cache.set(('b', ), 'y' * 40, 1)
+    cache.get(('a', ))
+    cache.set(('c', ), 'z' * 40, 2)
+
+    assert cache.get(('b', )) is None
+    assert cache.get(('a', )) == 'x' * 40
+    assert cache.stats()['evictions'] == 1
+    assert cache.size <= 100
+
+    cache.invalidate(1)
+    assert cache.get(('a', )) is None
+    assert cache.get(('c', )) == 'z' * 40
+
+
+def test_schema_in_sync():
+    """
+    test the database has every index and migration the models expect
+    """
+    with connex_app.app_context():
+        assert schema_drift() == []
+
+
+def test_director_bulk():
+    """
+    test bulk create, update and delete of directors
+    """
+    uid = random.randint(1000000, 9000000)
+    directors = [{
+        "department": "Directing",
+        "gender": 1,
+        "name": f"Bulk Director {i}",
+        "uid": uid + i
+    } for i in range(3)]
+    # the first one repeats a uid already used in the request
+    res = client.post('/api/director/bulk',
+                      data=json.dumps(directors + [directors[0], {
+                          "name": "No uid"
+                      }]),
+                      headers=mock_request_headers)
+    data = json.loads(res.get_data())
+
+    assert res.status_code == 207
+    assert [item['status'] for item in data] == [201, 201, 201, 409, 400]
+    ids = [item['id'] for item in data[:3]]
+
+    res = client.patch('/api/director/bulk',
+                       data=json.dumps([{
+                           "id": ids[0],
+                           "gender": 2
+                       }, {
+                           "id": ids[1],
+                           "uid": uid + 2
+                       }, {
+                           "id": 1,
+                           "gender": 2
+                       }]),
+                       headers=mock_request_headers)
+    data = json.loads(res.get_data())
+
+    assert [item['status'] for item in data] == [200, 409, 404]
+    director = json.loads(client.get(f'/api/director/{ids[0]}').get_data())
+    assert director['gender'] == 2
+    assert director['name'] == 'Bulk Director 0'
+
+    res = client.delete(f"/api/director/bulk?ids={','.join(map(str, ids))}")
+
+    assert res.status_code == 200
+    assert client.get(f'/api/director/{ids[0]}').status_code == 404
+
+
+def test_movie_bulk():
+    """
+    test bulk create, update and delete of movies
+    """
+    director_id = 4768
+    movies = [
+        dict(mock_data_movie, uid=7000000 + i, director_id=director_id,
+             title=f'Bulk Movie {i}') for i in range(3)
+    ]
+    res = client.post('/api/movie/bulk',
+                      data=json.dumps(movies + [
+                          dict(movies[0], uid=7000009, director_id=1),
+                          dict(movies[0], uid=19995)
+                      ]),
+                      headers=mock_request_headers)
+    data = json.loads(res.get_data())
+
+    assert res.status_code == 207
+    assert [item['status'] for item in data] == [201, 201, 201, 404, 409]
+    ids = [item['id'] for item in data[:3]]
+
+    res = client.patch('/api/movie/bulk',
+                       data=json.dumps([{
+                           "id": movie_id,
+                           "popularity": 99
+                       } for movie_id in ids]),
+                       headers=mock_request_headers)
+    director = json.loads(client.get(f'/api/director/{director_id}').get_data())
+
+    assert res.status_code == 200
+    assert [m['popularity'] for m in director['movies']
+            if m['id'] in ids] == [99, 99, 99]
+
+    res = client.delete(f"/api/movie/bulk?ids={','.join(map(str, ids))},1")
+    data = json.loads(res.get_data())
+
+    assert res.status_code == 207
+    assert [item['status'] for item in data] == [200, 200, 200, 404]
+    assert Movies.query.filter(Movies.id.in_(ids)).count() == 0
+
+
+def test_movie_read_all_sort_and_filter():
+    """
+    test multi-key sort and range filters on movies
+    """
+    url = ('/api/movie?limit=1000&sort=-vote_average,title'
+           '&filter=release_date>=2000&filter=vote_average>7'
+           '&filter=popularity<=100')
+    data = json.loads(client.get(url).get_data())
+
+    assert len(data) > 0
+    assert all(m['release_date'] >= '2000' for m in data)
+    assert all(m['vote_average'] > 7 and m['popularity'] <= 100 for m in data)
+    assert data == sorted(data, key=lambda m: (-m['vote_average'], m['title']))
+
+
+def test_director_read_all_filter_pages():
+    """
+    test filtered directors pages
+    """
+    url = ('/api/director?page_size=50&sort=-name'
+           '&filter=gender=2&filter=department=Directing')
+    page = client.get(url)
+    second = client.get(f"{url}&cursor={page.headers['X-Next-Cursor']}")
+    directors = page.get_json() + second.get_json()
+    names = [d['name'] for d in directors]
+
+    assert len(names) == 100
+    assert names == sorted(names, reverse=True)
+    assert all(d['gender'] == 2 for d in directors)
+
+
+def test_read_all_unknown_field():
+    """
+    test sorting or filtering on a field that is not allowed
+    """
+    assert client.get('/api/movie?sort=overview').status_code == 400
+    assert client.get('/api/movie?filter=budget>1').status_code == 400
+    assert client.get('/api/director?filter=gender>two').status_code == 400
+    assert client.get('/api/director?order_by=movies').status_code == 400
+
+
+def test_director_read_all_fields():
+    """
+    test sparse fieldsets select only the requested columns
+    """
+    with count_queries() as queries:
+        response = client.get('/api/director?limit=5&fields=id,name')
+    data = json.loads(response.get_data())
+
+    assert response.status_code == 200
+    assert all(set(d) == {'id', 'name'} for d in data)
+    # the catalog revision of the ETag and the directors
+    assert len(queries) == 2
+    assert 'gender' not in queries[1]
+
+
+def test_director_read_all_nested_fields():
+    """
+    test choosing the fields of the nested movies
+    """
+    with count_queries() as queries:
+        response = client.get(
+            '/api/director?limit=5&fields=name,movies.title&order_by=name')
+    data = json.loads(response.get_data())
+
+    assert response.status_code == 200
+    assert all(set(d) == {'name', 'movies'} for d in data)
+    assert all(
+        set(m) == {'title'} for d in data for m in d['movies'])
+    assert 'overview' not in queries[1]
+
+
+def test_movie_read_all_include_none():
+    """
+    test leaving the director out of movies
+    """
+    with count_queries() as queries:
+        response = client.get('/api/movie?limit=5&include=none')
+    data = json.loads(response.get_data())
+
+    assert response.status_code == 200
+    assert all('directors' not in m and 'title' in m for m in data)
+    assert 'directors' not in queries[0]
+
+
+def test_read_all_unknown_fieldset():
+    """
+    test unknown fields and include values
+    """
+    assert client.get('/api/movie?fields=id,nope').status_code == 400
+    assert client.get('/api/director?fields=movies.nope').status_code == 400
+    assert client.get('/api/director?include=directors').status_code == 400
+
+
+def test_serializers_match_marshmallow():
+    """
+    test compiled serializers dump every row like the marshmallow schemas
+    """
+    variants = [{}, {
+        'exclude': ('movies', )
+    }, {
+        'only': ('id', 'name', 'movies.title', 'movies.vote_average')
+    }]
+    with connex_app.app_context():
+        directors = Directors.query.all()
+        for options in variants:
+            expected = DirectorsSchema(many=True, **options).dump(directors)
+            dump = serializer(DirectorsSchema, many=True, **options)
+            assert dump(directors) == expected
+
+        movies = Movies.query.all()
+        for options in [{}, {'only': ('id', 'title', 'directors.name')}]:
+            expected = MoviesSchema(many=True, **options).dump(movies)
+            dump = serializer(MoviesSchema, many=True, **options)
+            assert dump(movies) == expected
+
+
+def test_director_stats():
+    """
+    test the totals of one director match its movies
+    """
+    director_id = 4762
+    movies = json.loads(
+        client.get(f'/api/director/{director_id}').get_data())['movies']
+
+    response = client.get(f'/api/director/{director_id}/stats')
+    data = json.loads(response.get_data())
+
+    assert response.status_code == 200
+    assert data['movie_count'] == len(movies)
+    assert data['budget_total'] == sum(m['budget'] for m in movies)
+    assert data['revenue_total'] == sum(m['revenue'] for m in movies)
+    assert client.get('/api/director/1/stats').status_code == 404
+
+
+def test_stats_leaderboard_pages():
+    """
+    test the leaderboard is sorted, paginated and reads one query per page
+    """
+    url = '/api/stats/directors?sort=-movie_count&page_size=50'
+    with count_queries() as queries:
+        first = client.get(url)
+    second = client.get(f"{url}&cursor={first.headers['X-Next-Cursor']}")
+    directors = first.get_json() + second.get_json()
+
+    counts = [d['movie_count'] for d in directors]
+    assert len(queries) == 1
+    assert counts == sorted(counts, reverse=True)
+    assert len({d['director_id'] for d in directors}) == 100
+
+    response = client.get('/api/stats/directors?filter=movie_count>=10')
+    assert all(d['movie_count'] >= 10 for d in response.get_json())
+
+
+def test_stats_follow_movie_writes():
+    """
+    test the summary row of a director follows movie create and delete
+    """
+    director_id = 4768
+    url = f'/api/director/{director_id}/stats'
+    before = json.loads(client.get(url).get_data())
+
+    res = client.post(f'/api/movie/{director_id}/movie',
+                      data=json.dumps(dict(mock_data_movie, uid=445577)),
+                      headers=mock_request_headers)
+    movie_id = json.loads(res.get_data())['id']
+    page = json.loads(
+        client.get('/api/stats/directors?filter=director_id=4768').get_data())
+    client.delete(f'/api/director/{director_id}/movie/{movie_id}')
+    after = json.loads(
+        client.get('/api/stats/directors?filter=director_id=4768').get_data())
+
+    assert page[0]['movie_count'] == before['movie_count'] + 1
+    assert page[0]['budget_total'] == (before['budget_total'] +
+                                       mock_data_movie['budget'])
+    assert after[0] == before
+
+
+def test_stats_years():
+    """
+    test yearly totals cover every dated movie once
+    """
+    years = json.loads(client.get('/api/stats/years').get_data())
+
+    assert [y['year'] for y in years] == sorted(y['year'] for y in years)
+    with connex_app.app_context():
+        assert sum(y['movie_count'] for y in years) == Movies.query.count()
+
+
+def test_director_read_one_not_modified():
+    """
+    test a current ETag gets a 304 for one indexed lookup on a cache miss
+    """
+    url = '/api/director/4762'
+    response = client.get(url)
+    etag = response.headers['ETag']
+    with connex_app.app_context():
+        get_cache().clear()
+
+    with count_queries() as queries:
+        response = client.get(url, headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert response.headers['ETag'] == etag
+    assert len(queries) == 1
+    cached = client.get(url, headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+
+
+def test_director_read_one_if_modified_since():
+    """
+    test Last-Modified and If-Modified-Since
+    """
+    url = '/api/director/4762'
+    last_modified = client.get(url).headers['Last-Modified']
+
+    response = client.get(url, headers={'If-Modified-Since': last_modified})
+    older = client.get(url,
+                       headers={
+                           'If-Modified-Since':
+                           'Mon, 01 Jan 2001 00:00:00 GMT'
+                       })
+
+    assert response.status_code == 304
+    assert older.status_code == 200
+
+
+def test_movie_read_all_etag_follows_writes():
+    """
+    test the movie list ETag changes with any write to the catalog
+    """
+    url = '/api/movie?limit=5'
+    etag = client.get(url).headers['ETag']
+    assert client.get(url, headers={
+        'If-None-Match': etag
+    }).status_code == 304
+    assert client.get('/api/movie?limit=6', headers={
+        'If-None-Match': etag
+    }).status_code == 200
+
+    director_id = 4768
+    res = client.post(f'/api/movie/{director_id}/movie',
+                      data=json.dumps(dict(mock_data_movie, uid=445588)),
+                      headers=mock_request_headers)
+    movie_id = json.loads(res.get_data())['id']
+    movie_url = f'/api/director/{director_id}/movie/{movie_id}'
+    movie_etag = client.get(movie_url).headers['ETag']
+    response = client.get(url, headers={'If-None-Match': etag})
+
+    director = json.loads(
+        client.get(f'/api/director?fields=name,gender,uid,department'
+                   f'&filter=id={director_id}').get_data())[0]
+    client.put(f'/api/director/{director_id}',
+               data=json.dumps(director),
+               headers=mock_request_headers)
+    renamed = client.get(movie_url, headers={'If-None-Match': movie_etag})
+    client.delete(movie_url)
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert renamed.status_code == 200
+
+
+@contextmanager
+def instrumented(**options):
+    """
+    turn instrumentation on inside the block
+    """
+    previous = dict(config.app.config)
+    config.app.config.update(INSTRUMENTATION=True, **options)
+    try:
+        yield
+    finally:
+        config.app.config.update(previous)
+
+
+def test_instrumentation_off_by_default():
+    """
+    test no Server-Timing header and no /metrics without INSTRUMENTATION
+    """
+    response = client.get('/api/director?limit=3')
+
+    assert 'Server-Timing' not in response.headers
+    assert client.get('/metrics').status_code == 404
+
+
+def test_instrumentation_metrics():
+    """
+    test Server-Timing header and Prometheus metrics per endpoint
+    """
+    with instrumented():
+        response = client.get('/api/director?limit=3')
+        text = client.get('/metrics').get_data(as_text=True)
+
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('sql;dur=')
+    assert 'serialize;dur=' in timing and 'total;dur=' in timing
+    assert ('api_requests_total{endpoint="/api/director",method="GET",'
+            'status="200"}') in text
+    assert ('api_request_duration_seconds_count{endpoint="/api/director",'
+            'method="GET"}') in text
+    assert 'api_sql_queries_total{endpoint="/api/director"' in text
+
+
+def test_instrumentation_n_plus_one():
+    """
+    test statements repeated over the threshold are counted
+    """
+    with instrumented(N_PLUS_ONE_THRESHOLD=0):
+        client.get('/api/director/4768')
+        text = client.get('/metrics').get_data(as_text=True)
+
+    line = [
+        line for line in text.splitlines() if line.startswith(
+            'api_n_plus_one_total{endpoint="/api/director/<int:director_id>"')
+    ][0]
+    assert int(line.split()[-1]) >= 1
+
+
+def test_instrumentation_profile():
+    """
+    test ?profile=1 answers with the cProfile report
+    """
+    with instrumented():
+        response = client.get('/api/director?limit=3&profile=1')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert 'cumulative' in response.get_data(as_text=True)
+
+
+def test_compact_json():
+    """
+    test responses are not indented and keep the serializer key order
+    """
+    body = client.get('/api/director?limit=2').get_data(as_text=True)
+
+    assert '\n ' not in body and ', ' not in body.split('"overview"')[0]
+    assert list(json.loads(body)[0]) == list(
+        serializer(DirectorsSchema)(Directors.query.first()))
+
+
+def test_gzip_compression():
+    """
+    test large responses are gzipped for clients accepting it
+    """
+    url = '/api/director?limit=50'
+    plain = client.get(url)
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    small = client.get('/api/director?limit=1&fields=name',
+                       headers={'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+    assert response.headers['ETag'] == 'W/' + plain.headers['ETag']
+    assert 'Content-Encoding' not in small.headers
+    assert client.get(url, headers={
+        'Accept-Encoding': 'gzip',
+        'If-None-Match': response.headers['ETag']
+    }).status_code == 304
+
+
+def test_delete_director_statements_do_not_grow_with_movies():
+    """
+    test deleting a director sends as many statements with 1 or 20 movies
+    and never loads the movies, only their ids for the rankings
+    """
+    uid = random.randint(1000000, 9000000)
+    statements = []
+    for count in (1, 20):
+        res = client.post('/api/director',
+                          data=json.dumps(dict(mock_data_director,
+                                               uid=uid + count)),
+                          headers=mock_request_headers)
+        director_id = json.loads(res.get_data())['id']
+        res = client.post('/api/movie/bulk',
+                          data=json.dumps([
+                              dict(mock_data_movie,
+                                   uid=uid + count * 100 + i,
+                                   director_id=director_id)
+                              for i in range(count)
+                          ]),
+                          headers=mock_request_headers)
+        movie_id = json.loads(res.get_data())[0]['id']
+        client.get(f'/api/director/{director_id}')
+
+        sent = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            sent.append(statement)
+
+        event.listen(config.db.engine, 'before_cursor_execute',
+                     before_cursor_execute)
+        try:
+            res = client.delete(f'/api/director/{director_id}')
+        finally:
+            event.remove(config.db.engine, 'before_cursor_execute',
+                         before_cursor_execute)
+        statements.append(len(sent))
+        assert not [
+            statement for statement in sent
+            if statement.lstrip().startswith('SELECT')
+            and 'FROM movies' in statement and 'movies.title' in statement
+        ]
+
+        assert res.status_code == 200
+        assert client.get(f'/api/director/{director_id}').status_code == 404
+        assert client.get(f'/api/director/{director_id}/movie/{movie_id}'
+                          ).status_code == 404
+        assert client.delete(
+            f'/api/director/{director_id}').status_code == 404
+
+    assert statements[0] == statements[1]
+
+
+def test_director_patch_and_upsert():
+    """
+    test patching a director sets only the fields sent, and putting by uid
+    creates then updates it
+    """
+    uid = random.randint(1000000, 9000000)
+    url = f'/api/director/uid/{uid}'
+    res = client.put(url,
+                     data=json.dumps(mock_data_director),
+                     headers=mock_request_headers)
+    created = json.loads(res.get_data())
+    assert res.status_code == 201
+    assert created['uid'] == uid
+
+    res = client.put(url,
+                     data=json.dumps(dict(mock_data_director, gender=1)),
+                     headers=mock_request_headers)
+    updated = json.loads(res.get_data())
+    assert res.status_code == 200
+    assert updated['id'] == created['id']
+    assert updated['gender'] == 1
+
+    url = f"/api/director/{created['id']}"
+    res = client.patch(url,
+                       data=json.dumps({'department': 'Writing'}),
+                       headers=mock_request_headers)
+    patched = json.loads(res.get_data())
+    assert res.status_code == 200
+    assert patched['department'] == 'Writing'
+    assert patched['name'] == mock_data_director['name']
+    assert patched['gender'] == 1
+    assert json.loads(client.get(url).get_data())['department'] == 'Writing'
+
+    assert client.patch(url, data=json.dumps({}),
+                        headers=mock_request_headers).status_code == 400
+    assert client.patch('/api/director/0',
+                        data=json.dumps({'gender': 1}),
+                        headers=mock_request_headers).status_code == 404
+    assert client.delete(url).status_code == 200
+
+
+def test_movie_patch_and_upsert():
+    """
+    test patching a movie sets only the fields sent, and putting by uid
+    creates, updates, and refuses a uid of another director
+    """
+    director_id = 4768
+    uid = random.randint(1000000, 9000000)
+    url = f'/api/director/{director_id}/movie/uid/{uid}'
+    res = client.put(url,
+                     data=json.dumps(mock_data_movie),
+                     headers=mock_request_headers)
+    created = json.loads(res.get_data())
+    assert res.status_code == 201
+    assert created['director_id'] == director_id
+
+    res = client.put(url,
+                     data=json.dumps(dict(mock_data_movie, budget=7)),
+                     headers=mock_request_headers)
+    assert res.status_code == 200
+    assert json.loads(res.get_data())['id'] == created['id']
+
+    res = client.put(f'/api/director/5000/movie/uid/{uid}',
+                     data=json.dumps(mock_data_movie),
+                     headers=mock_request_headers)
+    assert res.status_code == 409
+
+    url = f"/api/director/{director_id}/movie/{created['id']}"
+    res = client.patch(url,
+                       data=json.dumps({'tagline': 'patched'}),
+                       headers=mock_request_headers)
+    patched = json.loads(res.get_data())
+    assert res.status_code == 200
+    assert patched['tagline'] == 'patched'
+    assert patched['budget'] == 7
+    assert patched['title'] == mock_data_movie['title']
+
+    res = client.post(f'/api/movie/{director_id}/movie',
+                      data=json.dumps(dict(mock_data_movie, uid=uid)),
+                      headers=mock_request_headers)
+    assert res.status_code == 409
+    assert client.delete(url).status_code == 200
+
+
+def test_movie_top_matches_sort():
+    """
+    test the top movies come in the order of the matching sort
+    """
+    # catch up with the writes of the other tests
+    with config.app.app_context():
+        get_rankings().refresh()
+    for by in ('popularity', 'vote_average'):
+        top = client.get(f'/api/movie/top?by={by}&limit=200&fields=id')
+        assert top.status_code == 200
+        assert top.get_json() == client.get(
+            f'/api/movie?sort=-{by}&limit=200&fields=id').get_json()
+        top = client.get(
+            f'/api/director/4799/movie/top?by={by}&limit=100&fields=id')
+        assert top.get_json() == client.get(
+            f'/api/movie?sort=-{by}&filter=director_id=4799&limit=100'
+            '&fields=id').get_json()
+    assert client.get('/api/director/0/movie/top').status_code == 404
+
+
+def test_movie_top_follows_writes():
+    """
+    test the top movies follow the writes without reading the catalog
+    again
+    """
+    director_id = 4768
+    # catch up with the writes of the other tests
+    with config.app.app_context():
+        get_rankings().refresh()
+    res = client.post(f'/api/movie/{director_id}/movie',
+                      data=json.dumps(dict(mock_data_movie,
+                                           uid=random.randint(
+                                               1000000, 9000000),
+                                           popularity=100000)),
+                      headers=mock_request_headers)
+    movie_id = json.loads(res.get_data())['id']
+    url = f'/api/director/{director_id}/movie/{movie_id}'
+
+    with count_queries() as statements:
+        top = client.get('/api/movie/top?limit=3').get_json()
+    assert top[0]['id'] == movie_id
+    # the movies by id, without the catalog revision or the rankings
+    assert len(statements) == 1
+    assert client.get(f'/api/director/{director_id}/movie/top?limit=1'
+                      ).get_json()[0]['id'] == movie_id
+
+    client.patch(url,
+                 data=json.dumps({'popularity': 0}),
+                 headers=mock_request_headers)
+    top = client.get('/api/movie/top?limit=10&fields=id').get_json()
+    assert {'id': movie_id} not in top
+
+    client.delete(url)
+    top = client.get(
+        f'/api/director/{director_id}/movie/top?limit=1000&fields=id')
+    assert {'id': movie_id} not in top.get_json()
+
+
+def test_movie_top_follows_director_delete():
+    """
+    test deleting a director drops its movies from the top movies at once
+    """
+    with config.app.app_context():
+        get_rankings().refresh()
+    res = client.post('/api/director',
+                      data=json.dumps(dict(mock_data_director,
+                                           uid=random.randint(
+                                               1000000, 9000000))),
+                      headers=mock_request_headers)
+    director_id = res.get_json()['id']
+    res = client.post(f'/api/movie/{director_id}/movie',
+                      data=json.dumps(dict(mock_data_movie,
+                                           uid=random.randint(
+                                               1000000, 9000000),
+                                           popularity=100000)),
+                      headers=mock_request_headers)
+    movie_id = res.get_json()['id']
+    assert client.get('/api/movie/top?limit=1&fields=id').get_json() == [{
+        'id': movie_id
+    }]
+
+    assert client.delete(f'/api/director/{director_id}').status_code == 200
+    top = client.get('/api/movie/top?limit=10&fields=id').get_json()
+    assert top == client.get(
+        '/api/movie?sort=-popularity&limit=10&fields=id').get_json()
+
+
+def test_movie_top_refresh():
+    """
+    test the top movies keep their ranking until the refresh notices a
+    write they did not see
+    """
+    with config.app.app_context():
+        rankings = get_rankings()
+        rankings.refresh()
+        current = rankings.current
+        assert rankings.refresh() is False
+
+        bump_revision(config.db.session)
+        config.db.session.commit()
+        client.get('/api/movie/top?limit=1')
+        assert rankings.current is current
+
+        assert rankings.refresh() is True
+        assert rankings.current.revision == current.revision + 1
+
+
+def test_update_uid_conflict():
+    """
+    test putting or patching the uid of another movie or director is a 409
+    """
+    director_id = 4768
+    movies = client.get(f'/api/movie?filter=director_id={director_id}'
+                        '&limit=2&fields=id,uid').get_json()
+    taken = client.get('/api/movie?sort=-id&limit=1&fields=uid').get_json()
+    url = f"/api/director/{director_id}/movie/{movies[0]['id']}"
+    res = client.put(url,
+                     data=json.dumps(dict(mock_data_movie,
+                                          uid=taken[0]['uid'])),
+                     headers=mock_request_headers)
+    assert res.status_code == 409
+    res = client.patch(url,
+                       data=json.dumps({'uid': taken[0]['uid']}),
+                       headers=mock_request_headers)
+    assert res.status_code == 409
+    assert client.get(url).get_json()['uid'] == movies[0]['uid']
+
+    directors = client.get('/api/director?limit=2&fields=id,uid').get_json()
+    res = client.patch(f"/api/director/{directors[0]['id']}",
+                       data=json.dumps({'uid': directors[1]['uid']}),
+                       headers=mock_request_headers)
+    assert res.status_code == 409
+
+
+def test_create_movie_without_uid():
+    """
+    test a movie without a uid is created and read back by its id
+    """
+    res = client.post('/api/movie/4768/movie',
+                      data=json.dumps({'title': 'No Uid'}),
+                      headers=mock_request_headers)
+    assert res.status_code == 201
+    movie = res.get_json()
+    assert movie['title'] == 'No Uid' and movie['uid'] is None
+    url = f"/api/director/4768/movie/{movie['id']}"
+    assert client.get(url).get_json()['title'] == 'No Uid'
+    assert client.delete(url).status_code == 200
+
+
+def test_invalid_body_is_400():
+    """
+    test a body missing required fields is a 400 on create and update
+    """
+    body = json.dumps({'name': 'n', 'gender': 1})
+    assert client.put('/api/director/4762', data=body,
+                      headers=mock_request_headers).status_code == 400
+    assert client.post('/api/director', data=body,
+                       headers=mock_request_headers).status_code == 400
+    movie = client.get('/api/movie?filter=director_id=4768&limit=1'
+                       '&fields=id').get_json()[0]
+    body = json.dumps({'title': 'x', 'nope': 1})
+    assert client.put(f"/api/director/4768/movie/{movie['id']}", data=body,
+                      headers=mock_request_headers).status_code == 400
+    assert client.post('/api/movie/4768/movie', data=body,
+                       headers=mock_request_headers).status_code == 400
@@ -0,0 +1,78 @@
+import sqlite3
+from click.testing import CliRunner
+from sqlalchemy import create_engine
+from catalog import cli
+from config import db
+
+runner = CliRunner()
+
+
+def test_export_import_round_trip(tmp_path):
+    """
+    test exporting the catalog and loading it into an empty database
+    """
+    database = tmp_path / 'copy.db'
+    url = f'sqlite:///{database}'
+    db.metadata.create_all(create_engine(url))
+
+    for table, extension in [('directors', 'csv'), ('movies', 'jsonl')]:
+        path = str(tmp_path / f'{table}.{extension}')
+        result = runner.invoke(cli, ['export', table, path])
+        assert result.exit_code == 0, result.output
+
+        result = runner.invoke(
+            cli, ['import', '--database', url, '--chunk-size', '1000', table,
+                  path])
+        assert result.exit_code == 0, result.output
+
+    source = sqlite3.connect(db.engine.url.database)
+    copy = sqlite3.connect(database)
+    for table in ['directors', 'movies', 'director_stats']:
+        count = f'select count(*) from {table}'
+        assert copy.execute(count).fetchone() == source.execute(
+            count).fetchone()
+    assert copy.execute(
+        'select title, vote_average, director_id from movies where id = 43597'
+    ).fetchone() == ('Avatar', 7.2, 4762)
+
+
+def test_import_unknown_format(tmp_path):
+    """
+    test importing a file without a known extension
+    """
+    path = tmp_path / 'movies.txt'
+    path.write_text('')
+
+    result = runner.invoke(cli, ['import', 'movies', str(path)])
+
+    assert result.exit_code == 2
+    assert 'use --format' in result.output
+
+
+def test_generate_is_seeded(tmp_path):
+    """
+    test the synthetic catalog depends only on its seed
+    """
+    urls = [f'sqlite:///{tmp_path}/{name}.db' for name in ('a', 'b')]
+    for url, chunk_size in zip(urls, ['100', '1000']):
+        result = runner.invoke(cli, [
+            'generate', '--movies', '500', '--seed', '7', '--chunk-size',
+            chunk_size, url
+        ])
+        assert result.exit_code == 0, result.output
+
+    a, b = (sqlite3.connect(url[len('sqlite:///'):]) for url in urls)
+    rows = 'select id, title, popularity, director_id from movies order by id'
+    assert a.execute(rows).fetchall() == b.execute(rows).fetchall()
+    assert a.execute('select count(*) from movies').fetchone() == (500, )
+    total, busiest = a.execute('select sum(movie_count), max(movie_count) '
+                               'from director_stats').fetchone()
+    assert total == 500 and busiest > 1
+    assert a.execute('select count(*) from alembic_version').fetchone() == (
+        1, )
+    # the search index is built with the catalog
+    assert a.execute('select count(*) from movies_fts').fetchone() == (500, )
+
+    result = runner.invoke(cli, ['generate', '--movies', '10', urls[0]])
+    assert result.exit_code == 2
+    assert 'already holds directors' in result.output
@@ -0,0 +1,88 @@
+import json
+import random
+import pytest
+from sqlalchemy.exc import OperationalError
+import config
+from app import connex_app
+from cache import director_key, get_cache, movie_key
+from replicas import dispose_engines, get_replica_engine, snapshot
+
+client = connex_app.test_client()
+
+mock_request_headers = {'Content-Type': 'application/json'}
+
+
+@pytest.fixture
+def replica(tmp_path):
+    path = str(tmp_path / 'replica.db')
+    with config.app.app_context():
+        snapshot(path)
+    config.app.config.update(READ_REPLICA_URL='sqlite:///' + path,
+                             READ_REPLICA_IMMUTABLE=True)
+    try:
+        yield path
+    finally:
+        dispose_engines(config.app)
+        config.app.config['READ_REPLICA_URL'] = ''
+
+
+def test_reads_go_to_replica(replica):
+    """
+    test reads come from the snapshot, writes and strong reads from the
+    primary
+    """
+    uid = random.randint(1000000, 9000000)
+    res = client.post('/api/director',
+                      data=json.dumps({
+                          'name': 'Replica Lag',
+                          'gender': 1,
+                          'uid': uid,
+                          'department': 'Directing'
+                      }),
+                      headers=mock_request_headers)
+    assert res.status_code == 201
+    director_id = json.loads(res.get_data())['id']
+    url = f'/api/director/{director_id}'
+
+    assert client.get(url).status_code == 404
+    assert client.get('/api/director/search?name=Replica%20Lag').get_json(
+    ) == []
+    res = client.get(url, headers={'X-Read-Consistency': 'strong'})
+    assert res.status_code == 200
+    assert res.get_json()['uid'] == uid
+
+    assert client.delete(url).status_code == 200
+
+
+def test_replica_reads_are_not_cached(replica):
+    """
+    test read_one keeps only the rows of the primary in the cache
+    """
+    with config.app.app_context():
+        get_cache().clear()
+    assert client.get('/api/director/4768').status_code == 200
+    movie = client.get('/api/movie?filter=director_id=4768&limit=1'
+                       '&fields=id').get_json()[0]
+    assert client.get(f"/api/director/4768/movie/{movie['id']}"
+                      ).status_code == 200
+    with config.app.app_context():
+        cache = get_cache()
+        assert cache.get(director_key(4768)) is None
+        assert cache.get(movie_key(4768, movie['id'])) is None
+
+    client.get('/api/director/4768',
+               headers={'X-Read-Consistency': 'strong'})
+    with config.app.app_context():
+        assert get_cache().get(director_key(4768)) is not None
+
+
+def test_replica_is_read_only(replica):
+    """
+    test the replica connections cannot write
+    """
+    with config.app.app_context():
+        with get_replica_engine().connect() as connection:
+            assert connection.exec_driver_sql(
+                'SELECT count(*) FROM directors').scalar() > 0
+            with pytest.raises(OperationalError):
+                connection.exec_driver_sql('DELETE FROM directors')
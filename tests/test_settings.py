@@ -0,0 +1,46 @@
+import pytest
+from settings import engine_options, load_settings
+
+
+def test_profile_overrides():
+    """
+    test environment variables override single profile settings
+    """
+    settings = load_settings(environ={
+        'APP_ENV': 'prod',
+        'DATABASE_URL': 'postgres://user:secret@db/movies',
+        'DB_POOL_SIZE': '20',
+        'SQL_ECHO': 'true',
+    })
+    assert settings['APP_ENV'] == 'prod'
+    assert settings['DATABASE_URL'] == 'postgresql://user:secret@db/movies'
+    assert settings['SQL_ECHO'] is True
+    assert engine_options(settings)['pool_size'] == 20
+    assert engine_options(settings)['pool_pre_ping'] is True
+
+
+def test_sqlite_profile():
+    """
+    test SQLite gets no pool options and echo is off outside dev
+    """
+    settings = load_settings('test', environ={})
+    assert settings['DATABASE_URL'].startswith('sqlite:///')
+    assert settings['SQL_ECHO'] is False
+    assert engine_options(settings) == {}
+
+
+def test_default_profile():
+    """
+    test the prod profile is used without APP_ENV
+    """
+    settings = load_settings(environ={})
+    assert settings['APP_ENV'] == 'prod'
+    assert settings['SQL_ECHO'] is False
+
+
+def test_unknown_profile():
+    """
+    test an unknown APP_ENV is refused
+    """
+    with pytest.raises(ValueError):
+        load_settings(environ={'APP_ENV': 'staging'})
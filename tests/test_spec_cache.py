@@ -0,0 +1,36 @@
+import os
+import pytest
+import yaml
+from connexion.exceptions import InvalidSpecification
+from config import basedir
+from spec_cache import cache_path, load_spec
+
+SWAGGER = os.path.join(basedir, 'swagger.yml')
+
+
+def test_load_spec_caches_the_validated_spec(tmp_path):
+    """
+    test the first load validates and writes the cache, the second reads it
+    """
+    spec, hit = load_spec(SWAGGER, str(tmp_path))
+    cached, cached_hit = load_spec(SWAGGER, str(tmp_path))
+
+    assert hit is False and cached_hit is True
+    assert os.path.exists(cache_path(SWAGGER, str(tmp_path)))
+    assert cached == spec
+    with open(SWAGGER) as source:
+        raw = yaml.safe_load(source)
+    assert spec['paths'].keys() == raw['paths'].keys()
+    assert 'nullable' not in str(cached)
+
+
+def test_load_spec_invalid(tmp_path):
+    """
+    test an invalid spec raises and is not cached
+    """
+    path = tmp_path / 'broken.yml'
+    path.write_text('swagger: "2.0"\ninfo: {}\npaths: {}\n')
+
+    with pytest.raises(InvalidSpecification):
+        load_spec(str(path), str(tmp_path / 'cache'))
+    assert not os.path.exists(cache_path(str(path), str(tmp_path / 'cache')))
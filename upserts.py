@@ -0,0 +1,157 @@
+"""Single statement writes returning the stored row
+
+INSERT ... ON CONFLICT (uid) and UPDATE ... WHERE write a row without
+loading it first, and only the columns given are set. On PostgreSQL the
+row comes back through RETURNING, in the same round trip. SQLAlchemy
+1.4 cannot render RETURNING for SQLite, so there the row is read back
+by its key in the same transaction, which costs no network round trip
+on an in-process database.
+
+Every write bumps the version of the row and sets its updated_at, as
+versions.touch does.
+"""
+from datetime import datetime
+from flask import abort
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from config import db
+
+INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def _dialect():
+    return db.engine.dialect
+
+
+def _execute_returning(statement, table, key):
+    """Run a write and return the row it wrote, None when it wrote none
+
+    Args:
+        statement (Insert or Update): write of at most one row
+        table (Table): table written
+        key (ColumnElement): condition finding the row again
+
+    Returns:
+        Row: stored row, with every column of the table
+    """
+    if getattr(_dialect(), 'full_returning', False):
+        return db.session.execute(statement.returning(*table.c)).first()
+    if db.session.execute(statement).rowcount == 0:
+        return None
+    return db.session.execute(select(*table.c).where(key)).first()
+
+
+def _insert(table):
+    insert = INSERTS.get(_dialect().name)
+    if insert is None:
+        abort(501, f"Upserts are not supported on {_dialect().name}")
+    return insert(table)
+
+
+def insert_new(model, values, key='uid'):
+    """INSERT a row unless its key is taken
+
+    Args:
+        model (Model): model of the table
+        values (dict): columns of the new row
+        key (string, optional): unique column. Defaults to 'uid'.
+
+    Returns:
+        Row: new row, None when the key is taken
+    """
+    table = model.__table__
+    if values.get(key) is None:
+        # nothing to conflict on, the row is found again by its new id
+        statement = table.insert().values(values)
+        if getattr(_dialect(), 'full_returning', False):
+            return db.session.execute(
+                statement.returning(*table.c)).first()
+        new_id, = db.session.execute(statement).inserted_primary_key
+        return db.session.execute(
+            select(*table.c).where(table.c.id == new_id)).first()
+    statement = _insert(table).values(
+        values).on_conflict_do_nothing(index_elements=[key])
+    return _execute_returning(statement, table,
+                              table.c[key] == values[key])
+
+
+def upsert(model, values, key='uid', where=None):
+    """INSERT a row, or UPDATE the given columns of the row with its key
+
+    Args:
+        model (Model): model of the table
+        values (dict): columns of the row, with the key
+        key (string, optional): unique column. Defaults to 'uid'.
+        where (ColumnElement, optional): condition the existing row must meet to be updated. Defaults to None.
+
+    Returns:
+        tuple: stored row, None when the existing row does not meet
+            where, and True when the row was inserted
+    """
+    table = model.__table__
+    now = datetime.utcnow()
+    statement = _insert(table).values(dict(values, updated_at=now))
+    statement = statement.on_conflict_do_update(
+        index_elements=[key],
+        set_=dict({
+            name: statement.excluded[name]
+            for name in values if name != key
+        },
+                  version=table.c.version + 1,
+                  updated_at=now),
+        where=where)
+    row = _execute_returning(statement, table, table.c[key] == values[key])
+    # a new row keeps the default version
+    return row, row is not None and row.version == 1
+
+
+def update_columns(model, values, *where):
+    """UPDATE only the given columns of the row matching where
+
+    Args:
+        model (Model): model of the table
+        values (dict): columns to set
+        where (ColumnElement): conditions selecting a single row
+
+    Returns:
+        Row: stored row, None when no row matches
+
+    Raises:
+        HTTPException: 409 when the uid belongs to another row
+    """
+    table = model.__table__
+    statement = table.update().where(*where).values(
+        dict(values, version=table.c.version + 1,
+             updated_at=datetime.utcnow()))
+    try:
+        return _execute_returning(statement, table, db.and_(*where))
+    except IntegrityError:
+        db.session.rollback()
+        abort(409,
+              f"{model.__name__} uid {values.get('uid')} exists already")
+
+
+def load_values(schema_class, data, partial=False):
+    """Validate a body and keep the columns it sets
+
+    Args:
+        schema_class (type): schema of the model, see models
+        data (dict): body sent by the client
+        partial (bool, optional): allow missing required fields. Defaults to False.
+
+    Returns:
+        dict: values by column name, without the id
+
+    Raises:
+        ValidationError: the body does not match the schema
+    """
+    values = schema_class(load_instance=False).load(data, partial=partial)
+    columns = schema_class.Meta.model.__table__.c
+    return {
+        name: value
+        for name, value in values.items() if name in columns and name != 'id'
+    }
@@ -0,0 +1,166 @@
+import functools
+import hashlib
+from datetime import datetime, timezone
+from flask import Response, request
+from werkzeug.http import http_date, parse_date
+from config import db
+from models import CatalogRevision, Directors, Movies
+from streaming import wants_stream
+from bulk import chunked
+
+REVISION_ID = 1
+
+
+def touch(director_ids=(), movie_ids=()):
+    """Bump the versions a write makes stale, before its commit
+
+    A director is dumped with its movies and a movie with its director,
+    so the director of every written movie is bumped too. The catalog
+    revision, which versions the lists, is bumped by every write.
+
+    Args:
+        director_ids (iterable, optional): directors written or whose movies were written. Defaults to ().
+        movie_ids (iterable, optional): movies written. Defaults to ().
+    """
+    db.session.flush()
+    now = datetime.utcnow()
+    for model, ids in [(Directors, director_ids), (Movies, movie_ids)]:
+        table = model.__table__
+        for chunk in chunked(set(ids)):
+            db.session.execute(table.update().where(
+                table.c.id.in_(chunk)).values(version=table.c.version + 1,
+                                              updated_at=now))
+
+    bump_revision(db.session, now)
+
+
+def bump_revision(connection, now=None):
+    """Count a write to the catalog, making every list stale
+
+    Args:
+        connection (Connection): connection or session of the write
+        now (datetime, optional): naive UTC time of the write. Defaults to now.
+    """
+    now = now or datetime.utcnow()
+    table = CatalogRevision.__table__
+    updated = connection.execute(table.update().where(
+        table.c.id == REVISION_ID).values(revision=table.c.revision + 1,
+                                          updated_at=now))
+    if updated.rowcount == 0:
+        connection.execute(table.insert().values(id=REVISION_ID,
+                                                 revision=1,
+                                                 updated_at=now))
+
+
+def catalog_revision():
+    """Revision and time of the last write to the catalog
+
+    Returns:
+        tuple: revision number and updated_at, (0, None) before any write
+    """
+    row = db.session.query(CatalogRevision.revision,
+                           CatalogRevision.updated_at).filter(
+                               CatalogRevision.id == REVISION_ID).one_or_none()
+    return tuple(row) if row is not None else (0, None)
+
+
+def make_etag(*parts):
+    """Strong ETag of a representation identified by parts
+
+    Args:
+        parts: versions and anything else the representation depends on
+
+    Returns:
+        string: quoted ETag
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12)
+    return f'"{digest.hexdigest()}"'
+
+
+def validators(etag, last_modified=None):
+    """ETag and Last-Modified headers of a representation
+
+    Args:
+        etag (string): quoted ETag, see make_etag
+        last_modified (datetime, optional): naive UTC time of the last change. Defaults to None.
+
+    Returns:
+        dict: response headers
+    """
+    headers = {'ETag': etag}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(
+            last_modified.replace(tzinfo=timezone.utc))
+    return headers
+
+
+def not_modified(headers):
+    """Check the conditional headers of the request
+
+    If-None-Match wins over If-Modified-Since, as RFC 7232 asks.
+
+    Args:
+        headers (dict): current validators, see validators
+
+    Returns:
+        bool: True when the client copy is still current
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(headers['ETag'].strip('"'))
+    since = request.if_modified_since
+    if since is None or 'Last-Modified' not in headers:
+        return False
+    last_modified = parse_date(headers['Last-Modified'])
+    return last_modified.replace(tzinfo=None) <= since.replace(tzinfo=None)
+
+
+def conditional(headers, build):
+    """Answer 304 when the client copy is current, else build the response
+
+    Args:
+        headers (dict): current validators, see validators
+        build (function): function returning the body, a (body, status,
+            headers) tuple or a Response
+
+    Returns:
+        Response or tuple: 304 response, or the built response with the
+            validators added to its headers
+    """
+    if not_modified(headers):
+        return Response(status=304, headers=headers)
+
+    result = build()
+    if isinstance(result, Response):
+        result.headers.extend(headers)
+        return result
+    if isinstance(result, tuple):
+        body, status, extra = result
+        return body, status, dict(extra, **headers)
+    return result, 200, headers
+
+
+def list_validators(name):
+    """Decorate a list handler with validators from the catalog revision
+
+    Any write changes the revision, so a list stays current as long as
+    the revision does. Checking it costs one primary key lookup.
+
+    Args:
+        name (string): name of the list, part of the ETag
+
+    Returns:
+        function: decorator
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            revision, updated_at = catalog_revision()
+            headers = validators(
+                make_etag(name, revision, request.query_string,
+                          wants_stream()), updated_at)
+            return conditional(headers, lambda: function(*args, **kwargs))
+
+        return wrapper
+
+    return decorator